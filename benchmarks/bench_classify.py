@@ -0,0 +1,68 @@
+"""Benchmark of query classification: extract_valid_query before and after compiling.
+
+Run with ``python benchmarks/bench_classify.py [--lines N] [--processes P]``.
+"""
+
+import argparse
+import itertools
+import re
+import time
+
+from pyscihub import tools
+
+LINES = [
+    "Lourenço, H. R., Martin, O. C., & Stützle, T. (2010). Iterated Local Search: Framework and Applications. International Series in Operations Research & Management Science, 363–397. doi:10.1007/978-1-4419-1665-5_12",
+    "https://www.sciencedirect.com/science/article/abs/pii/S0305054816302489",
+    "Forbes, H., et al., The Effects of Group Membership on College Students' Social Exclusion of Peers and Bystander Behavior. Journal of Psychology, 2020. 154(1): p. 15-37.",
+    "Fornes, P. and D. Lecomte, Pathology of sport-related sudden death. [French]. Revue du Praticien, 2001. 51(SPEC.ISS): p. 31-35.",
+    "Iterated local search: Framework and applications",
+]
+
+
+def extract_valid_query_uncompiled(string: str) -> str | None:
+    """extract_valid_query as it was before the QueryClassifier."""
+    REF_REGEX = tools.ref_regex_simple()
+
+    if (mo := re.search(tools.DOI_REGEX, string)) is not None:
+        return mo.group()
+    elif (mo := re.search(tools.URL_REGEX, string)) is not None:
+        return mo.group()
+    elif (mo := re.search(REF_REGEX, string)) is not None:
+        return mo.group("title")
+    else:
+        return None
+
+
+def timed(func, n_lines: int) -> float:
+    lines = itertools.islice(itertools.cycle(LINES), n_lines)
+    start = time.perf_counter()
+    for _ in func(lines):
+        pass
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", type=int, default=200_000)
+    parser.add_argument("--processes", type=int, default=4)
+    args = parser.parse_args()
+
+    classifier = tools.QueryClassifier()
+    runs = {
+        "uncompiled": lambda lines: map(extract_valid_query_uncompiled, lines),
+        "classify_many": classifier.classify_many,
+        f"classify_many ({args.processes} processes)": lambda lines: (
+            classifier.classify_many(lines, processes=args.processes)
+        ),
+    }
+
+    baseline = None
+    print(f"{'implementation':<32}{'lines/s':>12}{'speedup':>10}")
+    for name, func in runs.items():
+        seconds = timed(func, args.lines)
+        baseline = baseline or seconds
+        print(f"{name:<32}{args.lines / seconds:>12.0f}{baseline / seconds:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""End-to-end throughput benchmark of SciHub.download against a local fake Sci-Hub.
+
+Every combination of batch size and concurrency is downloaded in a fresh process,
+so peak RSS is measured per run. Results are printed and written as JSON; pass a
+previous JSON file as ``--baseline`` to fail on throughput regressions.
+
+Run with ``python benchmarks/bench_download.py [--help]``.
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from tests.fake_scihub import FakeSciHub  # noqa: E402
+
+
+def run_download(url: str, batch_size: int, concurrency: int) -> dict:
+    """Download ``batch_size`` queries from ``url`` and measure the run."""
+    from pyscihub import SciHub, Transport
+    from pyscihub.ratelimit import RateLimiter
+
+    # keep the progress bar and log messages out of the report
+    logging.disable(logging.CRITICAL)
+    sys.stdout = open(os.devnull, "w")
+    latencies = []
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output = Path(tmp_dir)
+        scihub = SciHub(
+            url,
+            output,
+            host_limit=concurrency,
+            transport=Transport(pool_maxsize=max(10, concurrency), retries=0),
+            rate_limiters={url: RateLimiter(rate=1e6, max_rate=1e6)},
+        )
+
+        # a query starts when it enters the first stage and ends when it is stored
+        started = {}
+        download_query = scihub._download_query
+        resolve_query = scihub._resolve_query
+        store_result = scihub._store_result
+
+        def timed_query(query):
+            started.setdefault(query, time.perf_counter())
+            return download_query(query)
+
+        def timed_resolve(query):
+            started.setdefault(query, time.perf_counter())
+            return resolve_query(query)
+
+        def timed_store(pdf_paths, result):
+            latencies.append(time.perf_counter() - started.pop(result["query"]))
+            return store_result(pdf_paths, result)
+
+        scihub._download_query = timed_query
+        scihub._resolve_query = timed_resolve
+        scihub._store_result = timed_store
+
+        queries = [f"10.5555/bench.{i}" for i in range(batch_size)]
+        start = time.perf_counter()
+        scihub.download(queries, concurrency=concurrency)
+        seconds = time.perf_counter() - start
+
+        pdfs = list(output.glob("*.pdf"))
+        bytes_written = sum(pdf.stat().st_size for pdf in pdfs)
+
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else []
+    return {
+        "queries": batch_size,
+        "succeeded": len(pdfs),
+        "seconds": seconds,
+        "queries_per_second": batch_size / seconds,
+        "latency_p50": quantiles[49] if quantiles else None,
+        "latency_p95": quantiles[94] if quantiles else None,
+        "latency_p99": quantiles[98] if quantiles else None,
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        / (1024 * 1024 if sys.platform == "darwin" else 1024),
+        "bytes_written": bytes_written,
+    }
+
+
+def int_list(value: str) -> list[int]:
+    return [int(v) for v in value.split(",")]
+
+
+def compare(results: list[dict], baseline_path: Path, tolerance: float) -> list[str]:
+    """Return a message for every run that is slower than the same run in the baseline."""
+    key = lambda r: (r["batch_size"], r["concurrency"])  # noqa: E731
+    baseline = {key(r): r for r in json.loads(baseline_path.read_text())["results"]}
+
+    regressions = []
+    for result in results:
+        old = baseline.get(key(result))
+        if (
+            old
+            and result["queries_per_second"]
+            < (1 - tolerance) * old["queries_per_second"]
+        ):
+            regressions.append(
+                f"batch {result['batch_size']}, concurrency {result['concurrency']}: "
+                f"{result['queries_per_second']:.1f} q/s, "
+                f"baseline {old['queries_per_second']:.1f} q/s"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batch-sizes", type=int_list, default=[50, 200])
+    parser.add_argument("--concurrency", type=int_list, default=[1, 4, 16])
+    parser.add_argument("--pdf-size", type=int, default=256 * 1024, help="bytes")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--not-found-rate", type=float, default=0.05)
+    parser.add_argument("--captcha-rate", type=float, default=0.0)
+    parser.add_argument("--output", type=Path, default=Path("bench_download.json"))
+    parser.add_argument("--baseline", type=Path, help="previous JSON output")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args()
+
+    settings = {
+        "pdf_size": args.pdf_size,
+        "latency": args.latency,
+        "error_rate": args.error_rate,
+        "not_found_rate": args.not_found_rate,
+        "captcha_rate": args.captcha_rate,
+    }
+    results = []
+    context = multiprocessing.get_context("spawn")
+
+    print(
+        f"{'batch':>6}{'jobs':>6}{'q/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+        f"{'RSS MB':>9}{'MB written':>12}"
+    )
+    for batch_size, concurrency in itertools.product(
+        args.batch_sizes, args.concurrency
+    ):
+        with FakeSciHub(**settings) as fake:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                result = pool.submit(
+                    run_download, fake.url, batch_size, concurrency
+                ).result()
+
+        result = {"batch_size": batch_size, "concurrency": concurrency, **result}
+        results.append(result)
+        print(
+            f"{batch_size:>6}{concurrency:>6}{result['queries_per_second']:>9.1f}"
+            f"{1000 * (result['latency_p50'] or 0):>9.1f}"
+            f"{1000 * (result['latency_p95'] or 0):>9.1f}"
+            f"{1000 * (result['latency_p99'] or 0):>9.1f}"
+            f"{result['peak_rss_mb']:>9.1f}{result['bytes_written'] / 2**20:>12.1f}"
+        )
+
+    args.output.write_text(
+        json.dumps(
+            {
+                "timestamp": time.time(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "settings": settings,
+                "results": results,
+            },
+            indent=2,
+        )
+    )
+    print(f"Results written to {args.output}.")
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
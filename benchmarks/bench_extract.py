@@ -0,0 +1,59 @@
+"""Micro-benchmark of search page handling: full BeautifulSoup parse versus fast path.
+
+Run with ``python benchmarks/bench_extract.py [--number N]``.
+"""
+
+import argparse
+import re
+import timeit
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+from pyscihub import extract
+
+PAGES = Path(__file__).parent.parent / "tests/data/pages"
+
+
+def soup_handle(page: bytes):
+    """Page handling as done before the fast path: parse, get_text() twice, extract."""
+    soup = BeautifulSoup(page.decode(), features="lxml")
+    if re.search(r"article not found", soup.get_text()):
+        return None
+    if re.search(r"Для просмотра статьи разгадайте капчу", soup.get_text()):
+        return None
+    return {
+        "citation": soup.find("div", id="citation").get_text(),
+        "link": soup.find("div", id="link").find("a")["href"],
+        "pdf": re.findall(
+            extract.URL_REGEX.pattern,
+            soup.find("div", id="buttons").select("ul li a")[0]["onclick"],
+        )[0][0],
+    }
+
+
+def fast_handle(page: bytes):
+    """Page handling as done by SciHub._handle_response."""
+    if extract.page_status(page) != "ok":
+        return None
+    return extract.extract_data(page)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'page':<24}{'soup (ms)':>12}{'fast (ms)':>12}{'speedup':>10}")
+    for page_path in sorted(PAGES.glob("*.html")):
+        page = page_path.read_bytes()
+        soup = timeit.timeit(lambda: soup_handle(page), number=args.number)
+        fast = timeit.timeit(lambda: fast_handle(page), number=args.number)
+        print(
+            f"{page_path.name:<24}{1000 * soup / args.number:>12.3f}"
+            f"{1000 * fast / args.number:>12.3f}{soup / fast:>9.0f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
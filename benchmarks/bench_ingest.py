@@ -0,0 +1,204 @@
+"""Benchmark of reading reference libraries: parse throughput and wasted queries.
+
+Writes a synthetic library of ``--entries`` references as BibTeX, RIS and CSL-JSON
+and reads each of them line by line (``--format lines``, as before) and with the
+format-aware parser. A query is wasted when the term it is searched by is not the
+DOI or the whole title of an entry: a field name, an author list, a wrapped half of
+a title, a title cut short at the period of "U.S.", ...
+
+Run with ``python benchmarks/bench_ingest.py [--entries N] [--doi-share F]``.
+"""
+
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from pyscihub.references import read_queries  # noqa: E402
+from pyscihub.tools import (  # noqa: E402
+    Classification,
+    QueryType,
+    classify_query,
+    normalize_query,
+    normalize_title,
+)
+
+WORDS = (
+    "adaptive algorithm analysis approach bayesian clinical cohort data deep design "
+    "dynamic effect evaluation evidence framework genetic graph heuristic learning "
+    "local method model network neural optimization patient problem protein random "
+    "review routing search stochastic study survey system trial vehicle"
+).split()
+NAMES = "Smith Jones Lourenço Martin Stützle Vidal Müller García Chen Wang".split()
+# parts of titles containing periods, which plain lines cut the title short at
+ABBREVIATIONS = ("U.S.", "E. coli", "St. Louis", "vs.", "i.e.")
+
+
+def make_entry(rng: random.Random, i: int, doi_share: float) -> dict:
+    words = rng.choices(WORDS, k=rng.randint(6, 16))
+    if rng.random() < 0.2:
+        words.insert(rng.randrange(len(words)), rng.choice(ABBREVIATIONS))
+    title = " ".join(words)
+    title = title[0].upper() + title[1:]
+    authors = [f"{rng.choice(NAMES)}, {rng.choice('ABCDEFGH')}." for _ in range(3)]
+    entry = {
+        "key": f"ref{i}",
+        "title": title,
+        "authors": authors,
+        "journal": " ".join(rng.choices(WORDS, k=3)).title(),
+        "year": str(rng.randint(1990, 2024)),
+        "abstract": " ".join(rng.choices(WORDS, k=rng.randint(30, 60))) + ".",
+    }
+    if rng.random() < doi_share:
+        entry["doi"] = f"10.5555/ingest.{i}"
+    return entry
+
+
+def wrap(text: str, width: int = 60, indent: str = "    ") -> str:
+    """Wrap long values over lines, as reference managers do."""
+    lines, line = [], ""
+    for word in text.split():
+        if line and len(line) + len(word) >= width:
+            lines.append(line)
+            line = ""
+        line = f"{line} {word}" if line else word
+    return f"\n{indent}".join(lines + [line])
+
+
+def write_bibtex(entries: list[dict], path: Path):
+    with open(path, "w") as f:
+        for entry in entries:
+            f.write(f"@article{{{entry['key']},\n")
+            f.write(f"  title = {{{wrap(entry['title'])}}},\n")
+            f.write(f"  author = {{{' and '.join(entry['authors'])}}},\n")
+            f.write(f"  journal = {{{entry['journal']}}},\n")
+            f.write(f"  year = {entry['year']},\n")
+            if "doi" in entry:
+                f.write(f"  doi = {{{entry['doi']}}},\n")
+            f.write(f"  abstract = {{{wrap(entry['abstract'])}}}\n}}\n\n")
+
+
+def write_ris(entries: list[dict], path: Path):
+    with open(path, "w") as f:
+        for entry in entries:
+            f.write("TY  - JOUR\n")
+            f.write(f"TI  - {wrap(entry['title'], indent='')}\n")
+            f.writelines(f"AU  - {author}\n" for author in entry["authors"])
+            f.write(f"JO  - {entry['journal']}\nPY  - {entry['year']}\n")
+            if "doi" in entry:
+                f.write(f"DO  - {entry['doi']}\n")
+            f.write(f"AB  - {entry['abstract']}\nER  - \n\n")
+
+
+def write_csl_json(entries: list[dict], path: Path):
+    with open(path, "w") as f:
+        f.write("[\n")
+        for i, entry in enumerate(entries):
+            item = {
+                "id": entry["key"],
+                "type": "article-journal",
+                "title": entry["title"],
+                "author": [{"literal": author} for author in entry["authors"]],
+                "container-title": entry["journal"],
+                "issued": {"date-parts": [[int(entry["year"])]]},
+                "abstract": entry["abstract"],
+            }
+            if "doi" in entry:
+                item["DOI"] = entry["doi"]
+            separator = ",\n" if i < len(entries) - 1 else "\n"
+            f.write(json.dumps(item, ensure_ascii=False, indent=2) + separator)
+        f.write("]\n")
+
+
+def search_key(classification: Classification) -> str:
+    """Key of the term a query is searched by, to compare it with the entries."""
+    if classification.type is QueryType.TITLE:
+        return normalize_title(classification.query)
+    return normalize_query(classification)
+
+
+def read(path: Path, format: str) -> tuple[list, float]:
+    start = time.perf_counter()
+    with open(path) as f:
+        queries = list(read_queries(f, format))
+    return queries, time.perf_counter() - start
+
+
+def peak_memory(path: Path, format: str) -> int:
+    """Peak memory of reading the queries without keeping them."""
+    tracemalloc.start()
+    with open(path) as f:
+        for _ in read_queries(f, format):
+            pass
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--entries", type=int, default=100_000)
+    parser.add_argument("--doi-share", type=float, default=0.7)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    entries = [make_entry(rng, i, args.doi_share) for i in range(args.entries)]
+    expected = {
+        search_key(
+            Classification(QueryType.DOI, entry["doi"])
+            if "doi" in entry
+            else Classification(QueryType.TITLE, entry["title"])
+        )
+        for entry in entries
+    }
+
+    writers = {
+        "library.bib": write_bibtex,
+        "library.ris": write_ris,
+        "library.json": write_csl_json,
+    }
+    print(
+        f"{'file':<14}{'reader':<8}{'MB':>7}{'entries/s':>11}{'MB/s':>7}"
+        f"{'peak MB':>9}{'searches':>10}{'wasted':>9}{'found':>8}"
+    )
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, write in writers.items():
+            path = Path(tmp_dir) / name
+            write(entries, path)
+            size = path.stat().st_size / 1e6
+            for format in ("lines", "auto"):
+                queries, seconds = read(path, format)
+                # plain lines are classified when downloaded, library entries already
+                classifications = (
+                    (
+                        query
+                        if isinstance(query, Classification)
+                        else classify_query(query)
+                    )
+                    for query in queries
+                )
+                # every query that is not invalid costs at least one search
+                searches = [
+                    search_key(classification)
+                    for classification in classifications
+                    if classification.type != QueryType.INVALID
+                ]
+                keys = set(searches)
+                wasted = sum(key not in expected for key in searches)
+                print(
+                    f"{name:<14}{format:<8}{size:>7.1f}"
+                    f"{args.entries / seconds:>11.0f}{size / seconds:>7.1f}"
+                    f"{peak_memory(path, format) / 1e6:>9.1f}{len(searches):>10}"
+                    f"{wasted:>9}{len(keys & expected) / len(expected):>8.0%}"
+                )
+
+
+if __name__ == "__main__":
+    main()
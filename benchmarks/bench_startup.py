@@ -0,0 +1,103 @@
+"""Startup benchmark: CLI import time and reading existing downloads from the manifest.
+
+Measures the cumulative import time of ``pyscihub.cli`` (``python -X importtime``),
+the wall time of ``pyscihub --help`` and ``SciHub._get_pdf_paths`` on a synthetic
+manifest, against a stat call per row as before.
+
+Run with ``python benchmarks/bench_startup.py [--rows N] [--repeat R]``.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+
+def import_time(module: str) -> float:
+    """Cumulative import time of ``module`` in a fresh interpreter, in seconds."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+        env={**os.environ, "PYTHONPATH": sys.path[0]},
+    )
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        _, cumulative, name = (part.strip() for part in line.split("|"))
+        if name == module:
+            return int(cumulative) / 1e6
+    raise RuntimeError(f"{module} not found in import times")
+
+
+def help_time() -> float:
+    """Wall time of ``pyscihub --help`` in a fresh interpreter, in seconds."""
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-m", "pyscihub.cli", "--help"],
+        capture_output=True,
+        check=True,
+        env={**os.environ, "PYTHONPATH": sys.path[0]},
+    )
+    return time.perf_counter() - start
+
+
+def stat_per_row(scihub) -> dict[str, str]:
+    """``_get_pdf_paths`` as it was, with a stat call for every manifest row."""
+    return {
+        key: pdf_path
+        for key, pdf_path in scihub.manifest.results()
+        if pdf_path != "" and Path(pdf_path).is_file()
+    }
+
+
+def timed(func, scihub) -> float:
+    start = time.perf_counter()
+    func(scihub)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    from pyscihub import SciHub
+
+    imports = [import_time("pyscihub.cli") for _ in range(args.repeat)]
+    helps = [help_time() for _ in range(args.repeat)]
+    print(f"{'import pyscihub.cli':<32}{1000 * statistics.median(imports):>10.1f} ms")
+    print(f"{'pyscihub --help':<32}{1000 * statistics.median(helps):>10.1f} ms")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output = Path(tmp_dir)
+        scihub = SciHub("https://sci-hub.se", output)
+        rows = []
+        for i in range(args.rows):
+            pdf = output / f"article-{i}.pdf"
+            # every other PDF was deleted since it was downloaded
+            if i % 2 == 0:
+                pdf.touch()
+            rows.append((f"10.5555/startup.{i}", str(pdf.resolve()), 0.0))
+        with scihub.manifest._conn:
+            scihub.manifest._insert(rows)
+
+        runs = {"stat per row": stat_per_row, "scandir": SciHub._get_pdf_paths}
+        baseline = None
+        title = f"{args.rows} manifest rows"
+        print(f"\n{title:<32}{'ms':>10}{'speedup':>10}")
+        for name, func in runs.items():
+            seconds = min(timed(func, scihub) for _ in range(args.repeat))
+            baseline = baseline or seconds
+            print(f"{name:<32}{1000 * seconds:>10.1f}{baseline / seconds:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Benchmark of the offline title index: build throughput and lookup latency.
+
+Builds an index of ``--works`` synthetic titles, then looks up exact titles, titles
+with typos and titles that are not indexed, reporting latency percentiles.
+
+Run with ``python benchmarks/bench_titles.py [--works N] [--lookups L]``.
+"""
+
+import argparse
+import itertools
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from pyscihub.titles import TitleIndex, build_index  # noqa: E402
+
+# relative frequencies of the letters in English text
+LETTERS = "etaoinshrdlcumwfgypbvkjxqz"
+LETTER_WEIGHTS = [12, 9, 8, 7.5, 7, 6.7, 6.3, 6, 6, 4.3, 4, 2.8, 2.8, 2.4, 2.4, 2.2]
+LETTER_WEIGHTS += [2, 2, 2, 1.5, 1, 0.8, 0.2, 0.2, 0.1, 0.1]
+
+
+def make_words(rng: random.Random, n: int) -> list[str]:
+    """Pseudo-words with English letter frequencies."""
+    return [
+        "".join(rng.choices(LETTERS, LETTER_WEIGHTS, k=rng.randint(3, 10)))
+        for _ in range(n)
+    ]
+
+
+def make_title(rng: random.Random, words: list[str], cum_weights: list[float]) -> str:
+    # a few words are in many titles, most in few
+    title = rng.choices(words, cum_weights=cum_weights, k=rng.randint(5, 12))
+    return " ".join(title).capitalize()
+
+
+def typo(rng: random.Random, title: str) -> str:
+    i = rng.randrange(len(title))
+    return title[:i] + title[i + 1 :]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--works", type=int, default=200_000)
+    parser.add_argument("--lookups", type=int, default=2_000)
+    parser.add_argument("--vocabulary", type=int, default=50_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    words = make_words(rng, args.vocabulary)
+    # Zipf-like 1 / rank frequencies of the words
+    cum_weights = list(
+        itertools.accumulate(1 / rank for rank in range(1, len(words) + 1))
+    )
+    titles = [make_title(rng, words, cum_weights) for _ in range(args.works)]
+    works = ((f"10.5555/titles.{i}", title) for i, title in enumerate(titles))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir) / "index"
+        start = time.perf_counter()
+        build_index(works, path)
+        seconds = time.perf_counter() - start
+        size = sum(f.stat().st_size for f in path.iterdir())
+        print(f"built {args.works} works in {seconds:.1f} s")
+        print(f"{args.works / seconds:.0f} works/s, {size / 1e6:.1f} MB on disk\n")
+
+        start = time.perf_counter()
+        index = TitleIndex(path)
+        print(f"opened in {1000 * (time.perf_counter() - start):.2f} ms\n")
+
+        samples = {
+            "exact": [rng.choice(titles) for _ in range(args.lookups)],
+            "typo": [typo(rng, rng.choice(titles)) for _ in range(args.lookups)],
+            "unknown": [
+                make_title(rng, words, cum_weights) for _ in range(args.lookups)
+            ],
+        }
+        print(f"{'lookup':<12}{'p50 ms':>10}{'p99 ms':>10}{'matched':>10}")
+        for name, queries in samples.items():
+            latencies = []
+            matched = 0
+            for query in queries:
+                start = time.perf_counter()
+                matched += index.lookup(query) is not None
+                latencies.append(time.perf_counter() - start)
+            quantiles = statistics.quantiles(latencies, n=100)
+            print(
+                f"{name:<12}{1000 * quantiles[49]:>10.3f}{1000 * quantiles[98]:>10.3f}"
+                f"{matched / len(queries):>9.0%}"
+            )
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
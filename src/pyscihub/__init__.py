@@ -4,4 +4,17 @@ __author__ = """Mark van der Broek"""
 __email__ = "markvanderbroek@gmail.com"
 __version__ = "0.1.2"
 
-from .pyscihub import SciHub
\ No newline at end of file
+import importlib
+
+# SciHub and Transport pull in requests, import them on first use so the CLI
+# starts quickly
+_LAZY = {"Download": ".pyscihub", "SciHub": ".pyscihub", "Transport": ".transport"}
+
+
+def __getattr__(name: str):
+    if name in _LAZY:
+        return getattr(importlib.import_module(_LAZY[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+__all__ = ["Download", "SciHub", "Transport"]
@@ -0,0 +1,134 @@
+"""Persistent cache mapping normalized queries to resolved Sci-Hub results."""
+
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from .extract import Result
+
+CACHE_NAME = "resolution_cache.sqlite"
+
+
+class ResolutionCache(object):
+    """SQLite-backed cache of search results with a TTL and LRU eviction.
+
+    The database runs in WAL mode with a busy timeout, so several processes (or teams)
+    can share a single cache file.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        ttl: float = 30 * 24 * 3600,
+        max_entries: int = 1_000_000,
+        evict_every: int = 100,
+    ):
+        """Opens (or creates) the cache database at ``path``.
+
+        Args:
+            path (Path): Location of the SQLite database
+            ttl (float): Seconds after which a cached result expires
+            max_entries (int): Maximum number of cached results
+            evict_every (int): Number of insertions between eviction passes
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._evict_every = evict_every
+        self._puts = 0
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                citation TEXT,
+                link TEXT,
+                pdf TEXT,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )"""
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Result | None:
+        """Return the cached result for ``key`` if it exists and has not expired.
+
+        Args:
+            key (str): Normalized query
+
+        Returns:
+            dict: Cached citation, URL and PDF link
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT citation, link, pdf, created FROM results WHERE key = ?",
+                (key,),
+            ).fetchone()
+
+            if row is None or row[3] + self.ttl < now:
+                if row is not None:
+                    self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+
+            self._conn.execute(
+                "UPDATE results SET accessed = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            self.hits += 1
+
+        return {"citation": row[0], "link": row[1], "pdf": row[2]}
+
+    def put(self, key: str, result: Result):
+        """Store ``result`` for ``key``, evicting the least recently used entries.
+
+        Args:
+            key (str): Normalized query
+            result (dict): Citation, URL and PDF link
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """INSERT OR REPLACE INTO results
+                (key, citation, link, pdf, created, accessed)
+                VALUES (?, ?, ?, ?, ?, ?)""",
+                (key, result["citation"], result["link"], result["pdf"], now, now),
+            )
+            self._puts += 1
+            if self._puts % self._evict_every == 0:
+                self._evict(now)
+            self._conn.commit()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        """Drop expired entries and everything beyond ``max_entries`` by last access."""
+        self._conn.execute("DELETE FROM results WHERE created < ?", (now - self.ttl,))
+        self._conn.execute(
+            """DELETE FROM results WHERE key IN (
+                SELECT key FROM results ORDER BY accessed DESC LIMIT -1 OFFSET ?
+            )""",
+            (self.max_entries,),
+        )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,11 +1,31 @@
 """Console script for pyscihub."""
+
 import sys
 import logging
+import signal
+from pathlib import Path
+from typing import TYPE_CHECKING
+
 import click
-from time import sleep
-from random import gauss
 
-from .pyscihub import SciHub
+from .cache import CACHE_NAME, ResolutionCache
+from .manifest import CSV_NAME, Manifest
+from .metrics import MetricsExporter, Profiler
+from .ratelimit import RateLimiter
+from .references import FORMATS, read_queries
+from .shard import Shard, iter_shard, merge
+from .store import LINK_TYPES, STORE_NAME, PdfStore
+from .titles import (
+    THRESHOLD,
+    TITLES_NAME,
+    TitleIndex,
+    build_index,
+    iter_works,
+    open_dump,
+)
+
+if TYPE_CHECKING:
+    from .pyscihub import SciHub
 
 
 @click.group()
@@ -14,36 +34,487 @@ from .pyscihub import SciHub
     "-o",
     help="Output path for PDFs",
     default="./output/",
-    type=click.Path(exists=True),
+    type=click.Path(exists=True, path_type=Path),
 )
 @click.option("--verbose", is_flag=True)
+@click.option(
+    "--mirror",
+    "-m",
+    "mirrors",
+    help="Sci-Hub mirror to use, repeat to fail over between mirrors",
+    multiple=True,
+    default=["https://sci-hub.se"],
+    show_default=True,
+)
+@click.option(
+    "--timeout",
+    help="Connect and read timeout in seconds",
+    default=30.0,
+    show_default=True,
+    type=click.FloatRange(min=0, min_open=True),
+)
+@click.option(
+    "--retries",
+    help="Retries with exponential backoff when connecting for a PDF fails",
+    default=3,
+    show_default=True,
+    type=click.IntRange(min=0),
+)
+@click.option(
+    "--rate",
+    help="Initial searches per second per mirror, adapts to CAPTCHAs and errors",
+    default=2.0,
+    show_default=True,
+    type=click.FloatRange(min=0, min_open=True),
+)
+@click.option(
+    "--max-rate",
+    help="Maximum searches per second per mirror",
+    default=10.0,
+    show_default=True,
+    type=click.FloatRange(min=0, min_open=True),
+)
+@click.option(
+    "--mirror-rate",
+    "mirror_rates",
+    help="Maximum searches per second for a single mirror",
+    multiple=True,
+    type=(str, click.FloatRange(min=0, min_open=True)),
+    metavar="URL RATE",
+)
+@click.option(
+    "--cache",
+    "cache_path",
+    help="Resolution cache shared between runs  [default: OUTPUT/resolution_cache.sqlite]",
+    type=click.Path(dir_okay=False, path_type=Path),
+)
+@click.option("--no-cache", is_flag=True, help="Always search, ignore cached results")
+@click.option(
+    "--store",
+    "store_link",
+    help="Store every PDF once by content hash, citation-named files link to it",
+    type=click.Choice(LINK_TYPES),
+)
+@click.option(
+    "--store-path",
+    help="Content-addressed store, can be shared between output folders  [default: OUTPUT/.store]",
+    type=click.Path(file_okay=False, path_type=Path),
+)
+@click.option(
+    "--title-index",
+    "title_index",
+    help="Index of titles to resolve to DOIs before searching, see titles index  [default: OUTPUT/title_index if it exists]",
+    type=click.Path(file_okay=False, path_type=Path),
+)
+@click.option(
+    "--title-threshold",
+    help="Minimal similarity between a title query and an indexed title",
+    default=THRESHOLD,
+    show_default=True,
+    type=click.FloatRange(min=0, max=1, min_open=True),
+)
+@click.option(
+    "--metrics",
+    "metrics_path",
+    help="Write phase timings and outcome counts here (.json, else Prometheus text)",
+    type=click.Path(dir_okay=False, path_type=Path),
+)
+@click.option(
+    "--metrics-interval",
+    help="Seconds between metrics exports during a run",
+    default=60.0,
+    show_default=True,
+    type=click.FloatRange(min=0, min_open=True),
+)
+@click.option(
+    "--profile",
+    "profile_path",
+    help="Dump a cProfile of the per-query hot path to this file, needs one worker",
+    type=click.Path(dir_okay=False, path_type=Path),
+)
 @click.pass_context
-def cli(ctx, output, verbose):
+def cli(
+    ctx,
+    output,
+    verbose,
+    mirrors,
+    timeout,
+    retries,
+    rate,
+    max_rate,
+    mirror_rates,
+    cache_path,
+    no_cache,
+    store_link,
+    store_path,
+    title_index,
+    title_threshold,
+    metrics_path,
+    metrics_interval,
+    profile_path,
+):
     """CLI to download PDFs from Sci-Hub."""
     ctx.ensure_object(dict)
     ctx.obj["OUTPUT"] = output
     ctx.obj["VERBOSE"] = verbose
+    ctx.obj["MIRRORS"] = list(mirrors)
+    ctx.obj["TIMEOUT"] = timeout
+    ctx.obj["RETRIES"] = retries
+    ctx.obj["CACHE"] = None if no_cache else cache_path or output / CACHE_NAME
+    ctx.obj["STORE"] = store_path or output / STORE_NAME
+    ctx.obj["STORE_LINK"] = store_link
+    ctx.obj["TITLES"] = title_index or output / TITLES_NAME
+    ctx.obj["TITLE_THRESHOLD"] = title_threshold
+    ctx.obj["METRICS"] = metrics_path
+    ctx.obj["METRICS_INTERVAL"] = metrics_interval
+    ctx.obj["PROFILE"] = profile_path
+
+    # every mirror gets its own adaptive rate limiter
+    max_rates = dict(mirror_rates)
+    ctx.obj["RATE_LIMITERS"] = {
+        url: RateLimiter(rate=rate, max_rate=max_rates.get(url, max_rate), name=url)
+        for url in ctx.obj["MIRRORS"]
+    }
+
+
+def make_scihub(ctx, pool_maxsize: int = 10, **kwargs) -> "SciHub":
+    """Create the SciHub object from the global CLI options."""
+    # requests is imported here, so --help and the manifest commands start fast
+    from .pyscihub import SciHub
+    from .transport import Transport
+
+    transport = Transport(
+        pool_maxsize=pool_maxsize,
+        timeout=ctx.obj["TIMEOUT"],
+        retries=ctx.obj["RETRIES"],
+    )
+    cache = ResolutionCache(ctx.obj["CACHE"]) if ctx.obj["CACHE"] else None
+    store = None
+    if ctx.obj["STORE_LINK"]:
+        store = PdfStore(ctx.obj["STORE"], link=ctx.obj["STORE_LINK"])
+    titles = None
+    if (ctx.obj["TITLES"] / "meta.json").is_file():
+        titles = TitleIndex(ctx.obj["TITLES"], threshold=ctx.obj["TITLE_THRESHOLD"])
+
+    return SciHub(
+        ctx.obj["MIRRORS"],
+        ctx.obj["OUTPUT"],
+        transport=transport,
+        cache=cache,
+        store=store,
+        titles=titles,
+        rate_limiters=ctx.obj["RATE_LIMITERS"],
+        profiler=Profiler() if ctx.obj["PROFILE"] else None,
+        **kwargs,
+    )
+
+
+def check_profile(ctx, workers: int):
+    """Reject --profile with several workers, cProfile sees one thread at a time."""
+    if ctx.obj["PROFILE"] and workers > 1:
+        raise click.UsageError("--profile needs a single worker, drop the job options.")
+
+
+def run_download(ctx, scihub: "SciHub", queries, **kwargs):
+    """Download ``queries`` while exporting metrics and profiles if requested."""
+    exporter = None
+    if ctx.obj["METRICS"]:
+        exporter = MetricsExporter(
+            scihub.metrics, ctx.obj["METRICS"], ctx.obj["METRICS_INTERVAL"]
+        ).start()
+
+    try:
+        scihub.download(queries, **kwargs)
+    finally:
+        if exporter is not None:
+            exporter.stop()
+        if scihub.profiler is not None:
+            scihub.profiler.dump(ctx.obj["PROFILE"])
+
+
+def parse_shard(ctx, param, value) -> Shard | None:
+    if value is None:
+        return None
+    try:
+        return Shard.parse(value)
+    except ValueError as err:
+        raise click.BadParameter(str(err))
 
 
 @cli.command("file")
-@click.argument("file_path", type=click.Path(exists=True))
+@click.argument("queries_file", type=click.File("r"))
+@click.option(
+    "--jobs",
+    "-j",
+    help="Number of queries to download concurrently",
+    default=1,
+    show_default=True,
+    type=click.IntRange(min=1),
+)
+@click.option(
+    "--host-limit",
+    help="Maximum number of in-flight requests per host",
+    default=4,
+    show_default=True,
+    type=click.IntRange(min=1),
+)
+@click.option(
+    "--resolve-jobs",
+    help="Number of concurrent searches, defaults to --jobs",
+    type=click.IntRange(min=1),
+)
+@click.option(
+    "--fetch-jobs",
+    help="Number of concurrent PDF downloads, defaults to --jobs",
+    type=click.IntRange(min=1),
+)
+@click.option(
+    "--shard",
+    help="Only download shard i of N, e.g. 2/8, and keep a manifest for this shard",
+    callback=parse_shard,
+    metavar="i/N",
+)
+@click.option(
+    "--retry-failed",
+    is_flag=True,
+    help="Retry earlier failures, also those that are not due for a retry yet",
+)
+@click.option(
+    "--format",
+    "input_format",
+    help="Format of QUERIES_FILE, auto detects it from its name or first line",
+    default="auto",
+    show_default=True,
+    type=click.Choice(["auto", *FORMATS]),
+)
 @click.pass_context
-def make_file(ctx, file_path):
-    scihub = SciHub("https://sci-hub.se", ctx.obj["OUTPUT"])
+def make_file(
+    ctx,
+    queries_file,
+    jobs,
+    host_limit,
+    resolve_jobs,
+    fetch_jobs,
+    shard,
+    retry_failed,
+    input_format,
+):
+    """Download a PDF for every line of QUERIES_FILE (use - for stdin).
+
+    QUERIES_FILE can also be a BibTeX, RIS or CSL-JSON library: every entry is then
+    downloaded by its DOI, or by its title if it has no DOI.
 
-    # open file
-    with open(file_path, "r") as f:
-        queries = f.readlines()
+    Big files can be split over machines or processes with --shard: every query
+    lands in the same shard everywhere, so each node can run one shard of the same
+    file without coordination. Combine the results afterwards with merge.
+    """
+    workers = max(jobs, resolve_jobs or 0, fetch_jobs or 0)
+    check_profile(ctx, workers)
+    scihub = make_scihub(
+        ctx,
+        pool_maxsize=max(10, workers),
+        host_limit=host_limit,
+        manifest_suffix=shard.suffix if shard else "",
+    )
 
-    scihub.download(queries)
+    # read entries lazily so downloading starts right away
+    queries = read_queries(queries_file, input_format)
+    if shard:
+        queries = iter_shard(queries, shard)
+    run_download(
+        ctx,
+        scihub,
+        queries,
+        concurrency=jobs,
+        resolve_workers=resolve_jobs,
+        fetch_workers=fetch_jobs,
+        retry_failed=retry_failed,
+    )
 
 
 @cli.command("single")
 @click.argument("query", type=str)
+@click.option(
+    "--retry-failed",
+    is_flag=True,
+    help="Retry earlier failures, also those that are not due for a retry yet",
+)
 @click.pass_context
-def make_query(ctx, query):
-    scihub = SciHub("https://sci-hub.se", ctx.obj["OUTPUT"])
-    scihub.download(query)
+def make_query(ctx, query, retry_failed):
+    scihub = make_scihub(ctx)
+    run_download(ctx, scihub, query, retry_failed=retry_failed)
+
+
+@cli.command("serve")
+@click.option(
+    "--host",
+    help="Interface to listen on",
+    default="127.0.0.1",
+    show_default=True,
+)
+@click.option(
+    "--port",
+    help="TCP port to listen on",
+    default=8765,
+    show_default=True,
+    type=click.IntRange(min=0, max=65535),
+)
+@click.option(
+    "--socket",
+    "socket_path",
+    help="Listen on this Unix socket instead of a TCP port",
+    type=click.Path(dir_okay=False, path_type=Path),
+)
+@click.option(
+    "--jobs",
+    "-j",
+    help="Number of queries to download concurrently",
+    default=4,
+    show_default=True,
+    type=click.IntRange(min=1),
+)
+@click.option(
+    "--host-limit",
+    help="Maximum number of in-flight requests per host",
+    default=4,
+    show_default=True,
+    type=click.IntRange(min=1),
+)
+@click.pass_context
+def make_serve(ctx, host, port, socket_path, jobs, host_limit):
+    """Keep running and download the queries of jobs sent to a local HTTP API.
+
+    Connections, rate limits, caches and the index of existing downloads stay warm
+    between jobs, and the same query sent by different clients at the same time is
+    downloaded once. Submit a job with POST /jobs {"queries": [...]}, then poll
+    GET /jobs/ID or stream GET /jobs/ID/stream. GET /status shows all jobs.
+    """
+    from .server import DownloadService, make_server
+
+    check_profile(ctx, jobs)
+    scihub = make_scihub(ctx, pool_maxsize=max(10, jobs), host_limit=host_limit)
+    service = DownloadService(scihub, workers=jobs)
+    server = make_server(service, host, port, socket_path)
+
+    exporter = None
+    if ctx.obj["METRICS"]:
+        exporter = MetricsExporter(
+            scihub.metrics, ctx.obj["METRICS"], ctx.obj["METRICS_INTERVAL"]
+        ).start()
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    # stop cleanly when a service manager terminates the server
+    signal.signal(signal.SIGTERM, stop)
+
+    address = socket_path or f"http://{host}:{server.server_address[1]}"
+    click.echo(f"Serving {ctx.obj['OUTPUT']} on {address}, press Ctrl+C to stop.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logging.info("Stopping server.")
+    finally:
+        server.server_close()
+        service.close()
+        if exporter is not None:
+            exporter.stop()
+        if scihub.profiler is not None:
+            scihub.profiler.dump(ctx.obj["PROFILE"])
+        if socket_path is not None:
+            socket_path.unlink(missing_ok=True)
+
+
+@cli.command("merge")
+@click.argument(
+    "sources",
+    nargs=-1,
+    required=True,
+    type=click.Path(exists=True, file_okay=False, path_type=Path),
+)
+@click.pass_context
+def make_merge(ctx, sources):
+    """Merge the manifests and PDFs of shard output folders SOURCES into the output.
+
+    The output folder itself may be one of the SOURCES, e.g. when all shards ran on
+    one machine.
+    """
+    stats = merge(list(sources), ctx.obj["OUTPUT"])
+    click.echo(
+        f"Merged {stats['queries']} results from {stats['manifests']} manifests: "
+        f"{stats['copied']} PDFs copied, {stats['duplicates']} duplicates, "
+        f"{stats['conflicts']} conflicts, {stats['missing']} missing PDFs."
+    )
+
+
+@cli.group("manifest")
+def manifest_group():
+    """Convert the manifest of the output folder from and to CSV."""
+
+
+@manifest_group.command("import")
+@click.argument("csv_path", type=click.Path(exists=True, path_type=Path))
+@click.pass_context
+def manifest_import(ctx, csv_path):
+    """Import the rows of a pdf_paths.csv file into the manifest."""
+    manifest = Manifest.open(ctx.obj["OUTPUT"])
+    click.echo(f"Imported {manifest.import_csv(csv_path)} rows.")
+    manifest.close()
+
+
+@manifest_group.command("export")
+@click.argument("csv_path", type=click.Path(path_type=Path), required=False)
+@click.pass_context
+def manifest_export(ctx, csv_path):
+    """Export the manifest to CSV_PATH (default: pdf_paths.csv in the output folder)."""
+    manifest = Manifest.open(ctx.obj["OUTPUT"])
+    csv_path = csv_path or ctx.obj["OUTPUT"] / CSV_NAME
+    click.echo(f"Exported {manifest.export_csv(csv_path)} rows to {csv_path}.")
+    manifest.close()
+
+
+@cli.group("titles")
+def titles_group():
+    """Resolve title queries to DOIs offline with a local index of titles."""
+
+
+@titles_group.command("index")
+@click.argument(
+    "dumps", nargs=-1, required=True, type=click.Path(exists=True, path_type=Path)
+)
+@click.pass_context
+def titles_index(ctx, dumps):
+    """Build the title index from Crossref-style JSONL DUMPS (optionally gzipped).
+
+    Every line is a work with a DOI and a title. The index is written to
+    --title-index and used by every download once it exists.
+    """
+
+    def works():
+        for dump in dumps:
+            with open_dump(dump) as lines:
+                yield from iter_works(lines)
+
+    count = build_index(works(), ctx.obj["TITLES"])
+    click.echo(f"Indexed {count} titles in {ctx.obj['TITLES']}.")
+
+
+@titles_group.command("lookup")
+@click.argument("title")
+@click.pass_context
+def titles_lookup(ctx, title):
+    """Show the DOI the index resolves TITLE to."""
+    try:
+        index = TitleIndex(ctx.obj["TITLES"], threshold=ctx.obj["TITLE_THRESHOLD"])
+    except ValueError as err:
+        raise click.ClickException(str(err))
+
+    match = index.lookup(title)
+    if match is None:
+        click.echo("No match.")
+    else:
+        click.echo(f"{match.doi}\t{match.score:.3f}\t{match.title}")
+    index.close()
 
 
 def main():
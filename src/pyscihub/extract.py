@@ -0,0 +1,135 @@
+"""Extract the citation, article link and PDF link from Sci-Hub search pages."""
+
+import html
+import logging
+import re
+from typing import TypedDict
+
+
+class Result(TypedDict):
+    citation: str | None
+    link: str | None
+    pdf: str | None
+
+
+URL_REGEX = re.compile(
+    r"(?i)\b((?:https?://|www\d{0,3}[.]|[a-z0-9.\-]+[.][a-z]{2,4}/)(?:[^\s()<>]+|\(([^\s()<>]+|(\([^\s()<>]+\)))*\))+(?:\(([^\s()<>]+|(\([^\s()<>]+\)))*\)|[^\s`!()\[\]{};:'\".,<>?«»“”‘’]))"
+)
+
+NOT_FOUND = "article not found".encode()
+CAPTCHA = "Для просмотра статьи разгадайте капчу".encode()
+
+# fast path patterns working directly on the raw bytes of the page
+_DIV_START = r"""<div\b[^>]*?\bid\s*=\s*["']?{}["'\s>]"""
+_BUTTONS = re.compile(_DIV_START.format("buttons").encode(), re.I)
+_ONCLICK = re.compile(rb"""<a\b[^>]*?\bonclick\s*=\s*(?:"([^"]*)"|'([^']*)')""", re.I)
+_CITATION = re.compile(
+    (_DIV_START.format("citation") + r"[^>]*>(.*?)</div>").encode(), re.I | re.S
+)
+_LINK = re.compile(
+    (
+        _DIV_START.format("link") + r"""[^>]*>.*?<a\b[^>]*?\bhref\s*=\s*["']([^"']*)"""
+    ).encode(),
+    re.I | re.S,
+)
+_TAG = re.compile(r"<[^>]*>")
+_BUTTONS_END = re.compile(rb"</div>", re.I)
+
+
+def page_status(page: bytes) -> str:
+    """Return ``"not_found"``, ``"captcha"`` or ``"ok"`` for a search page."""
+    if NOT_FOUND in page:
+        return "not_found"
+    elif CAPTCHA in page:
+        return "captcha"
+    else:
+        return "ok"
+
+
+def _decode(value: bytes) -> str:
+    """Decode a raw HTML fragment, dropping tags and resolving entities."""
+    return html.unescape(_TAG.sub("", value.decode("utf-8", errors="replace")))
+
+
+def _pdf_url(onclick: str) -> str:
+    """Extract the PDF URL from the onclick handler of the download button."""
+    pdf_url = URL_REGEX.findall(onclick)[0][0]
+
+    # if URL does not contain a scheme, then add https
+    if not pdf_url.startswith(("https://", "http://")):
+        pdf_url = f"https://{pdf_url}"
+
+    return pdf_url
+
+
+def fast_extract(page: bytes) -> Result | None:
+    """Extract the data with precompiled patterns without building a parse tree.
+
+    Args:
+        page (bytes): Raw body of the search page
+
+    Returns:
+        dict: Citation, URL and PDF link, or None if an element could not be found
+    """
+    buttons = _BUTTONS.search(page)
+    citation = _CITATION.search(page)
+    link = _LINK.search(page)
+    if buttons is None or citation is None or link is None:
+        return None
+    # nested divs would end the non-greedy match early
+    if b"<div" in citation.group(1).lower():
+        return None
+
+    # only look at links inside the buttons div
+    end = _BUTTONS_END.search(page, buttons.end())
+    onclick = _ONCLICK.search(page, buttons.end(), end.start() if end else len(page))
+    if onclick is None:
+        return None
+
+    try:
+        pdf_url = _pdf_url(_decode(onclick.group(1) or onclick.group(2) or b""))
+    except IndexError:
+        return None
+
+    return {
+        "citation": _decode(citation.group(1)),
+        "link": _decode(link.group(1)),
+        "pdf": pdf_url,
+    }
+
+
+def soup_extract(page: bytes) -> Result:
+    """Extract the data by parsing the full page with BeautifulSoup.
+
+    Args:
+        page (bytes): Raw body of the search page
+
+    Returns:
+        dict: A dictionary containing the citation, URL and PDF link
+    """
+    # BeautifulSoup and lxml are slow to import and only needed as a fallback
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(page, features="lxml")
+    return {
+        "citation": soup.find("div", id="citation").get_text(),
+        "link": soup.find("div", id="link").find("a")["href"],
+        "pdf": _pdf_url(soup.find("div", id="buttons").select("ul li a")[0]["onclick"]),
+    }
+
+
+def extract_data(page: bytes) -> Result:
+    """Extract citation, URL and PDF link, falling back to BeautifulSoup if needed.
+
+    Args:
+        page (bytes): Raw body of the search page
+
+    Returns:
+        dict: A dictionary containing the citation, URL and PDF link
+    """
+    data = fast_extract(page)
+    if data is None:
+        logging.debug("Fast extraction failed. Parsing full page.")
+        data = soup_extract(page)
+
+    return data
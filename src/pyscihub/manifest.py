@@ -0,0 +1,437 @@
+"""Crash-safe manifest of queries and their downloaded PDFs."""
+
+import csv
+import io
+import logging
+import sqlite3
+import threading
+import time
+from enum import Enum
+from pathlib import Path
+from typing import Iterator
+
+from .tools import atomic_write, canonical_key
+
+CSV_NAME = "pdf_paths.csv"
+DB_NAME = "pdf_paths.sqlite"
+# version of ``canonical_key`` the keys of a database were computed with
+KEY_VERSION = 1
+
+
+def manifest_name(name: str, suffix: str = "") -> str:
+    """Insert ``suffix`` before the extension, e.g. ``pdf_paths.shard-1-of-4.csv``."""
+    stem, _, extension = name.rpartition(".")
+    return f"{stem}{suffix}.{extension}"
+
+
+class Reason(str, Enum):
+    """Why a query failed, the values match the outcomes counted in ``Metrics``."""
+
+    NOT_FOUND = "not_found"
+    INVALID_QUERY = "invalid_query"
+    NO_PDF = "no_pdf"
+    CAPTCHA = "captcha"
+    HTTP_ERROR = "http_error"
+    CONNECTION_ERROR = "connection_error"
+    INTERRUPTED = "interrupted"
+    INVALID_PDF = "invalid_pdf"
+    OS_ERROR = "os_error"
+    ERROR = "error"
+
+
+# failures that will not go away by trying again
+PERMANENT = frozenset({Reason.NOT_FOUND, Reason.INVALID_QUERY, Reason.NO_PDF})
+
+# a successful download clears the failure of its key
+_UPSERT_RESULT = """INSERT INTO results (key, pdf_path, updated) VALUES (?, ?, ?)
+ON CONFLICT(key) DO UPDATE SET
+    pdf_path = CASE WHEN excluded.pdf_path = '' AND results.pdf_path != ''
+        THEN results.pdf_path ELSE excluded.pdf_path END,
+    updated = excluded.updated,
+    reason = CASE WHEN excluded.pdf_path = '' THEN results.reason END,
+    attempts = CASE WHEN excluded.pdf_path = '' THEN results.attempts ELSE 0 END,
+    next_attempt = CASE WHEN excluded.pdf_path = '' THEN results.next_attempt END"""
+_UPSERT_FAILURE = """INSERT INTO results
+(key, pdf_path, updated, reason, attempts, next_attempt) VALUES (?, '', ?, ?, ?, ?)
+ON CONFLICT(key) DO UPDATE SET
+    updated = excluded.updated,
+    reason = excluded.reason,
+    attempts = excluded.attempts,
+    next_attempt = excluded.next_attempt"""
+_UPSERT_QUERY = """INSERT INTO queries (query, key) VALUES (?, ?)
+ON CONFLICT(query) DO UPDATE SET key = excluded.key"""
+
+
+class Manifest(object):
+    """SQLite-backed mapping from query to PDF location.
+
+    Results are stored once per canonical key (see ``tools.canonical_key``), and every
+    original query is mapped to its key, so variants of a query share one download.
+    A failed download never overwrites a successful one under the same key.
+
+    Failures are stored with their ``Reason`` and number of attempts. Permanent
+    failures are never retried; transient ones become eligible again after an
+    exponential backoff of ``retry_base`` seconds doubling up to ``retry_max``.
+
+    Every result is committed as soon as it is recorded, and the database runs in WAL
+    mode so a crash never loses more than the result that was being written.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        retry_base: float = 3600.0,
+        retry_max: float = 7 * 24 * 3600.0,
+    ):
+        """Opens (or creates) the manifest database at ``path``.
+
+        Args:
+            path (Path): Location of the SQLite database
+            retry_base (float): Seconds before a transient failure is first retried
+            retry_max (float): Maximum seconds between retries of a transient failure
+        """
+        self.path = path
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            # migrate and create tables in one transaction
+            self._conn.execute("BEGIN")
+            columns = [
+                row[1] for row in self._conn.execute("PRAGMA table_info(results)")
+            ]
+            if "query" in columns:
+                # databases of older versions stored results by raw query
+                self._conn.execute("ALTER TABLE results RENAME TO results_by_query")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    pdf_path TEXT NOT NULL,
+                    updated REAL NOT NULL,
+                    reason TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt REAL
+                )"""
+            )
+            if "key" in columns and "reason" not in columns:
+                for column in (
+                    "reason TEXT",
+                    "attempts INTEGER NOT NULL DEFAULT 0",
+                    "next_attempt REAL",
+                ):
+                    self._conn.execute(f"ALTER TABLE results ADD COLUMN {column}")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS queries (
+                    query TEXT PRIMARY KEY,
+                    key TEXT NOT NULL
+                )"""
+            )
+            if "query" in columns:
+                rows = self._conn.execute(
+                    """SELECT query, pdf_path, updated FROM results_by_query
+                    ORDER BY rowid"""
+                ).fetchall()
+                self._insert(rows)
+                self._conn.execute("DROP TABLE results_by_query")
+                logging.info(f"Migrated {len(rows)} rows of {path} to canonical keys.")
+            if self._conn.execute("PRAGMA user_version").fetchone()[0] < KEY_VERSION:
+                self._rekey()
+                self._conn.execute(f"PRAGMA user_version = {KEY_VERSION}")
+
+    def _rekey(self):
+        """Move results to the current canonical keys of their queries.
+
+        Keys of titles used to stop at the first period, so distinct references could
+        share one key. Such a result cannot be told apart and is dropped, its queries
+        are looked up again. Other results are renamed to their new key.
+        """
+        self._conn.create_function(
+            "canonical_key", 1, canonical_key, deterministic=True
+        )
+        self._conn.execute(
+            """CREATE TEMP TABLE rekey AS
+            SELECT query, key AS old, canonical_key(query) AS new FROM queries"""
+        )
+        self._conn.execute("CREATE INDEX temp.rekey_query ON rekey (query)")
+        self._conn.execute(
+            """CREATE TEMP TABLE moved AS
+            SELECT old, MIN(new) AS new, COUNT(DISTINCT new) AS n FROM rekey
+            GROUP BY old HAVING n > 1 OR MIN(new) != old"""
+        )
+        self._conn.execute(
+            """UPDATE OR IGNORE results
+            SET key = (SELECT new FROM moved WHERE moved.old = results.key)
+            WHERE key IN (SELECT old FROM moved WHERE n = 1)"""
+        )
+        dropped = self._conn.execute(
+            "DELETE FROM results WHERE key IN (SELECT old FROM moved)"
+        ).rowcount
+        moved = self._conn.execute(
+            """UPDATE queries SET key = (
+                SELECT new FROM rekey WHERE rekey.query = queries.query
+            ) WHERE key IN (SELECT old FROM moved)"""
+        ).rowcount
+        self._conn.execute("DROP TABLE rekey")
+        self._conn.execute("DROP TABLE moved")
+        if moved:
+            logging.info(
+                f"Moved {moved} queries of {self.path} to new keys, {dropped} "
+                "ambiguous results will be looked up again."
+            )
+
+    def _insert(self, rows: list[tuple[str, str, float]]):
+        """Store (query, pdf_path, updated) rows without committing."""
+        rows = [(query.strip(), pdf_path, updated) for query, pdf_path, updated in rows]
+        keys = [canonical_key(query) for query, _, _ in rows]
+        self._conn.executemany(
+            _UPSERT_RESULT,
+            [
+                (key, pdf_path, updated)
+                for key, (_, pdf_path, updated) in zip(keys, rows)
+            ],
+        )
+        self._conn.executemany(
+            _UPSERT_QUERY, [(query, key) for key, (query, _, _) in zip(keys, rows)]
+        )
+
+    @classmethod
+    def open(cls, output_path: Path, suffix: str = "") -> "Manifest":
+        """Open the manifest of an output folder, importing an existing pdf_paths.csv.
+
+        Output folders created by older versions only have a ``pdf_paths.csv``. The
+        first time such a folder is opened, its rows are migrated into the database.
+
+        Args:
+            output_path (Path): Folder containing the PDFs
+            suffix (str): Suffix of the manifest files, e.g. to keep shards apart
+
+        Returns:
+            Manifest: The manifest of the output folder
+        """
+        db_path = output_path / manifest_name(DB_NAME, suffix)
+        csv_path = output_path / manifest_name(CSV_NAME, suffix)
+        migrate = not db_path.is_file() and csv_path.is_file()
+
+        manifest = cls(db_path)
+        if migrate:
+            n_rows = manifest.import_csv(csv_path)
+            logging.info(f"Migrated {n_rows} rows from {csv_path} to {db_path}.")
+
+        return manifest
+
+    def record(self, query: str, pdf_path: str, key: str | None = None):
+        """Store (or overwrite) the PDF location of ``query`` and commit immediately.
+
+        Args:
+            query (str): Query that was looked up
+            pdf_path (str): File location of downloaded PDF or empty string on error
+            key (str): Canonical key of the query, computed if not given
+        """
+        query = query.strip()
+        key = key if key is not None else canonical_key(query)
+        with self._lock, self._conn:
+            self._conn.execute(_UPSERT_RESULT, (key, pdf_path, time.time()))
+            self._conn.execute(_UPSERT_QUERY, (query, key))
+
+    def record_failure(
+        self,
+        query: str,
+        reason: Reason,
+        key: str | None = None,
+        attempts: int | None = None,
+        next_attempt: float | None = None,
+    ):
+        """Store the failure of ``query`` and when it may be tried again.
+
+        A successful download under the same key is kept, only the query is mapped
+        to it.
+
+        Args:
+            query (str): Query that was looked up
+            reason (Reason): Why the query failed
+            key (str): Canonical key of the query, computed if not given
+            attempts (int): Number of attempts, e.g. copied from another manifest.
+                If not given, this attempt is counted and the backoff computed
+            next_attempt (float): When to try again if ``attempts`` is given, None
+                for a permanent failure
+        """
+        query = query.strip()
+        key = key if key is not None else canonical_key(query)
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT pdf_path, attempts FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row[0] == "":
+                if attempts is None:
+                    attempts = (0 if row is None else row[1]) + 1
+                    if reason in PERMANENT:
+                        next_attempt = None
+                    else:
+                        delay = self.retry_base * 2 ** (attempts - 1)
+                        next_attempt = now + min(delay, self.retry_max)
+                self._conn.execute(
+                    _UPSERT_FAILURE,
+                    (key, now, Reason(reason).value, attempts, next_attempt),
+                )
+            self._conn.execute(_UPSERT_QUERY, (query, key))
+
+    def failures(
+        self, batch_size: int = 1000
+    ) -> Iterator[tuple[str, Reason, int, float | None]]:
+        """Iterate over (key, reason, attempts, next_attempt) of all failed keys.
+
+        ``next_attempt`` is None for permanent failures.
+        """
+        for key, reason, attempts, next_attempt in self._paged(
+            """SELECT rowid, key, reason, attempts, next_attempt FROM results
+            WHERE rowid > ? AND reason IS NOT NULL ORDER BY rowid LIMIT ?""",
+            batch_size,
+        ):
+            yield key, Reason(reason), attempts, next_attempt
+
+    def failure(self, key: str) -> tuple[Reason, int, float | None] | None:
+        """Return (reason, attempts, next_attempt) if ``key`` failed, else None."""
+        with self._lock:
+            row = self._conn.execute(
+                """SELECT reason, attempts, next_attempt FROM results
+                WHERE key = ? AND reason IS NOT NULL""",
+                (key,),
+            ).fetchone()
+
+        return None if row is None else (Reason(row[0]), row[1], row[2])
+
+    def alias(self, query: str, key: str):
+        """Map ``query`` to the result stored under ``key``, e.g. for a variant of a
+        query that was already downloaded."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO queries (query, key) VALUES (?, ?)",
+                (query.strip(), key),
+            )
+
+    def get(self, query: str) -> str | None:
+        """Return the PDF location recorded for ``query`` or any variant of it."""
+        query = query.strip()
+        with self._lock:
+            row = self._conn.execute(
+                """SELECT pdf_path FROM queries JOIN results USING (key)
+                WHERE query = ?""",
+                (query,),
+            ).fetchone()
+            if row is None:
+                row = self._conn.execute(
+                    "SELECT pdf_path FROM results WHERE key = ?",
+                    (canonical_key(query),),
+                ).fetchone()
+
+        return None if row is None else row[0]
+
+    def items(self, batch_size: int = 1000) -> Iterator[tuple[str, str]]:
+        """Iterate over all (query, pdf_path) pairs in insertion order.
+
+        Rows are fetched in batches of ``batch_size`` so large manifests are never
+        loaded into memory at once.
+        """
+        return self._paged(
+            """SELECT queries.rowid, query, pdf_path FROM queries JOIN results USING (key)
+            WHERE queries.rowid > ? ORDER BY queries.rowid LIMIT ?""",
+            batch_size,
+        )
+
+    def entries(
+        self, batch_size: int = 1000
+    ) -> Iterator[tuple[str, str, Reason | None, int, float | None]]:
+        """Like ``items``, with the reason, attempts and next attempt of each query.
+
+        The reason is None for queries that did not fail.
+        """
+        for query, pdf_path, reason, attempts, next_attempt in self._paged(
+            """SELECT queries.rowid, query, pdf_path, reason, attempts, next_attempt
+            FROM queries JOIN results USING (key)
+            WHERE queries.rowid > ? ORDER BY queries.rowid LIMIT ?""",
+            batch_size,
+        ):
+            reason = None if reason is None else Reason(reason)
+            yield query, pdf_path, reason, attempts, next_attempt
+
+    def results(self, batch_size: int = 1000) -> Iterator[tuple[str, str]]:
+        """Iterate over all (key, pdf_path) pairs, one per canonical key."""
+        return self._paged(
+            """SELECT rowid, key, pdf_path FROM results
+            WHERE rowid > ? ORDER BY rowid LIMIT ?""",
+            batch_size,
+        )
+
+    def _paged(self, sql: str, batch_size: int) -> Iterator[tuple]:
+        """Run ``sql`` page by page, its first column must be the rowid."""
+        last_rowid = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(sql, (last_rowid, batch_size)).fetchall()
+            if not rows:
+                return
+
+            for row in rows:
+                last_rowid = row[0]
+                yield row[1:]
+
+    def __contains__(self, query: str) -> bool:
+        return self.get(query) is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM queries").fetchone()[0]
+
+    def import_csv(self, csv_path: Path) -> int:
+        """Import the rows of a pdf_paths.csv file in a single transaction.
+
+        Args:
+            csv_path (Path): CSV file with ``query`` and ``pdf_path`` columns
+
+        Returns:
+            int: Number of imported rows
+        """
+        now = time.time()
+        with open(csv_path, newline="") as f:
+            rows = [(row["query"], row["pdf_path"], now) for row in csv.DictReader(f)]
+
+        with self._lock, self._conn:
+            self._insert(rows)
+
+        return len(rows)
+
+    def export_csv(self, csv_path: Path) -> int:
+        """Write all rows to ``csv_path`` in the pdf_paths.csv format.
+
+        Args:
+            csv_path (Path): Location of the CSV file
+
+        Returns:
+            int: Number of exported rows
+        """
+        n_rows = 0
+
+        def lines():
+            nonlocal n_rows
+            buffer = io.StringIO()
+            w = csv.writer(buffer)
+            w.writerow(["query", "pdf_path"])
+            for query, pdf_path in self.items():
+                w.writerow([query, pdf_path])
+                n_rows += 1
+                if buffer.tell() > 64 * 1024:
+                    yield buffer.getvalue().encode()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue().encode()
+
+        atomic_write(csv_path, lines())
+        return n_rows
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
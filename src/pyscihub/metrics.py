@@ -0,0 +1,216 @@
+"""Timing histograms, outcome counters and profiling of the download pipeline."""
+
+import cProfile
+import json
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator
+
+from .tools import atomic_write
+
+# upper bounds in seconds of the histogram buckets, like Prometheus' defaults
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+PHASES = ("classify", "title_lookup", "search", "parse", "pdf_get", "write")
+OUTCOMES = (
+    "success",
+    "not_found",
+    "captcha",
+    "http_error",
+    "connection_error",
+    "interrupted",
+    "os_error",
+    "invalid_pdf",
+    "invalid_query",
+    "no_pdf",
+    "error",
+)
+
+
+class Histogram(object):
+    """Cumulative histogram of durations."""
+
+    def __init__(self, buckets: tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[i] += 1
+
+
+class Metrics(object):
+    """Thread-safe duration histograms per phase and counters per outcome.
+
+    Outcomes are counted once per query. Failed attempts, e.g. a CAPTCHA on one
+    mirror before another mirror answers, are counted separately per reason.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.phases = {phase: Histogram() for phase in PHASES}
+        self.outcomes = {outcome: 0 for outcome in OUTCOMES}
+        self.failures = {outcome: 0 for outcome in OUTCOMES if outcome != "success"}
+
+    def observe(self, phase: str, seconds: float):
+        with self._lock:
+            if phase not in self.phases:
+                self.phases[phase] = Histogram()
+            self.phases[phase].observe(seconds)
+
+    @contextmanager
+    def time(self, phase: str) -> Iterator[None]:
+        """Record the duration of the ``with`` block as ``phase``."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(phase, time.perf_counter() - start)
+
+    def count(self, outcome: str, n: int = 1):
+        with self._lock:
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + n
+
+    def count_failure(self, reason: str, n: int = 1):
+        with self._lock:
+            self.failures[reason] = self.failures.get(reason, 0) + n
+
+    def to_json(self) -> dict:
+        """Summary of all phases and outcomes as a JSON-serialisable dictionary."""
+        with self._lock:
+            return {
+                "started": self.started,
+                "elapsed": time.time() - self.started,
+                "phases": {
+                    phase: {
+                        "count": hist.count,
+                        "sum": hist.sum,
+                        "mean": hist.sum / hist.count if hist.count else None,
+                        "max": hist.max,
+                        "buckets": dict(zip(map(str, hist.buckets), hist.counts)),
+                    }
+                    for phase, hist in self.phases.items()
+                },
+                "outcomes": dict(self.outcomes),
+                "failures": dict(self.failures),
+            }
+
+    def to_prometheus(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines = [
+            "# HELP pyscihub_phase_seconds Duration of download pipeline phases.",
+            "# TYPE pyscihub_phase_seconds histogram",
+        ]
+        with self._lock:
+            for phase, hist in self.phases.items():
+                for bound, count in zip(hist.buckets, hist.counts):
+                    lines.append(
+                        f'pyscihub_phase_seconds_bucket{{phase="{phase}",le="{bound}"}} '
+                        f"{count}"
+                    )
+                lines.append(
+                    f'pyscihub_phase_seconds_bucket{{phase="{phase}",le="+Inf"}} '
+                    f"{hist.count}"
+                )
+                lines.append(
+                    f'pyscihub_phase_seconds_sum{{phase="{phase}"}} {hist.sum}'
+                )
+                lines.append(
+                    f'pyscihub_phase_seconds_count{{phase="{phase}"}} {hist.count}'
+                )
+
+            lines.append("# HELP pyscihub_outcomes_total Results per outcome.")
+            lines.append("# TYPE pyscihub_outcomes_total counter")
+            for outcome, count in self.outcomes.items():
+                lines.append(f'pyscihub_outcomes_total{{outcome="{outcome}"}} {count}')
+
+            lines.append("# HELP pyscihub_failures_total Failed attempts per reason.")
+            lines.append("# TYPE pyscihub_failures_total counter")
+            for reason, count in self.failures.items():
+                lines.append(f'pyscihub_failures_total{{reason="{reason}"}} {count}')
+
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: Path):
+        """Write the metrics to ``path``, as JSON if it ends in .json else Prometheus."""
+        if path.suffix == ".json":
+            text = json.dumps(self.to_json(), indent=2)
+        else:
+            text = self.to_prometheus()
+        atomic_write(path, [text.encode()])
+
+
+class MetricsExporter(object):
+    """Writes metrics to a file every ``interval`` seconds and once when stopped."""
+
+    def __init__(self, metrics: Metrics, path: Path, interval: float = 60.0):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.metrics.write(self.path)
+
+    def start(self) -> "MetricsExporter":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        self.metrics.write(self.path)
+
+    def __enter__(self) -> "MetricsExporter":
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+class Profiler(object):
+    """cProfile wrapper profiling the hot path of one worker thread.
+
+    From Python 3.12 on only one cProfile can be active at a time, so only a single
+    thread may be profiled. Downloads with more than one worker are not profiled.
+    """
+
+    def __init__(self):
+        self._profile = cProfile.Profile()
+        self._thread: int | None = None
+
+    def call(self, func: Callable, *args, **kwargs):
+        """Call ``func`` while profiling the current thread.
+
+        Raises:
+            RuntimeError: If another thread was profiled before
+        """
+        thread = threading.get_ident()
+        if self._thread is None:
+            self._thread = thread
+        elif self._thread != thread:
+            raise RuntimeError("Only one thread can be profiled.")
+
+        self._profile.enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self._profile.disable()
+
+    def dump(self, path: Path):
+        """Write the profile in pstats format, if anything was profiled."""
+        if self._profile.getstats():
+            pstats.Stats(self._profile).dump_stats(path)
@@ -0,0 +1,82 @@
+"""Pool of Sci-Hub mirrors ranked by latency and recent errors."""
+
+import threading
+
+from .ratelimit import RateLimiter
+
+# latency assumed for mirrors that have not answered yet, keeps the given order
+PRIOR_LATENCY = 1.0
+# seconds added to the score of a mirror that fails every request
+ERROR_PENALTY = 30.0
+
+
+class Mirror(object):
+    """Moving averages of the latency and error rate of a single mirror."""
+
+    def __init__(
+        self, url: str, alpha: float = 0.3, limiter: RateLimiter | None = None
+    ):
+        """Initialises the mirror statistics.
+
+        Args:
+            url (str): Sci-Hub URL of the mirror
+            alpha (float): Weight of the newest observation in the moving averages
+            limiter (RateLimiter): Rate limiter for searches sent to this mirror
+        """
+        self.url = url
+        self.limiter = limiter if limiter is not None else RateLimiter(name=url)
+        self.latency = PRIOR_LATENCY
+        self.error_rate = 0.0
+        self._alpha = alpha
+
+    @property
+    def score(self) -> float:
+        """Expected cost of sending a search to this mirror, lower is better."""
+        return self.latency + self.error_rate * ERROR_PENALTY
+
+    def record_success(self, latency: float):
+        self.latency += self._alpha * (latency - self.latency)
+        self.error_rate -= self._alpha * self.error_rate
+
+    def record_failure(self):
+        self.error_rate += self._alpha * (1.0 - self.error_rate)
+
+    def __repr__(self) -> str:
+        return (
+            f"Mirror({self.url!r}, latency={self.latency:.3f}, "
+            f"error_rate={self.error_rate:.3f})"
+        )
+
+
+class MirrorPool(object):
+    """Thread-safe collection of mirrors handing out the healthiest one first."""
+
+    def __init__(self, urls: list[str], limiters: dict[str, RateLimiter] | None = None):
+        """Initialises the pool.
+
+        Args:
+            urls (list(str)): Sci-Hub URLs, in order of preference
+            limiters (dict): Rate limiter per URL, mirrors without one get the default
+
+        Raises:
+            ValueError: If no URL is given
+        """
+        if not urls:
+            raise ValueError("at least one Sci-Hub URL is required.")
+
+        limiters = limiters or dict()
+        self._lock = threading.Lock()
+        self.mirrors = [Mirror(url, limiter=limiters.get(url)) for url in urls]
+
+    def ranked(self) -> list[Mirror]:
+        """Return all mirrors ordered from healthiest to least healthy."""
+        with self._lock:
+            return sorted(self.mirrors, key=lambda mirror: mirror.score)
+
+    def record_success(self, mirror: Mirror, latency: float):
+        with self._lock:
+            mirror.record_success(latency)
+
+    def record_failure(self, mirror: Mirror):
+        with self._lock:
+            mirror.record_failure()
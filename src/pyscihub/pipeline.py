@@ -0,0 +1,162 @@
+"""Two-stage producer-consumer pipeline with bounded queues."""
+
+import logging
+import queue
+import threading
+from typing import Any, Callable, Iterable, Iterator
+
+# how often blocked workers check whether the pipeline was stopped
+POLL_INTERVAL = 0.1
+
+_DONE = object()
+
+
+class Pipeline(object):
+    """Runs queries through a resolve stage and a fetch stage on separate workers.
+
+    Each stage has its own worker threads and a bounded input queue, so a slow stage
+    applies backpressure to the stage before it instead of piling up work.
+
+    The resolve stage returns ``(True, item)`` to hand ``item`` to the fetch stage,
+    or ``(False, result)`` to finish the query with ``result`` right away. The fetch
+    stage returns the result of the query. Stages are expected to handle their own
+    errors; a query whose stage raises anyway finishes with result None.
+    """
+
+    def __init__(
+        self,
+        resolve: Callable[[str], tuple[bool, Any]],
+        fetch: Callable[[str, Any], Any],
+        resolve_workers: int = 1,
+        fetch_workers: int = 1,
+        queue_size: int | None = None,
+    ):
+        """Initialises the pipeline.
+
+        Args:
+            resolve (callable): Resolve stage, called with a query
+            fetch (callable): Fetch stage, called with a query and its resolved item
+            resolve_workers (int): Number of resolve worker threads
+            fetch_workers (int): Number of fetch worker threads
+            queue_size (int): Capacity of each stage's queue, twice its workers if None
+        """
+        if resolve_workers < 1 or fetch_workers < 1:
+            raise ValueError("every stage needs at least one worker.")
+
+        self._resolve = resolve
+        self._fetch = fetch
+        self._resolve_workers = resolve_workers
+        self._fetch_workers = fetch_workers
+        self._resolve_queue: queue.Queue = queue.Queue(
+            queue_size or 2 * resolve_workers
+        )
+        self._fetch_queue: queue.Queue = queue.Queue(queue_size or 2 * fetch_workers)
+        self._results: queue.Queue = queue.Queue()
+        self._stopped = threading.Event()
+        self._feed_error: BaseException | None = None
+
+    def _put(self, q: queue.Queue, item) -> bool:
+        """Put ``item`` on a bounded queue unless the pipeline is stopped."""
+        while not self._stopped.is_set():
+            try:
+                q.put(item, timeout=POLL_INTERVAL)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _get(self, q: queue.Queue):
+        """Get an item from a queue, or ``_DONE`` once the pipeline is stopped."""
+        while not self._stopped.is_set():
+            try:
+                return q.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                pass
+        return _DONE
+
+    def _resolve_worker(self):
+        while (query := self._get(self._resolve_queue)) is not _DONE:
+            try:
+                forward, item = self._resolve(query)
+            except Exception:
+                logging.exception(f"Resolve stage failed for query: {query}")
+                forward, item = False, None
+
+            if forward:
+                self._put(self._fetch_queue, (query, item))
+            else:
+                self._results.put((query, item))
+
+    def _fetch_worker(self):
+        while (job := self._get(self._fetch_queue)) is not _DONE:
+            query, item = job
+            try:
+                result = self._fetch(query, item)
+            except Exception:
+                logging.exception(f"Fetch stage failed for query: {query}")
+                result = None
+            self._results.put((query, result))
+
+    def _start(self, target: Callable, n: int, name: str) -> list[threading.Thread]:
+        threads = [
+            threading.Thread(target=target, name=f"{name}-{i}", daemon=True)
+            for i in range(n)
+        ]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def _feed(self, queries: Iterable[str], resolvers: list[threading.Thread]):
+        """Feed all queries to the resolve stage, then shut both stages down in order."""
+        try:
+            for query in queries:
+                if not self._put(self._resolve_queue, query):
+                    return
+        except BaseException as err:
+            # reading the input failed, stop everything and re-raise in run()
+            self._feed_error = err
+            self._stopped.set()
+            return
+
+        for _ in resolvers:
+            self._put(self._resolve_queue, _DONE)
+        for thread in resolvers:
+            thread.join()
+        for _ in range(self._fetch_workers):
+            self._put(self._fetch_queue, _DONE)
+
+    def run(self, queries: Iterable[str]) -> Iterator[tuple[str, Any]]:
+        """Yield ``(query, result)`` pairs in order of completion.
+
+        Queries are read lazily from ``queries`` by a feeder thread. Closing the
+        iterator early, e.g. on KeyboardInterrupt, stops all workers; requests that
+        are in flight finish in the background and their results are dropped.
+
+        Args:
+            queries (iterable(str)): Queries to process
+
+        Returns:
+            iterator(tuple): Query and its result, as soon as it is done
+        """
+        resolvers = self._start(self._resolve_worker, self._resolve_workers, "resolve")
+        fetchers = self._start(self._fetch_worker, self._fetch_workers, "fetch")
+        feeder = self._start(lambda: self._feed(queries, resolvers), 1, "feed")[0]
+
+        try:
+            while True:
+                try:
+                    yield self._results.get(timeout=POLL_INTERVAL)
+                except queue.Empty:
+                    if not feeder.is_alive() and not any(
+                        thread.is_alive() for thread in fetchers
+                    ):
+                        break
+
+            # results that arrived after the last check
+            while not self._results.empty():
+                yield self._results.get()
+
+            if self._feed_error is not None:
+                raise self._feed_error
+        finally:
+            self._stopped.set()
@@ -1,132 +1,654 @@
 """Main module."""
 
-import csv
+import asyncio
 import logging
+import os
 import re
+import threading
+import time
 import unicodedata
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
-from typing import List, TypedDict, Union
+from typing import AsyncIterator, Iterable, Iterator, List, TypedDict, Union
+from urllib.parse import urlsplit
 
 import click
 import requests
-from bs4 import BeautifulSoup
 
-from .tools import extract_valid_query, valid_fn
-
-
-class Result(TypedDict):
-    citation: str | None
-    link: str | None
-    pdf: str | None
+from .cache import ResolutionCache
+from .extract import Result, extract_data, page_status
+from .manifest import CSV_NAME, Manifest, Reason, manifest_name
+from .metrics import Metrics, Profiler
+from .mirrors import MirrorPool
+from .pipeline import Pipeline
+from .ratelimit import RateLimiter
+from .resume import PARTIAL_NAME, InvalidPdf, PartialDownloads, validate_pdf
+from .store import PdfStore, SingleFlight
+from .transport import Transport
+from .titles import TitleIndex
+from .tools import (
+    Classification,
+    Query,
+    QueryType,
+    canonical_key,
+    classify_query,
+    normalize_query,
+    query_text,
+    valid_fn,
+)
+
+# downloads of a PDF per query, interrupted downloads are resumed
+PDF_ATTEMPTS = 3
+# failures that are queued again in the next run instead of being recorded
+REQUEUE = frozenset({Reason.INTERRUPTED, Reason.INVALID_PDF})
+FAILURES = frozenset(reason.value for reason in Reason)
+
+
+class Resolved(TypedDict):
+    key: str
+    clean_query: str
+    data: Result
+    cached: bool
+
+
+class Download(TypedDict):
+    """Result of a single query, as yielded by ``SciHub.iter_download``.
+
+    ``status`` is ``"success"``, ``"existing"`` (downloaded before), ``"skipped"``
+    (failed before and not due for a retry), ``"failed"`` (unknown error) or the
+    value of the ``manifest.Reason`` the query failed for. ``key`` is the canonical
+    query, ``data`` the citation, link and PDF link if the query was resolved and
+    ``size`` the size of the PDF in bytes.
+    """
+
+    query: str
+    key: str
+    status: str
+    data: Result | None
+    pdf_path: str | None
+    resolve_time: float
+    fetch_time: float
+    size: int
+
+
+class _QueryState(threading.local):
+    """Reason of failure, resolved data and timings of the query a thread works on"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.reason: Reason | None = None
+        self.data: Result | None = None
+        self.timings = {"resolve": 0.0, "fetch": 0.0}
+
+
+class _Schedule(object):
+    """Keys of the queries being looked up and the variants waiting for their result
+
+    Queries are filtered on the pipeline's feeder thread while results arrive on the
+    consumer's, so both hold the lock. A key is dropped as soon as its result is in,
+    so memory stays bounded by the queries in flight instead of the whole input.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.keys: set[str] = set()
+        self.held: deque[tuple[str, str]] = deque()
 
 
 class SciHub(object):
     """The SciHub object can be used to download PDFs from SciHub after initialisation."""
 
-    def __init__(self, url: str, output: Path):
+    def __init__(
+        self,
+        url: str | list[str],
+        output: Path,
+        host_limit: int = 4,
+        transport: Transport | None = None,
+        cache: ResolutionCache | None = None,
+        rate_limiters: dict[str, RateLimiter] | None = None,
+        metrics: Metrics | None = None,
+        profiler: Profiler | None = None,
+        manifest_suffix: str = "",
+        store: PdfStore | None = None,
+        titles: TitleIndex | None = None,
+    ):
         """Initialises the SciHub object with the Sci-Hub url ``url`` and writes all PDFs to the ``output_path`` folder.
 
         Args:
-            url (str): Sci-Hub URL to use
+            url (str or list(str)): Sci-Hub URL or list of mirror URLs to use
             output_path (Path): The folder to download all PDFs to
+            host_limit (int): Maximum number of in-flight requests per host
+            transport (Transport): Pooled HTTP transport for search and PDF requests
+            cache (ResolutionCache): Cache of resolved queries to skip repeated searches
+            rate_limiters (dict): Rate limiter per mirror URL, default is adaptive
+            metrics (Metrics): Collects phase durations and outcome counts
+            profiler (Profiler): Profiles the handling of every query when given
+            manifest_suffix (str): Suffix of the manifest files, used by shards
+            store (PdfStore): Store PDFs once by content and link citation names to it
+            titles (TitleIndex): Resolve title queries to DOIs locally before searching
         """
         # make sure that the output path exists
         output.mkdir(parents=True, exist_ok=True)
 
-        self._url = url
+        self.mirrors = MirrorPool(
+            [url] if isinstance(url, str) else url, limiters=rate_limiters
+        )
         self._output_path = output
-        self.session = requests.Session()
+        self.transport = transport if transport is not None else Transport()
+        self.session = self.transport.session
+        self.cache = cache
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.profiler = profiler
+        self.store = store
+        self.titles = titles
+        self.partials = PartialDownloads(output / PARTIAL_NAME)
+
+        self._manifest: Manifest | None = None
+        self._manifest_suffix = manifest_suffix
+
+        self._host_limit = host_limit
+        self._host_semaphores: dict[str, threading.BoundedSemaphore] = dict()
+        self._host_lock = threading.Lock()
+        self._pdf_downloads = SingleFlight()
+        self._current = _QueryState()
+
+    def download(
+        self,
+        queries: Union[List[Query], Iterator[Query], Query],
+        concurrency: int = 1,
+        resolve_workers: int | None = None,
+        fetch_workers: int | None = None,
+        retry_failed: bool = False,
+    ):
+        """Download articles for provided queries with a progress bar
+
+        See ``iter_download`` for the arguments; the results are only recorded in the
+        manifest and ``pdf_paths.csv``.
+
+        Raises:
+            ValueError: If argument is not a string, list or iterator of strings
+        """
+        queries = self._check_queries(queries)
+        results = self.iter_download(
+            queries,
+            concurrency=concurrency,
+            resolve_workers=resolve_workers,
+            fetch_workers=fetch_workers,
+            retry_failed=retry_failed,
+        )
+        progressbar = click.progressbar(
+            results,
+            length=len(queries) if isinstance(queries, list) else None,
+            item_show_func=self._show_rate,
+        )
+
+        try:
+            with progressbar as bar:
+                for _ in bar:
+                    pass
+        except (KeyboardInterrupt, SystemExit):
+            logging.info(
+                f"Exiting program. Saving PDF information to {self._output_path}."
+            )
 
-    def download(self, queries: Union[List[str], str]):
-        """Download articles for provided queries
+    def iter_download(
+        self,
+        queries: Union[List[Query], Iterator[Query], Query],
+        concurrency: int = 1,
+        resolve_workers: int | None = None,
+        fetch_workers: int | None = None,
+        retry_failed: bool = False,
+    ) -> Iterator[Download]:
+        """Download articles for provided queries and yield a result per query as it completes
+
+        Iterators (e.g. ``tools.iter_queries`` over a file) are consumed lazily, so the
+        first download starts before the whole input has been read. Every result is
+        committed to the manifest before it is yielded.
+
+        With more than one worker, searches and PDF downloads run as separate pipeline
+        stages, each with its own workers, so slow PDFs do not hold up new searches.
+        Results are then yielded in order of completion.
+
+        Queries that were downloaded before are yielded right away with status
+        ``"existing"``. Queries that failed permanently before (e.g. article not found)
+        are yielded with status ``"skipped"``, transient failures too until their retry
+        backoff has passed. A variant of a query that is still running gets a copy of its
+        result, later variants are skipped like earlier downloads.
 
         Args:
-            queries (list(str)): List of queries to look up
+            queries (list(str)): List or iterator of queries to look up, a query may
+                be a ``Classification`` if its type is known, e.g. from a library
+            concurrency (int): Number of queries to handle at the same time
+            resolve_workers (int): Number of search workers, defaults to ``concurrency``
+            fetch_workers (int): Number of PDF download workers, defaults to ``concurrency``
+            retry_failed (bool): Retry all earlier failures, ignoring their backoff
+
+        Returns:
+            iterator(dict): The result of every query
 
         Raises:
-            ValueError: If argument is not a string or list of strings
+            ValueError: If argument is not a string, list or iterator of strings, or
+                if a profiler is given and there is more than one worker
         """
-        # make sure queries is of the right format
-        if isinstance(queries, str):
-            queries = list(queries)
-        elif not isinstance(queries, list):
-            raise ValueError("queries argument should be a list or a single string.")
+        queries = self._check_queries(queries)
+        if concurrency < 1:
+            raise ValueError("concurrency argument should be at least 1.")
+        resolve_workers = resolve_workers or concurrency
+        fetch_workers = fetch_workers or concurrency
+        if self.profiler is not None and max(resolve_workers, fetch_workers) > 1:
+            raise ValueError("Profiling needs a single worker.")
+
+        return self._iter_results(queries, resolve_workers, fetch_workers, retry_failed)
+
+    async def aiter_download(
+        self,
+        queries: Union[List[Query], Iterator[Query], Query],
+        concurrency: int = 1,
+        resolve_workers: int | None = None,
+        fetch_workers: int | None = None,
+        retry_failed: bool = False,
+    ) -> AsyncIterator[Download]:
+        """Asynchronous version of ``iter_download``
+
+        The downloads run on a worker thread, so the event loop is free while waiting
+        for the next result.
+        """
+        results = self.iter_download(
+            queries,
+            concurrency=concurrency,
+            resolve_workers=resolve_workers,
+            fetch_workers=fetch_workers,
+            retry_failed=retry_failed,
+        )
+        loop = asyncio.get_running_loop()
+        # a single thread advances the generator, so closing it waits for the last step
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="download")
+        try:
+            while (
+                result := await loop.run_in_executor(executor, next, results, None)
+            ) is not None:
+                yield result
+        finally:
+            executor.submit(results.close)
+            executor.shutdown(wait=False)
+
+    def _check_queries(
+        self, queries: Union[List[Query], Iterator[Query], Query]
+    ) -> List[Query] | Iterator[Query]:
+        """Make sure queries is a list or an iterator of queries
 
+        Raises:
+            ValueError: If argument is not a string, list or iterator of strings
+        """
+        if isinstance(queries, (str, Classification)):
+            return [queries]
+        elif not isinstance(queries, (list, Iterator)):
+            raise ValueError(
+                "queries argument should be a list, an iterator or a single string."
+            )
+        return queries
+
+    def _iter_results(
+        self,
+        queries: Iterable[Query],
+        resolve_workers: int,
+        fetch_workers: int,
+        retry_failed: bool,
+    ) -> Iterator[Download]:
+        """Generator behind ``iter_download``, see there"""
         # get existing downloads or create empty dict for pdf locations
         pdf_paths = self._get_pdf_paths()
+        if not retry_failed:
+            pdf_paths.update(self._get_failures())
 
-        # remove queries that have a valid pdf file already
-        queries = self._exclude_existing_queries(queries, pdf_paths)
+        # queries that are not looked up wait here for their result
+        schedule = _Schedule()
+        queries = self._exclude_existing_queries(queries, pdf_paths, schedule)
+
+        if resolve_workers == 1 and fetch_workers == 1:
+            results = map(self._download_query, queries)
+        else:
+            pipeline = Pipeline(
+                self._resolve_stage,
+                self._fetch_stage,
+                resolve_workers=resolve_workers,
+                fetch_workers=fetch_workers,
+            )
+            results = (
+                self._outcome(query, None) if result is None else result
+                for query, result in pipeline.run(queries)
+            )
 
         try:
-            with click.progressbar(queries) as bar:
-                for query in bar:
-                    try:
-                        pdf_path = self._fetch_search(query)
-                        if pdf_path:
-                            pdf_paths[query] = pdf_path
-                    except (KeyboardInterrupt, SystemExit) as err:
-                        raise err
-                    except:
-                        logging.error(f"Something went wrong for query: {query}")
-                        pdf_paths[query] = ""
-        except (KeyboardInterrupt, SystemExit):
+            for result in results:
+                yield from self._release(schedule, pdf_paths)
+                self._store_result(pdf_paths, result)
+                yield result
+                yield from self._release(schedule, pdf_paths, result)
+            yield from self._release(schedule, pdf_paths)
+        finally:
+            self._save_pdf_paths()
+
+            stats = self.transport.stats()
             logging.info(
-                f"Exiting program. Saving PDF information to {self._output_path}."
+                f"Sent {stats['requests']} requests: {stats['connections_opened']} "
+                f"connections opened, {stats['connections_reused']} reused."
             )
+
+    def _release(
+        self,
+        schedule: _Schedule,
+        pdf_paths: dict[str, str],
+        result: Download | None = None,
+    ) -> list[Download]:
+        """Return the results of held queries that are known by now
+
+        The key of ``result`` is no longer scheduled afterwards: later variants are
+        skipped if it was recorded, and looked up again otherwise.
+
+        Args:
+            schedule (_Schedule): Scheduled keys and the queries held for them
+            pdf_paths (dict): Dictionary of paths to the downloaded PDFs by query key
+            result (dict): Result that just came in, its waiting variants get a copy
+
+        Returns:
+            list(dict): Results of the released queries
+        """
+        released = []
+        with schedule.lock:
+            if result is not None:
+                schedule.keys.discard(result["key"])
+            for _ in range(len(schedule.held)):
+                query, key = schedule.held.popleft()
+                if result is not None and key == result["key"]:
+                    released.append({**result, "query": query})
+                elif key in pdf_paths:
+                    released.append(self._skipped(query, key, pdf_paths[key]))
+                else:
+                    # the query it is a variant of is still running
+                    schedule.held.append((query, key))
+        return released
+
+    def _skipped(self, query: str, key: str, pdf_path: str) -> Download:
+        """Result of a query that is not looked up
+
+        Args:
+            query (str): Query that was skipped
+            key (str): Canonical key of the query
+            pdf_path (str): Earlier download of the key, empty if it failed
+
+        Returns:
+            dict: Result with status "existing", or "skipped" after a failure
+        """
+        return {
+            "query": query,
+            "key": key,
+            "status": "existing" if pdf_path else "skipped",
+            "data": None,
+            "pdf_path": pdf_path or None,
+            "resolve_time": 0.0,
+            "fetch_time": 0.0,
+            "size": 0,
+        }
+
+    def _show_rate(self, _) -> str:
+        """Show the search rate of the preferred mirror next to the progress bar"""
+        return f"{self.mirrors.ranked()[0].limiter.rate:.2f} req/s"
+
+    def _download_query(self, query: Query) -> Download:
+        """Look up a single query and never raise for a failing download
+
+        Args:
+            query (str or Classification): Query to look up
+
+        Returns:
+            dict: The result of the query
+        """
+        self._current.reset()
+        return self._outcome(query, self._run_safely(self._fetch_search, query))
+
+    def _resolve_stage(self, query: Query) -> tuple[bool, Download | tuple]:
+        """Pipeline resolve stage: only resolved queries move on to the fetch stage"""
+        self._current.reset()
+        with self._timed("resolve"):
+            resolved = self._run_safely(self._resolve_query, query)
+        if isinstance(resolved, dict):
+            return True, (resolved, self._outcome(query, None))
+        return False, self._outcome(query, resolved)
+
+    def _fetch_stage(self, query: Query, item: tuple[Resolved, Download]) -> Download:
+        """Pipeline fetch stage: download the PDF of a resolved query"""
+        resolved, previous = item
+        self._current.reset()
+        with self._timed("fetch"):
+            pdf_path = self._run_safely(self._fetch_resolved, query, resolved)
+        return self._outcome(query, pdf_path, previous)
+
+    def _run_safely(self, func, query: Query, *args):
+        """Call ``func`` for ``query`` and never raise for a failing download
+
+        Args:
+            func (callable): Step of the download to run
+            query (str): Query the step is run for
+
+        Returns:
+            The result of ``func``, or the reason of the failure if it returned None
+        """
+        try:
+            if self.profiler is not None:
+                result = self.profiler.call(func, query, *args)
+            else:
+                result = func(query, *args)
+        except Exception as err:
+            logging.error(f"Something went wrong for query: {query_text(query)}")
+            if isinstance(err, requests.RequestException):
+                self._fail(Reason.CONNECTION_ERROR)
+            else:
+                self._fail(Reason.ERROR)
+            result = None
+
+        return self._current.reason if result is None else result
+
+    @contextmanager
+    def _timed(self, stage: str):
+        """Add the duration of the block to the current query's ``stage`` time"""
+        start = time.perf_counter()
+        try:
+            yield
         finally:
-            self._save_pdf_paths(pdf_paths)
+            self._current.timings[stage] += time.perf_counter() - start
+
+    def _fail(self, reason: Reason):
+        """Count a failed attempt and remember it as the reason the current query failed"""
+        self.metrics.count_failure(reason.value)
+        self._current.reason = reason
+
+    def _outcome(
+        self,
+        query: Query,
+        result: str | Reason | None,
+        previous: Download | None = None,
+    ) -> Download:
+        """Build the result of a query from the state of the current thread
+
+        Args:
+            query (str or Classification): Query that was looked up
+            result (str): File location of downloaded PDF, the reason it failed or
+                None if the query is not done yet or failed for an unknown reason
+            previous (dict): Result of the resolve stage to add to
+
+        Returns:
+            dict: The result of the query
+        """
+        if isinstance(result, Reason):
+            status, pdf_path = result.value, None
+        elif result is None:
+            status, pdf_path = "failed", None
+        else:
+            status, pdf_path = "success", result
+
+        size = 0
+        if pdf_path is not None:
+            try:
+                size = os.path.getsize(pdf_path)
+            except OSError:
+                pass
+
+        timings = self._current.timings
+        data = self._current.data
+        if previous is not None:
+            timings = {
+                stage: previous[f"{stage}_time"] + timings[stage] for stage in timings
+            }
+            data = data or previous["data"]
+
+        return {
+            "query": query_text(query),
+            "key": canonical_key(query),
+            "status": status,
+            "data": data,
+            "pdf_path": pdf_path,
+            "resolve_time": timings["resolve"],
+            "fetch_time": timings["fetch"],
+            "size": size,
+        }
+
+    def _store_result(self, pdf_paths: dict[str, str], result: Download):
+        """Record the result of a query in ``pdf_paths`` and commit it to the manifest
+
+        Interrupted and invalid PDF downloads are not recorded, so they are queued
+        again (and resumed) in the next run. The outcome is counted here, once per
+        query that was looked up.
+
+        Args:
+            pdf_paths (dict): Dictionary of paths to the downloaded PDFs by query key
+            result (dict): The result of the query
+        """
+        query, key, status = result["query"], result["key"], result["status"]
+        self.metrics.count(status)
+        if status == "success":
+            pdf_paths[key] = result["pdf_path"]
+            self.manifest.record(query, result["pdf_path"], key)
+        elif status in FAILURES and Reason(status) not in REQUEUE:
+            pdf_paths[key] = ""
+            self.manifest.record_failure(query, Reason(status), key)
+
+    def _host_slot(self, url: str) -> threading.BoundedSemaphore:
+        """Return the semaphore limiting in-flight requests to the host of ``url``
+
+        Args:
+            url (str): URL that is about to be requested
+
+        Returns:
+            BoundedSemaphore: Semaphore shared by all requests to the same host
+        """
+        host = urlsplit(url).netloc
+        with self._host_lock:
+            if host not in self._host_semaphores:
+                self._host_semaphores[host] = threading.BoundedSemaphore(
+                    self._host_limit
+                )
+            return self._host_semaphores[host]
+
+    @property
+    def manifest(self) -> Manifest:
+        """Manifest of the output folder, opened (and migrated) on first use."""
+        if self._manifest is None:
+            self._manifest = Manifest.open(self._output_path, self._manifest_suffix)
+        return self._manifest
 
     def _get_pdf_paths(self) -> dict[str, str]:
-        """Checks for existing pdf_path file or return empty one
+        """Read the existing downloads from the manifest
+
+        Files in the output folder are listed with a single ``os.scandir`` pass instead
+        of a stat call per row, which is slow for big manifests on network
+        filesystems. Only PDFs stored elsewhere are checked one by one.
 
         Returns:
-            dict: Dictionary containing existing PDFs
+            dict: Dictionary containing existing PDFs by canonical query key
         """
-        f_path = self._output_path / "pdf_paths.csv"
         pdf_paths: dict[str, str] = dict()
 
-        if f_path.is_file():
-            logging.debug("pdf_paths.csv file detected.")
-            with open(f_path, newline="") as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if row["pdf_path"] != "":
-                        if Path(row["pdf_path"]).is_file():
-                            pdf_paths[row["query"]] = row["pdf_path"]
+        output_path = str(self._output_path.resolve())
+        with os.scandir(output_path) as entries:
+            files = {entry.name for entry in entries if entry.is_file()}
+
+        for key, pdf_path in self.manifest.results():
+            if pdf_path == "":
+                continue
+
+            folder, name = os.path.split(pdf_path)
+            if folder == output_path:
+                exists = name in files
+            else:
+                exists = os.path.isfile(pdf_path)
+            if exists:
+                pdf_paths[key] = pdf_path
 
         return pdf_paths
 
-    def _save_pdf_paths(self, pdf_paths: dict[str, str]):
-        """Saves the queries and corresponding paths to the PDFs after downloading
+    def _get_failures(self) -> dict[str, str]:
+        """Read the earlier failures that should not be retried yet
 
-        Args:
-            pdf_paths (dict): Dictionary of paths to the downloaded PDFs
+        Returns:
+            dict: Empty PDF location by canonical query key
         """
-        f_path = self._output_path / "pdf_paths.csv"
+        now = time.time()
+        return {
+            key: ""
+            for key, _, _, next_attempt in self.manifest.failures()
+            if next_attempt is None or next_attempt > now
+        }
 
-        if len(pdf_paths.keys()) > 0:
-            with open(f_path, "w") as f:
-                w = csv.writer(f)
-                w.writerow(["query", "pdf_path"])
-                for k, v in pdf_paths.items():
-                    w.writerow([k, v])
+    def _save_pdf_paths(self):
+        """Export the manifest to pdf_paths.csv after downloading
+
+        Results are already committed to the manifest one by one; the CSV export
+        keeps the output folder readable for tools that expect the old format.
+        """
+        if len(self.manifest) > 0:
+            self.manifest.export_csv(
+                self._output_path / manifest_name(CSV_NAME, self._manifest_suffix)
+            )
 
     def _exclude_existing_queries(
-        self, queries: list[str], pdf_paths: dict[str, str]
-    ) -> list[str]:
+        self,
+        queries: Iterable[Query],
+        pdf_paths: dict[str, str],
+        schedule: _Schedule,
+    ) -> Iterator[Query]:
         """Remove queries of which we already have a PDF file
 
+        Queries are compared by canonical key, so variants of a downloaded query and
+        of a query earlier in this run are skipped too. Skipped variants are mapped to
+        the result of their key in the manifest.
+
         Args:
-            queries (list(str)): List of queries to look up
-            pdf_paths (dict): Dictionary of paths to the downloaded PDFs
+            queries (iterable(str or Classification)): Queries to look up
+            pdf_paths (dict): Dictionary of paths to the downloaded PDFs by query key
+            schedule (_Schedule): Keys being looked up, collects the skipped queries
 
         Returns:
-            list(str): Filtered list of queries
+            iterator(str or Classification): Lazily filtered queries
         """
-        return [query for query in queries if query not in pdf_paths.keys()]
-
-    def _fetch_search(self, query: str):
+        for query in queries:
+            key = canonical_key(query)
+            with schedule.lock:
+                # a key leaves the schedule only after it is added to pdf_paths
+                skip = key in schedule.keys or key in pdf_paths
+                if skip:
+                    self.manifest.alias(query_text(query), key)
+                    schedule.held.append((query_text(query), key))
+                else:
+                    schedule.keys.add(key)
+            if not skip:
+                yield query
+
+    def _fetch_search(self, query: Query):
         """Try to find page and return PDF location if succeeded
 
         Args:
@@ -135,79 +657,184 @@ class SciHub(object):
         Returns:
             str: File location of downloaded PDF corresponding to query
         """
-        clean_query = extract_valid_query(query)
+        with self._timed("resolve"):
+            resolved = self._resolve_query(query)
+        if resolved is None:
+            return None
+        with self._timed("fetch"):
+            return self._fetch_resolved(query, resolved)
+
+    def _resolve_query(self, query: Query) -> Resolved | None:
+        """Turn a query into a PDF link, from the cache or by searching Sci-Hub
+
+        Args:
+            query (str or Classification): Query to look up, a line is classified
+                first
+
+        Returns:
+            dict: The resolved query, None if it could not be resolved
+        """
+        if isinstance(query, Classification):
+            classification = query
+        else:
+            with self.metrics.time("classify"):
+                classification = classify_query(query)
+        clean_query = classification.query
         if not clean_query:
+            self._fail(Reason.INVALID_QUERY)
             logging.error(
-                f"Could not extract valid query from: {query}. Try providing a valid URL, doi or title."
+                f"Could not extract valid query from: {query_text(query)}. Try providing a valid URL, doi or title."
             )
             return None
-        else:
-            response = self.session.post(self._url, data={"request": clean_query})
-            return self._handle_response(response)
 
-    def _handle_response(self, response: requests.Response) -> str | None:
-        """Handle a valid response
+        # a title found in the local index is searched by its DOI instead
+        if classification.type is QueryType.TITLE and self.titles is not None:
+            with self.metrics.time("title_lookup"):
+                match = self.titles.lookup(clean_query)
+            if match is not None:
+                logging.debug(f"Resolved title {clean_query} to {match.doi}.")
+                classification = Classification(QueryType.DOI, match.doi)
+                clean_query = match.doi
+
+        key = normalize_query(classification)
+
+        # a cache hit skips the search
+        if self.cache is not None and (data := self.cache.get(key)) is not None:
+            self._current.data = data
+            return {
+                "key": key,
+                "clean_query": clean_query,
+                "data": data,
+                "cached": True,
+            }
+
+        data = self._resolve(clean_query)
+        if data is None:
+            return None
+        if self.cache is not None:
+            self.cache.put(key, data)
+        return {"key": key, "clean_query": clean_query, "data": data, "cached": False}
+
+    def _fetch_resolved(self, query: Query, resolved: Resolved) -> str | None:
+        """Download the PDF of a resolved query
 
         Args:
-            response (Response): requests.Response object
+            query (str or Classification): Query that was resolved
+            resolved (dict): The resolved query
 
         Returns:
             str: File location of downloaded PDF corresponding to query
         """
-        if response.status_code != 200:
-            logging.error(f"Could not connect to Sci-Hub via: {response.url}")
-            return None
-        else:
-            # if status code is okay then transform into beautiful soup
-            soup = BeautifulSoup(response.text, features="lxml")
-            if self._page_is_valid(soup):
-                data = self._extract_data(soup)
-                if self._data_is_valid(data):
-                    return self._save_pdf(data)
+        pdf_path = self._save_pdf(resolved["data"])
 
-            return None
+        # search again if the cached PDF link stopped working
+        if pdf_path is None and resolved["cached"]:
+            logging.info(
+                f"Cached PDF link failed, searching again for: {query_text(query)}"
+            )
+            self.cache.delete(resolved["key"])
+            data = self._resolve(resolved["clean_query"])
+            if data is None:
+                return None
+            self.cache.put(resolved["key"], data)
+            pdf_path = self._save_pdf(data)
+
+        return pdf_path
+
+    def _search(self, clean_query: str) -> bytes | None:
+        """Send the search to the healthiest mirror, failing over to the next ones
+
+        A mirror fails when the request times out or errors, returns a status other
+        than 200 or shows a CAPTCHA. Its score is updated so later queries avoid it.
+
+        Args:
+            clean_query (str): DOI, URL or title to search for
+
+        Returns:
+            bytes: Raw body of the search page or None if every mirror failed
+        """
+        for mirror in self.mirrors.ranked():
+            mirror.limiter.acquire()
+            start = time.monotonic()
+            try:
+                with self._host_slot(mirror.url), self.metrics.time("search"):
+                    response = self.transport.post(
+                        mirror.url, data={"request": clean_query}
+                    )
+                    page = response.content
+            except requests.RequestException as err:
+                logging.warning(f"Could not connect to Sci-Hub via {mirror.url}: {err}")
+                self._fail(Reason.CONNECTION_ERROR)
+                self.mirrors.record_failure(mirror)
+                continue
+
+            if response.status_code != 200:
+                logging.error(f"Could not connect to Sci-Hub via: {response.url}")
+                self._fail(Reason.HTTP_ERROR)
+                self.mirrors.record_failure(mirror)
+                if response.status_code == 429 or response.status_code >= 500:
+                    mirror.limiter.on_throttle()
+            elif page_status(page) == "captcha":
+                logging.warning(f"Could not open page due to CAPTCHA on {mirror.url}.")
+                self._fail(Reason.CAPTCHA)
+                self.mirrors.record_failure(mirror)
+                mirror.limiter.on_throttle()
+            else:
+                self.mirrors.record_success(mirror, time.monotonic() - start)
+                mirror.limiter.on_success()
+                return page
+
+        logging.error(f"No Sci-Hub mirror could handle query: {clean_query}")
+        return None
+
+    def _resolve(self, clean_query: str) -> Result | None:
+        """Search for the query and extract the citation, URL and PDF link
+
+        Args:
+            clean_query (str): DOI, URL or title to search for
 
-    def _page_is_valid(self, soup: BeautifulSoup) -> bool:
-        """Sometimes we cannot find the article or we need to solve a CAPTCHA
+        Returns:
+            dict: A dictionary containing the citation, URL and PDF link
+        """
+        page = self._search(clean_query)
+
+        # work on the raw bytes, the full HTML parse is only a fallback
+        if page is not None and self._page_is_valid(page):
+            with self.metrics.time("parse"):
+                data = self._extract_data(page)
+            self._current.data = data
+            if self._data_is_valid(data):
+                return data
+
+        return None
+
+    def _page_is_valid(self, page: bytes) -> bool:
+        """Sometimes we cannot find the article
+
+        CAPTCHA pages never get here, ``_search`` fails over to the next mirror.
 
         Args:
-            soup (BeautifulSoup): Soup of the requested search query
+            page (bytes): Raw body of the requested search query
 
         Returns:
-            bool: True if shown page is not a missing article or CAPTCHA page
+            bool: True if shown page is not a missing article page
         """
-        if re.search(r"article not found", soup.get_text()):
+        if page_status(page) == "not_found":
+            self._fail(Reason.NOT_FOUND)
             logging.warn(f"Could not find article.")
             return False
-        elif re.search(r"Для просмотра статьи разгадайте капчу", soup.get_text()):
-            logging.warn(f"Could not open page due to CAPTCHA.")
-            return False
-        else:
-            return True
+        return True
 
-    def _extract_data(self, soup: BeautifulSoup) -> Result:
+    def _extract_data(self, page: bytes) -> Result:
         """Extract citation, URL and PDF link from page
 
         Args:
-            soup (BeautifulSoup): Soup of the requested search query
+            page (bytes): Raw body of the requested search query
 
         Returns:
             dict: A dictionary containing the citation, URL and PDF link
         """
-        URL_REGEX = r"(?i)\b((?:https?://|www\d{0,3}[.]|[a-z0-9.\-]+[.][a-z]{2,4}/)(?:[^\s()<>]+|\(([^\s()<>]+|(\([^\s()<>]+\)))*\))+(?:\(([^\s()<>]+|(\([^\s()<>]+\)))*\)|[^\s`!()\[\]{};:'\".,<>?«»“”‘’]))"
-        pdf_url = re.findall(
-            URL_REGEX, soup.find("div", id="buttons").select("ul li a")[0]["onclick"]
-        )[0][0]
-
-        # if URL does not contain https, then add it
-        if not re.match(r"^https://", pdf_url):
-            pdf_url = f"https://{pdf_url}"
-
-        return {
-            "citation": soup.find("div", id="citation").get_text(),
-            "link": soup.find("div", id="link").find("a")["href"],
-            "pdf": pdf_url,
-        }
+        return extract_data(page)
 
     def _data_is_valid(self, data: Result):
         """Check if extracted data contains a valid PDF link
@@ -219,6 +846,7 @@ class SciHub(object):
             bool: True if data contains a PDF link
         """
         if data["pdf"] is None:
+            self._fail(Reason.NO_PDF)
             return False
         else:
             return True
@@ -235,28 +863,127 @@ class SciHub(object):
         # open PDF
         if data["pdf"] is None:
             logging.error(f"No PDF link found for: {data['citation']}")
+            self._fail(Reason.NO_PDF)
             return None
         if data["citation"] is None:
             logging.error(f"No citation found for: {data['pdf']}")
+            self._fail(Reason.NO_PDF)
             return None
 
-        response = requests.get(data["pdf"])
+        def download() -> tuple[str | None, Reason | None]:
+            pdf_path = self._download_pdf(data)
+            return pdf_path, self._current.reason
 
-        if response.status_code == 200:
-            fn_name = unicodedata.normalize("NFKD", data["citation"])
-            fn_name = re.sub(r"[^\w\s-]", "", fn_name).strip().lower()
-            fn_name = re.sub(r"[-\s]+", "-", fn_name)
-            fn_name = valid_fn(str(self._output_path.resolve()), fn_name)
-            fn_name = f"{fn_name}.pdf"
+        # concurrent queries resolving to the same PDF share one download
+        (pdf_path, reason), shared = self._pdf_downloads.do(data["pdf"], download)
+        if shared and pdf_path is not None:
+            logging.debug(f"Shared the download of {data['pdf']}.")
+        elif shared:
+            # fail like the query that downloaded, its attempts are counted there
+            self._current.reason = reason
+        return pdf_path
 
-            try:
-                with open(self._output_path / fn_name, "wb") as pdf:
-                    pdf.write(response.content)
+    def _download_pdf(self, data: Result) -> str | None:
+        """Download and check the PDF, retrying if it is interrupted or invalid
+
+        An interrupted download is resumed where it stopped. A PDF that is still
+        interrupted or invalid after the last attempt is not recorded, so the query is
+        tried again in the next run. A request that fails without receiving bytes that
+        can be resumed, e.g. to a PDF host that refuses connections, is a connection
+        error and backed off like one.
+
+        Args:
+            data (dict): A dictionary containing the citation, URL and PDF link
 
-                return str(self._output_path.resolve() / fn_name)
+        Returns:
+            str: File location of downloaded PDF corresponding to query
+        """
+        url = data["pdf"]
+        path = self._output_path / self._pdf_file_name(data["citation"])
+
+        for attempt in range(1, PDF_ATTEMPTS + 1):
+            received = self.partials.resumable_size(url)
+            try:
+                if not self._fetch_pdf(url, path):
+                    return None
+                return str(self._output_path.resolve() / path.name)
+            except InvalidPdf as err:
+                logging.warning(
+                    f"Invalid PDF from {url} ({err}), attempt {attempt} of {PDF_ATTEMPTS}."
+                )
+                self._fail(Reason.INVALID_PDF)
+                self.partials.discard(url)
+            except requests.RequestException as err:
+                # only a download that got further can be resumed
+                if self.partials.resumable_size(url) <= received:
+                    logging.error(f"Could not download PDF from {url}: {err}")
+                    self._fail(Reason.CONNECTION_ERROR)
+                    return None
+                logging.warning(
+                    f"Download of {url} interrupted, attempt {attempt} of {PDF_ATTEMPTS}."
+                )
+                self._fail(Reason.INTERRUPTED)
             except OSError as err:
                 logging.error(err.strerror)
-        else:
-            logging.error(f"Could not download PDF from: {data['pdf']}")
+                self._fail(Reason.OS_ERROR)
+                return None
 
         return None
+
+    def _fetch_pdf(self, url: str, path: Path) -> bool:
+        """Download the PDF at ``url`` to ``path``, resuming a partial download
+
+        The PDF is written to ``path``, or to the content-addressed store if there is
+        one, only after it passed ``validate_pdf``.
+
+        Args:
+            url (str): Link to the PDF
+            path (Path): Location of the PDF in the output folder
+
+        Returns:
+            bool: False if the server refused to send the PDF
+
+        Raises:
+            InvalidPdf: If the downloaded file is not a complete PDF
+            RequestException: If the download was interrupted
+        """
+        with self._host_slot(url):
+            with self.metrics.time("pdf_get"):
+                response = self.transport.get(
+                    url, stream=True, headers=self.partials.headers(url)
+                )
+
+            with response:
+                if response.status_code == 416:
+                    raise InvalidPdf("requested range not satisfiable")
+                if response.status_code not in (200, 206):
+                    logging.error(f"Could not download PDF from: {url}")
+                    self._fail(Reason.HTTP_ERROR)
+                    return False
+
+                with self.metrics.time("write"):
+                    part, size = self.partials.receive(url, response)
+
+        validate_pdf(part, size)
+        with self.metrics.time("write"):
+            if self.store is not None:
+                self.store.put_file(path, part)
+            else:
+                os.replace(part, path)
+        self.partials.discard(url)
+        return True
+
+    def _pdf_file_name(self, citation: str) -> str:
+        """Turn a citation into a valid file name for the PDF
+
+        Args:
+            citation (str): Citation of the article
+
+        Returns:
+            str: File name of the PDF inside the output folder
+        """
+        fn_name = unicodedata.normalize("NFKD", citation)
+        fn_name = re.sub(r"[^\w\s-]", "", fn_name).strip().lower()
+        fn_name = re.sub(r"[-\s]+", "-", fn_name)
+        fn_name = valid_fn(str(self._output_path.resolve()), fn_name)
+        return f"{fn_name}.pdf"
@@ -0,0 +1,82 @@
+"""Token bucket rate limiter adapting its rate to the responses of a mirror."""
+
+import logging
+import threading
+import time
+
+
+class RateLimiter(object):
+    """Token bucket with additive increase, multiplicative decrease (AIMD) of its rate.
+
+    Every clean response raises the rate by ``increase`` requests per second, every
+    CAPTCHA, HTTP 429 or 5xx response multiplies it by ``decrease``. The rate settles
+    just below the point where the mirror starts blocking.
+    """
+
+    def __init__(
+        self,
+        rate: float = 2.0,
+        min_rate: float = 0.05,
+        max_rate: float = 10.0,
+        increase: float = 0.1,
+        decrease: float = 0.5,
+        burst: float = 1.0,
+        name: str = "",
+    ):
+        """Initialises the rate limiter.
+
+        Args:
+            rate (float): Initial rate in requests per second
+            min_rate (float): Lower bound of the rate
+            max_rate (float): Upper bound of the rate
+            increase (float): Requests per second added after a clean response
+            decrease (float): Factor applied to the rate after a blocked response
+            burst (float): Maximum number of tokens that can be saved up
+            name (str): Name used in log messages, e.g. the mirror URL
+        """
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.burst = burst
+        self.name = name
+
+        self._lock = threading.Lock()
+        self._rate = min(max(rate, min_rate), max_rate)
+        self._tokens = burst
+        self._updated = time.monotonic()
+
+    @property
+    def rate(self) -> float:
+        """Current rate in requests per second."""
+        return self._rate
+
+    def acquire(self):
+        """Block until a request may be sent."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._updated) * self._rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self._rate
+
+            time.sleep(wait)
+
+    def on_success(self):
+        """Additive increase after a clean response."""
+        with self._lock:
+            self._rate = min(self._rate + self.increase, self.max_rate)
+
+    def on_throttle(self):
+        """Multiplicative decrease after a CAPTCHA, HTTP 429 or 5xx response."""
+        with self._lock:
+            self._rate = max(self._rate * self.decrease, self.min_rate)
+            self._tokens = min(self._tokens, 0.0)
+            rate = self._rate
+
+        logging.warning(f"Throttled by {self.name}, lowering rate to {rate:.2f} req/s.")
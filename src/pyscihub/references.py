@@ -0,0 +1,420 @@
+"""Streaming parsers for BibTeX, RIS and CSL-JSON reference libraries.
+
+Each parser reads its input line by line and yields a ``Reference`` per entry as
+soon as the entry is complete, so libraries of any size are read in constant
+memory. The query of a reference is its DOI, else its title, else its URL, and is
+passed on with its type so that e.g. a title is never searched as a DOI or cut short
+at its first period.
+"""
+
+import functools
+import itertools
+import json
+import logging
+import re
+from pathlib import Path
+from typing import IO, Iterable, Iterator, NamedTuple
+
+from .tools import Classification, Query, QueryType, classify_query, iter_queries
+
+FORMATS = ("lines", "bibtex", "ris", "csl-json")
+# characters of a CSL-JSON file read at once
+READ_SIZE = 65536
+# an array of objects, an array continuing on the next line or an object
+_JSON_START = re.compile(r'\[\s*(\{|$)|\{\s*"')
+SUFFIXES = {
+    ".bib": "bibtex",
+    ".bibtex": "bibtex",
+    ".ris": "ris",
+    ".json": "csl-json",
+    ".jsonl": "csl-json",
+}
+
+
+class Reference(NamedTuple):
+    doi: str | None
+    title: str | None
+    url: str | None = None
+
+    @property
+    def query(self) -> str | None:
+        """Query to download the reference with: DOI, title or URL."""
+        return self.doi or self.title or self.url
+
+    @property
+    def classification(self) -> Classification | None:
+        """Query of the reference with its type, taken from the field it came from.
+
+        Only the DOI field is classified, to pick the DOI out of e.g. a doi.org link.
+        """
+        doi = classify_query(self.doi) if self.doi else None
+        if doi is not None and doi.type is QueryType.DOI:
+            return doi
+        elif self.title:
+            return Classification(QueryType.TITLE, self.title)
+        elif self.url:
+            return Classification(QueryType.URL, self.url)
+        return doi
+
+
+def detect_format(name: str, first_line: str) -> str:
+    """Guess the format of a library from its file name, else from its first line.
+
+    Files with another extension, e.g. ``.txt``, are read line by line. A first line
+    is only taken for CSL-JSON if it starts a JSON array of objects or an object, so
+    numbered references like ``[1] Forbes, H., ...`` are read as lines.
+
+    Args:
+        name (str): File name, e.g. ``<stdin>`` if there is none
+        first_line (str): First non-blank line of the file
+
+    Returns:
+        str: One of ``FORMATS``
+    """
+    suffix = Path(name).suffix.lower()
+    if suffix:
+        return SUFFIXES.get(suffix, "lines")
+
+    line = first_line.lstrip("\ufeff").strip()
+    if line.startswith("@"):
+        return "bibtex"
+    elif _RIS_LINE.match(line):
+        return "ris"
+    elif _JSON_START.match(line) or _is_json(line):
+        return "csl-json"
+    return "lines"
+
+
+def _is_json(line: str) -> bool:
+    """Whether ``line`` is a whole JSON array or object, e.g. ``[]``."""
+    try:
+        return isinstance(json.loads(line), (list, dict))
+    except ValueError:
+        return False
+
+
+def read_queries(file: IO[str], format: str = "auto") -> Iterator[Query]:
+    """Lazily read the queries of a file of references in any of ``FORMATS``.
+
+    Plain lines are cleaned by ``tools.iter_queries`` and classified when they are
+    downloaded. The entries of a library are already classified by the field they
+    came from, entries without DOI, title or URL are skipped. A warning is logged if
+    a library has no entries at all, e.g. when its format was detected wrongly.
+
+    Args:
+        file (file): Text file of queries or references, e.g. stdin
+        format (str): One of ``FORMATS``, or "auto" to detect it
+
+    Returns:
+        iterator(str or Classification): Query of every reference
+    """
+    # look at the first non-blank line, then put the lines back in front
+    head = []
+    if format == "auto":
+        while line := file.readline():
+            head.append(line)
+            if line.strip():
+                break
+        name = getattr(file, "name", "")
+        format = detect_format(name, line)
+        logging.info(f"Reading {name or 'queries'} as {format}.")
+
+    if format == "csl-json":
+        # minified files are a single line, read them in chunks instead
+        chunks = iter(functools.partial(file.read, READ_SIZE), "")
+        references = iter_csl_json(itertools.chain(head, chunks))
+    elif format == "lines":
+        return iter_queries(itertools.chain(head, file))
+    else:
+        references = PARSERS[format](itertools.chain(head, file))
+    references = _warn_if_empty(references, format, getattr(file, "name", ""))
+    classifications = (ref.classification for ref in references)
+    return iter_queries(c for c in classifications if c is not None)
+
+
+def _warn_if_empty(
+    references: Iterable[Reference], format: str, name: str
+) -> Iterator[Reference]:
+    empty = True
+    for reference in references:
+        empty = False
+        yield reference
+    if empty:
+        logging.warning(
+            f"Found no {format} entries in {name or 'the queries'}, "
+            "use --format lines to read it line by line."
+        )
+
+
+# BibTeX
+
+
+_ENTRY_START = re.compile(r"@\s*([A-Za-z]+)\s*([{(])")
+_PARTIAL_START = re.compile(r"@\s*[A-Za-z]*\s*$")
+_FIELD_NAME = re.compile(r"[\s,]*([^\s=,{}()\"#]+)\s*=\s*")
+_BRACES = re.compile(r"[{}]")
+_BRACES_OR_PARENS = re.compile(r"[{}()]")
+_QUOTE_OR_BRACES = re.compile(r'["{}]')
+_CONCAT = re.compile(r"\s*(#\s*)?")
+_BARE_VALUE = re.compile(r"[^\s,#{}()\"]+")
+_LATEX_ACCENT = re.compile(r"\\[`'^\"~=.uvHckbdrt]\s*\{?([A-Za-z])\}?")
+_LATEX_COMMAND = re.compile(r"\\[A-Za-z]+\*?\s*")
+_LATEX_SYMBOL = re.compile(r"\\([&%$#_{}~])")
+_MONTHS = "jan feb mar apr may jun jul aug sep oct nov dec".split()
+
+
+def iter_bibtex(lines: Iterable[str]) -> Iterator[Reference]:
+    """Yield a reference for every entry of a BibTeX library.
+
+    ``@string`` macros are expanded, ``@comment`` and ``@preamble`` are skipped and
+    so is text outside of entries.
+    """
+    macros = {month: month for month in _MONTHS}
+    for kind, body in _bibtex_entries(lines):
+        if kind == "comment" or kind == "preamble":
+            continue
+
+        fields = _bibtex_fields(body, macros)
+        if kind == "string":
+            macros.update(fields)
+            continue
+
+        yield Reference(
+            _clean_doi(fields.get("doi")),
+            _clean_latex(fields.get("title")),
+            _clean_latex(fields.get("url")),
+        )
+
+
+def _bibtex_entries(lines: Iterable[str]) -> Iterator[tuple[str, str]]:
+    """Split a BibTeX library into (entry type, body) pairs, one entry at a time.
+
+    Like BibTeX itself, an entry that is not closed before a line starting a new
+    entry is skipped, so a missing brace does not swallow the rest of the file.
+    """
+    buffer = ""
+    # type and brace balance of the entry that continues on the next lines
+    kind, balance = None, 0
+    for line in lines:
+        if kind not in (None, "comment") and _ENTRY_START.match(line):
+            logging.warning(f"Skipped unterminated BibTeX entry: {buffer[:60]!r}")
+            buffer, kind = "", None
+        buffer += line
+        if kind is not None:
+            # only look for the end of the entry once its braces can be balanced
+            balance += line.count("{") - line.count("}")
+            if balance > 0:
+                continue
+
+        kind = None
+        while (mo := _ENTRY_START.search(buffer)) is not None:
+            end = _entry_end(buffer, mo.end(), mo.group(2))
+            if end is None:
+                buffer = buffer[mo.start() :]
+                kind = mo.group(1).lower()
+                # entries in parentheses are checked on every line
+                balance = (
+                    buffer.count("{") - buffer.count("}") if mo.group(2) == "{" else 0
+                )
+                break
+            yield mo.group(1).lower(), buffer[mo.end() : end]
+            buffer = buffer[end + 1 :]
+        else:
+            # keep a possible "@type" that continues with "{" on the next line
+            mo = _PARTIAL_START.search(buffer)
+            buffer = "" if mo is None else mo.group()
+
+
+def _entry_end(text: str, start: int, opening: str) -> int | None:
+    """Position of the delimiter that closes the entry starting at ``start``."""
+    depth = 0
+    pattern = _BRACES if opening == "{" else _BRACES_OR_PARENS
+    for mo in pattern.finditer(text, start):
+        char = mo.group()
+        if char == "{":
+            depth += 1
+        elif char == "}":
+            if depth == 0 and opening == "{":
+                return mo.start()
+            depth -= 1
+        elif char == ")" and depth == 0:
+            return mo.start()
+    return None
+
+
+def _bibtex_fields(body: str, macros: dict[str, str]) -> dict[str, str]:
+    """Parse ``key, name = value, ...`` (or ``name = value`` of a macro)."""
+    fields = dict()
+    # the citation key, if any, ends at the first comma before a field
+    mo = _FIELD_NAME.search(body)
+    while mo is not None:
+        name = mo.group(1).lower()
+        value, pos = _bibtex_value(body, mo.end(), macros)
+        fields[name] = value
+        mo = _FIELD_NAME.match(body, pos)
+    return fields
+
+
+def _bibtex_value(body: str, pos: int, macros: dict[str, str]) -> tuple[str, int]:
+    """Parse a possibly ``#``-concatenated value starting at ``pos``."""
+    parts = []
+    while pos < len(body):
+        char = body[pos]
+        if char == "{" or char == '"':
+            end = _value_end(body, pos)
+            parts.append(body[pos + 1 : end])
+            pos = end + 1
+        elif (mo := _BARE_VALUE.match(body, pos)) is not None:
+            parts.append(macros.get(mo.group().lower(), mo.group()))
+            pos = mo.end()
+        else:
+            break
+
+        mo = _CONCAT.match(body, pos)
+        pos = mo.end()
+        if mo.group(1) is None:
+            break
+    return "".join(parts), pos
+
+
+def _value_end(body: str, start: int) -> int:
+    """Position of the brace or quote closing the value starting at ``start``."""
+    depth = 0
+    pattern = _BRACES if body[start] == "{" else _QUOTE_OR_BRACES
+    for mo in pattern.finditer(body, start + 1):
+        char = mo.group()
+        if char == "{":
+            depth += 1
+        elif depth > 0 and char == "}":
+            depth -= 1
+        elif depth == 0:
+            return mo.start()
+    return len(body)
+
+
+def _clean_latex(value: str | None) -> str | None:
+    """Plain text of a BibTeX value: accents, commands and braces removed."""
+    if value is None:
+        return None
+    value = _LATEX_ACCENT.sub(r"\1", value)
+    value = _LATEX_SYMBOL.sub(r"\1", value)
+    value = _LATEX_COMMAND.sub("", value)
+    value = value.replace("{", "").replace("}", "").replace("~", " ")
+    return " ".join(value.split()) or None
+
+
+def _clean_doi(value: str | None) -> str | None:
+    if value is None:
+        return None
+    value = value.replace("\\_", "_").replace("{", "").replace("}", "").strip()
+    return value or None
+
+
+# RIS
+
+
+_RIS_LINE = re.compile(r"([A-Z][A-Z0-9])  -(?: (.*))?$")
+_RIS_TITLES = ("TI", "T1", "CT", "BT")
+
+
+def iter_ris(lines: Iterable[str]) -> Iterator[Reference]:
+    """Yield a reference for every ``TY`` ... ``ER`` record of a RIS file.
+
+    The title is taken from ``TI``, else ``T1``, ``CT`` or ``BT``. Lines without a
+    tag continue the previous field.
+    """
+    fields: dict[str, str] = dict()
+    tag = None
+    for line in lines:
+        line = line.lstrip("\ufeff").rstrip("\r\n")
+        mo = _RIS_LINE.match(line)
+        if mo is None:
+            if tag is not None and line.strip():
+                fields[tag] = f"{fields[tag]} {line.strip()}"
+            continue
+
+        tag, value = mo.group(1), (mo.group(2) or "").strip()
+        if tag == "TY":
+            fields = dict()
+        elif tag == "ER":
+            yield _ris_reference(fields)
+            fields, tag = dict(), None
+        elif tag not in fields:
+            # repeated tags (authors, keywords) keep their first value
+            fields[tag] = value
+
+
+def _ris_reference(fields: dict[str, str]) -> Reference:
+    title = next((fields[tag] for tag in _RIS_TITLES if fields.get(tag)), None)
+    return Reference(fields.get("DO") or None, title, fields.get("UR") or None)
+
+
+# CSL-JSON
+
+
+_JSON_TOKEN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*(")?|[{}\[\]]', re.DOTALL)
+
+
+def iter_csl_json(chunks: Iterable[str]) -> Iterator[Reference]:
+    """Yield a reference for every item of a CSL-JSON array or JSON Lines file.
+
+    The input may be split anywhere, e.g. in fixed-size chunks of a minified file.
+    Strings and brackets are scanned to find where each item ends, and items are
+    decoded one at a time while the input is read.
+    """
+    buffer = ""
+    # nesting of the scanned text, depth of the items and start of the open item
+    depth, item_depth, start = 0, 0, None
+    pos = 0
+    for chunk in chunks:
+        buffer += chunk
+        for mo in _JSON_TOKEN.finditer(buffer, pos):
+            token = mo.group()
+            if token[0] == '"':
+                if mo.group(1) is None:
+                    # the string continues in the next chunk
+                    break
+            elif token == "{" or token == "[":
+                if depth == 0 and token == "[":
+                    item_depth = 1
+                elif depth == item_depth and start is None:
+                    start = mo.start()
+                depth += 1
+            else:
+                depth -= 1
+                if depth == item_depth and start is not None:
+                    yield from _csl_items(buffer[start : mo.end()])
+                    start = None
+            pos = mo.end()
+        else:
+            pos = len(buffer)
+
+        keep = pos if start is None else start
+        buffer, pos = buffer[keep:], pos - keep
+        start = None if start is None else 0
+
+    if start is not None:
+        logging.warning("Ignored incomplete item at the end of the CSL-JSON file.")
+
+
+def _csl_items(text: str) -> Iterator[Reference]:
+    try:
+        item = json.loads(text)
+    except ValueError:
+        logging.warning(f"Skipped invalid CSL-JSON item: {text[:60]!r}")
+        return
+    if isinstance(item, dict):
+        yield _csl_reference(item)
+
+
+def _csl_reference(item: dict) -> Reference:
+    def text(name: str) -> str | None:
+        value = item.get(name) or item.get(name.lower())
+        if isinstance(value, list):
+            value = value[0] if value else None
+        return " ".join(value.split()) or None if isinstance(value, str) else None
+
+    return Reference(text("DOI"), text("title"), text("URL"))
+
+
+PARSERS = {"bibtex": iter_bibtex, "ris": iter_ris, "csl-json": iter_csl_json}
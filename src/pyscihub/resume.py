@@ -0,0 +1,136 @@
+"""Resumable PDF downloads and integrity checks of downloaded PDFs."""
+
+import hashlib
+import json
+import re
+from pathlib import Path
+
+from .tools import CHUNK_SIZE, atomic_write
+
+PARTIAL_NAME = ".partial"
+# the PDF header and trailer may be preceded or followed by some garbage
+PDF_HEADER = b"%PDF"
+PDF_TRAILER = b"%%EOF"
+SEARCH_SIZE = 1024
+
+_CONTENT_RANGE = re.compile(r"bytes (\d+)-\d+/(\d+|\*)")
+
+
+class InvalidPdf(Exception):
+    """A downloaded file is truncated or not a PDF, e.g. an HTML error page."""
+
+
+def validate_pdf(path: Path, size: int | None = None):
+    """Check the ``%PDF`` header, ``%%EOF`` trailer and, if known, the size of a PDF.
+
+    Args:
+        path (Path): Downloaded file
+        size (int): Expected size in bytes from the Content-Length header
+
+    Raises:
+        InvalidPdf: If any of the checks fails
+    """
+    actual = path.stat().st_size
+    if size is not None and actual != size:
+        raise InvalidPdf(f"expected {size} bytes, got {actual}")
+
+    with open(path, "rb") as f:
+        if PDF_HEADER not in f.read(SEARCH_SIZE):
+            raise InvalidPdf("no %PDF header")
+        f.seek(max(actual - SEARCH_SIZE, 0))
+        if PDF_TRAILER not in f.read():
+            raise InvalidPdf("no %%EOF trailer")
+
+
+class PartialDownloads(object):
+    """Keeps interrupted downloads in a folder so they can be resumed.
+
+    Every partial download is stored as ``<sha1 of url>.part`` next to a JSON file with
+    the ETag or Last-Modified of the response. A later request for the same URL asks
+    for the remaining bytes with ``Range``, guarded by ``If-Range`` so a changed file
+    is sent in full instead.
+    """
+
+    def __init__(self, folder: Path):
+        self.folder = folder
+
+    def _paths(self, url: str) -> tuple[Path, Path]:
+        name = hashlib.sha1(url.encode()).hexdigest()
+        return self.folder / f"{name}.part", self.folder / f"{name}.json"
+
+    def _meta(self, url: str) -> dict:
+        try:
+            return json.loads(self._paths(url)[1].read_text())
+        except (OSError, ValueError):
+            return dict()
+
+    def headers(self, url: str) -> dict[str, str]:
+        """Request headers for ``url``, resuming a partial download if there is one."""
+        # byte ranges of compressed responses do not match the file on disk
+        headers = {"Accept-Encoding": "identity"}
+
+        part, _ = self._paths(url)
+        validator = self._meta(url).get("validator")
+        size = part.stat().st_size if part.is_file() else 0
+        if validator and size > 0:
+            headers["Range"] = f"bytes={size}-"
+            headers["If-Range"] = validator
+        return headers
+
+    def resumable_size(self, url: str) -> int:
+        """Number of bytes of ``url`` received so far that a request can resume."""
+        part, _ = self._paths(url)
+        if not self._meta(url).get("validator") or not part.is_file():
+            return 0
+        return part.stat().st_size
+
+    def receive(self, url: str, response) -> tuple[Path, int | None]:
+        """Write the body of ``response`` to the partial download of ``url``.
+
+        A 206 response is appended to the partial download, any other response
+        replaces it. If the body is interrupted, the bytes received so far are kept.
+
+        Args:
+            url (str): URL of the PDF
+            response (Response): Streaming response with status 200 or 206
+
+        Returns:
+            tuple: Path of the downloaded file and its expected size, if known
+
+        Raises:
+            InvalidPdf: If the server resumed at another offset than requested
+        """
+        self.folder.mkdir(parents=True, exist_ok=True)
+        part, meta_path = self._paths(url)
+
+        if response.status_code == 206:
+            mo = _CONTENT_RANGE.fullmatch(response.headers.get("Content-Range", ""))
+            offset = part.stat().st_size if part.is_file() else 0
+            if mo is None or int(mo.group(1)) != offset:
+                self.discard(url)
+                raise InvalidPdf("server resumed at the wrong offset")
+            size = (
+                self._meta(url).get("size") if mo.group(2) == "*" else int(mo.group(2))
+            )
+            mode = "ab"
+        else:
+            length = response.headers.get("Content-Length")
+            size = int(length) if length and length.isdigit() else None
+            mode = "wb"
+
+            validator = response.headers.get("ETag") or response.headers.get(
+                "Last-Modified"
+            )
+            meta = {"url": url, "validator": validator, "size": size}
+            atomic_write(meta_path, [json.dumps(meta).encode()])
+
+        with open(part, mode) as f:
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                f.write(chunk)
+
+        return part, size
+
+    def discard(self, url: str):
+        """Remove the partial download of ``url``."""
+        for path in self._paths(url):
+            path.unlink(missing_ok=True)
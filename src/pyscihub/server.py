@@ -0,0 +1,333 @@
+"""Long-running download service with a local HTTP job API.
+
+A resident ``SciHub`` keeps its connection pool, rate limiters, caches and index of
+existing downloads warm between requests. Clients submit jobs of queries and poll
+or stream their results:
+
+- ``POST /jobs`` with ``{"queries": [...], "retry_failed": false}`` starts a job
+- ``GET /jobs/<id>`` returns the job and its results so far, ``?wait=<seconds>``
+  waits for the job to finish first
+- ``GET /jobs/<id>/stream`` streams the results as JSON lines as they complete
+- ``GET /status`` returns the jobs, in-flight queries and outcome counts
+"""
+
+import json
+import logging
+import math
+import os
+import secrets
+import socketserver
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterator
+from urllib.parse import parse_qs, urlsplit
+
+from .store import SingleFlight
+from .tools import canonical_key
+
+if TYPE_CHECKING:
+    from .pyscihub import Download, SciHub
+
+# seconds a finished job stays available to clients
+JOB_TTL = 3600.0
+# longest accepted ?wait=, so idle connections do not pile up
+MAX_WAIT = 300.0
+
+
+class Job(object):
+    """Queries submitted together and their results in order of completion."""
+
+    def __init__(self, queries: list[str]):
+        self.id = secrets.token_hex(8)
+        self.queries = queries
+        self.results: list["Download"] = []
+        self.created = time.time()
+        self.finished: float | None = None if queries else self.created
+        self._cond = threading.Condition()
+
+    @property
+    def done(self) -> bool:
+        return len(self.results) == len(self.queries)
+
+    def add(self, result: "Download"):
+        with self._cond:
+            self.results.append(result)
+            if self.done:
+                self.finished = time.time()
+            self._cond.notify_all()
+
+    def wait(self, count: int, timeout: float | None = None) -> bool:
+        """Wait until the job has more than ``count`` results or is done.
+
+        Returns:
+            bool: False if the timeout passed first
+        """
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: self.done or len(self.results) > count, timeout
+            )
+
+    def iter_results(self) -> Iterator["Download"]:
+        """Yield every result of the job, waiting for those that are not done yet."""
+        count = 0
+        while True:
+            self.wait(count)
+            results = self.results[count:]
+            yield from results
+            count += len(results)
+            if count == len(self.queries):
+                return
+
+    def summary(self, results: bool = True) -> dict:
+        info = {
+            "id": self.id,
+            "queries": len(self.queries),
+            "completed": len(self.results),
+            "done": self.done,
+            "created": self.created,
+            "finished": self.finished,
+        }
+        if results:
+            info["results"] = list(self.results)
+        return info
+
+
+class DownloadService(object):
+    """Runs the queries of all jobs on one warm ``SciHub``.
+
+    Existing downloads and failures are read from the manifest once at start-up and
+    kept up to date in memory. Queries with the same canonical key that are in
+    flight at the same time, from the same or different jobs, share one download.
+    """
+
+    def __init__(self, scihub: "SciHub", workers: int = 4, job_ttl: float = JOB_TTL):
+        """Initialises the service and reads the existing downloads.
+
+        Args:
+            scihub (SciHub): Downloads the queries
+            workers (int): Number of queries to download concurrently
+            job_ttl (float): Seconds a finished job is kept for clients
+
+        Raises:
+            ValueError: If ``scihub`` has a profiler and there is more than one worker
+        """
+        if scihub.profiler is not None and workers > 1:
+            raise ValueError("Profiling needs a single worker.")
+        self.scihub = scihub
+        self.job_ttl = job_ttl
+
+        self._pdf_paths = scihub._get_pdf_paths()
+        # when failed keys may be tried again, never for permanent failures
+        self._retry_at = {
+            key: math.inf if next_attempt is None else next_attempt
+            for key, _, _, next_attempt in scihub.manifest.failures()
+        }
+        self._flight = SingleFlight()
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="download")
+        self._jobs: dict[str, Job] = dict()
+        self._lock = threading.Lock()
+
+    def submit(self, queries: list[str], retry_failed: bool = False) -> Job:
+        """Start a job downloading ``queries``.
+
+        Args:
+            queries (list(str)): Queries to look up
+            retry_failed (bool): Retry earlier failures, ignoring their backoff
+
+        Returns:
+            Job: The job, results are added to it as they complete
+        """
+        job = Job(queries)
+        with self._lock:
+            self._expire_jobs()
+            self._jobs[job.id] = job
+        for query in queries:
+            self._executor.submit(self._run, job, query, retry_failed)
+        return job
+
+    def job(self, job_id: str) -> Job | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def status(self) -> dict:
+        with self._lock:
+            jobs = [job.summary(results=False) for job in self._jobs.values()]
+        return {
+            "jobs": jobs,
+            "in_flight": len(self._flight),
+            "downloads": sum(1 for path in self._pdf_paths.values() if path),
+            "outcomes": dict(self.scihub.metrics.outcomes),
+        }
+
+    def close(self):
+        """Stop running queries and export the manifest to pdf_paths.csv."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.scihub._save_pdf_paths()
+
+    def _expire_jobs(self):
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job.finished is not None and job.finished + self.job_ttl < now:
+                del self._jobs[job_id]
+
+    def _run(self, job: Job, query: str, retry_failed: bool):
+        try:
+            result = self.lookup(query, retry_failed)
+        except Exception:
+            logging.exception(f"Something went wrong for query: {query}")
+            result = self.scihub._outcome(query, None)
+        job.add(result)
+
+    def lookup(self, query: str, retry_failed: bool = False) -> "Download":
+        """Return the result of ``query``, downloading it unless it is known already.
+
+        Args:
+            query (str): Query to look up
+            retry_failed (bool): Retry an earlier failure, ignoring its backoff
+
+        Returns:
+            dict: The result of the query
+        """
+        key = canonical_key(query)
+        if pdf_path := self._pdf_paths.get(key):
+            self.scihub.manifest.alias(query, key)
+            return self.scihub._skipped(query, key, pdf_path)
+        if not retry_failed and self._retry_at.get(key, 0.0) > time.time():
+            self.scihub.manifest.alias(query, key)
+            return self.scihub._skipped(query, key, "")
+
+        result, shared = self._flight.do(key, lambda: self._download(query))
+        if shared:
+            self.scihub.manifest.alias(query, key)
+            return {**result, "query": query}
+        return result
+
+    def _download(self, query: str) -> "Download":
+        result = self.scihub._download_query(query)
+        self.scihub._store_result(self._pdf_paths, result)
+
+        key = result["key"]
+        if result["status"] == "success":
+            self._retry_at.pop(key, None)
+        elif (failure := self.scihub.manifest.failure(key)) is not None:
+            next_attempt = failure[2]
+            self._retry_at[key] = math.inf if next_attempt is None else next_attempt
+        return result
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """HTTP server listening on a Unix socket."""
+
+    daemon_threads = True
+
+    def server_bind(self):
+        # a stale socket of an earlier run would make bind fail
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+        super().server_bind()
+
+
+def make_server(
+    service: DownloadService,
+    host: str = "127.0.0.1",
+    port: int = 8765,
+    socket_path: Path | None = None,
+) -> socketserver.BaseServer:
+    """Create the HTTP server of ``service`` on a TCP port or Unix socket.
+
+    Args:
+        service (DownloadService): Service handling the jobs
+        host (str): Interface to listen on
+        port (int): TCP port to listen on, 0 picks a free port
+        socket_path (Path): Listen on this Unix socket instead of a TCP port
+
+    Returns:
+        BaseServer: The server, call ``serve_forever`` to handle requests
+    """
+    handler = _handler(service)
+    if socket_path is not None:
+        return UnixHTTPServer(str(socket_path), handler)
+
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def _handler(service: DownloadService) -> type:
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if urlsplit(self.path).path != "/jobs":
+                return self._send_json(404, {"error": "not found"})
+
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                queries = body["queries"]
+                if isinstance(queries, str):
+                    queries = [queries]
+                if not all(isinstance(query, str) for query in queries):
+                    raise ValueError("queries should be strings")
+            except (KeyError, TypeError, ValueError) as err:
+                return self._send_json(400, {"error": f"invalid job: {err}"})
+
+            queries = [query.strip() for query in queries if query.strip()]
+            job = service.submit(queries, bool(body.get("retry_failed", False)))
+            self._send_json(202, job.summary(results=False))
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            parts = url.path.strip("/").split("/")
+            if parts == ["status"]:
+                return self._send_json(200, service.status())
+            if len(parts) not in (2, 3) or parts[0] != "jobs":
+                return self._send_json(404, {"error": "not found"})
+
+            job = service.job(parts[1])
+            if job is None:
+                return self._send_json(404, {"error": "unknown job"})
+
+            if len(parts) == 3 and parts[2] == "stream":
+                return self._stream(job)
+            elif len(parts) == 3:
+                return self._send_json(404, {"error": "not found"})
+
+            wait = parse_qs(url.query).get("wait")
+            if wait:
+                try:
+                    timeout = float(wait[0])
+                except ValueError:
+                    timeout = math.nan
+                if not math.isfinite(timeout):
+                    return self._send_json(400, {"error": "wait should be a number"})
+                timeout = max(0.0, min(timeout, MAX_WAIT))
+                job.wait(len(job.queries) - 1, timeout)
+            self._send_json(200, job.summary())
+
+        def _stream(self, job: Job):
+            """Send the results as JSON lines until the job is done."""
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.end_headers()
+            for result in job.iter_results():
+                self.wfile.write(json.dumps(result).encode() + b"\n")
+                self.wfile.flush()
+
+        def _send_json(self, status: int, body: dict):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def address_string(self) -> str:
+            # clients of a Unix socket have no address
+            return self.client_address[0] if self.client_address else "unix"
+
+        def log_message(self, format, *args):
+            logging.debug(f"{self.address_string()} {format % args}")
+
+    return Handler
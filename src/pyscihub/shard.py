@@ -0,0 +1,232 @@
+"""Deterministic partitioning of queries over shards and merging of their results."""
+
+import csv
+import filecmp
+import hashlib
+import itertools
+import logging
+from pathlib import Path
+from typing import Iterable, Iterator, NamedTuple, TypedDict
+
+from .manifest import CSV_NAME, DB_NAME, Manifest, Reason
+from .tools import CHUNK_SIZE, Query, atomic_write, canonical_key
+
+
+class Shard(NamedTuple):
+    """Shard ``index`` out of ``count``, numbered from 1."""
+
+    index: int
+    count: int
+
+    @classmethod
+    def parse(cls, value: str) -> "Shard":
+        """Parse a shard written as ``i/N``, e.g. ``2/8``.
+
+        Raises:
+            ValueError: If the value is not of the form ``i/N`` with 1 <= i <= N
+        """
+        index, sep, count = value.partition("/")
+        if not sep or not index.strip().isdigit() or not count.strip().isdigit():
+            raise ValueError(f"shard should look like i/N, not {value!r}.")
+
+        shard = cls(int(index), int(count))
+        if not 1 <= shard.index <= shard.count:
+            raise ValueError(f"shard index should be between 1 and {shard.count}.")
+        return shard
+
+    @property
+    def suffix(self) -> str:
+        """Suffix of the manifest files written by this shard."""
+        return f".shard-{self.index}-of-{self.count}"
+
+    def __contains__(self, query: Query) -> bool:
+        return shard_index(query, self.count) == self.index
+
+
+def shard_index(query: Query, count: int) -> int:
+    """Shard of ``query`` out of ``count`` shards, the same on every machine.
+
+    Queries are hashed by canonical key, so variants of a query (e.g. a DOI in upper
+    case or as a doi.org link) always land in the same shard.
+    """
+    digest = hashlib.sha1(canonical_key(query).encode()).digest()
+    return int.from_bytes(digest[:8], "big") % count + 1
+
+
+def iter_shard(queries: Iterable[Query], shard: Shard) -> Iterator[Query]:
+    """Lazily keep only the queries that belong to ``shard``."""
+    return (query for query in queries if query in shard)
+
+
+class MergeStats(TypedDict):
+    manifests: int
+    queries: int
+    copied: int
+    duplicates: int
+    conflicts: int
+    missing: int
+
+
+def find_manifests(folder: Path) -> list[Path]:
+    """All manifests in ``folder``, a CSV only if it has no database next to it."""
+    databases = sorted(folder.glob(DB_NAME.replace(".", "*.")))
+    csvs = [
+        path
+        for path in sorted(folder.glob(CSV_NAME.replace(".", "*.")))
+        if not path.with_suffix(".sqlite").is_file()
+    ]
+    return databases + csvs
+
+
+class ManifestRow(NamedTuple):
+    """Result of a query in a manifest, with its failure if the manifest has one."""
+
+    query: str
+    pdf_path: str
+    reason: Reason | None = None
+    attempts: int = 0
+    next_attempt: float | None = None
+
+
+def read_manifest(path: Path) -> Iterator[ManifestRow]:
+    """Iterate over the rows of a manifest database or CSV.
+
+    A CSV only has queries and PDF locations, failures are read from databases.
+    """
+    if path.suffix == ".csv":
+        with open(path, newline="") as f:
+            for row in csv.DictReader(f):
+                yield ManifestRow(row["query"].strip(), row["pdf_path"])
+    else:
+        manifest = Manifest(path)
+        try:
+            for query, *result in manifest.entries():
+                yield ManifestRow(query.strip(), *result)
+        finally:
+            manifest.close()
+
+
+def _copy_pdf(source: Path, target: Path, stats: MergeStats) -> Path:
+    """Copy a PDF into the merged folder unless it is already there.
+
+    A different PDF with the same name is never overwritten or shared: the copy
+    gets the first free name ``<name>-2.pdf``, ``<name>-3.pdf``, ...
+
+    Returns:
+        Path: Location of the PDF in the merged folder
+    """
+    for n in itertools.count(1):
+        candidate = target if n == 1 else target.with_stem(f"{target.stem}-{n}")
+        if not candidate.exists():
+            with open(source, "rb") as f:
+                atomic_write(candidate, iter(lambda: f.read(CHUNK_SIZE), b""))
+            stats["copied"] += 1
+            return candidate
+        elif candidate.samefile(source):
+            return candidate
+        elif filecmp.cmp(source, candidate, shallow=False):
+            stats["duplicates"] += 1
+            return candidate
+        elif n == 1:
+            # same citation but different content
+            logging.warning(f"{target} differs from {source}, copying it aside.")
+            stats["conflicts"] += 1
+
+
+def merge(sources: list[Path], output: Path) -> MergeStats:
+    """Merge the manifests and PDFs of shard output folders into ``output``.
+
+    Every manifest in the source folders is read, including per-shard manifests.
+    PDFs are copied into ``output`` unless an identical file is already there, and
+    under a new name if a different file has their name. When a query occurs more
+    than once, a downloaded PDF wins over a failed download and otherwise the first
+    result is kept. Failures keep their reason, attempts and next attempt, so
+    permanent failures are not retried after the merge.
+
+    Args:
+        sources (list(Path)): Output folders of the shards, may include ``output``
+        output (Path): Folder to merge into
+
+    Returns:
+        dict: Counts of merged manifests, queries, copied PDFs, duplicates,
+            conflicts and PDFs that could not be found
+    """
+    stats: MergeStats = {
+        "manifests": 0,
+        "queries": 0,
+        "copied": 0,
+        "duplicates": 0,
+        "conflicts": 0,
+        "missing": 0,
+    }
+    target = Manifest.open(output)
+
+    try:
+        for source in sources:
+            for path in find_manifests(source):
+                if path.resolve() in (
+                    target.path.resolve(),
+                    (output / CSV_NAME).resolve(),
+                ):
+                    continue
+
+                stats["manifests"] += 1
+                for row in read_manifest(path):
+                    stats["queries"] += 1
+                    merged = _merge_row(
+                        target, source, output, row.query, row.pdf_path, stats
+                    )
+                    if merged == "" and row.reason is not None:
+                        target.record_failure(
+                            row.query,
+                            row.reason,
+                            attempts=row.attempts,
+                            next_attempt=row.next_attempt,
+                        )
+                    elif merged is not None:
+                        target.record(row.query, merged)
+
+        if len(target) > 0:
+            target.export_csv(output / CSV_NAME)
+    finally:
+        target.close()
+
+    return stats
+
+
+def _merge_row(
+    target: Manifest,
+    source: Path,
+    output: Path,
+    query: str,
+    pdf_path: str,
+    stats: MergeStats,
+) -> str | None:
+    """PDF location to record for ``query``, None to keep the existing result."""
+    existing = target.get(query)
+    if existing:
+        pdf = source / Path(pdf_path).name
+        if (
+            pdf_path
+            and pdf.is_file()
+            and Path(existing).is_file()
+            and not filecmp.cmp(pdf, existing, shallow=False)
+        ):
+            logging.warning(f"Conflicting results for {query}, keeping {existing}.")
+            stats["conflicts"] += 1
+        else:
+            stats["duplicates"] += 1
+        return None
+
+    if not pdf_path:
+        return None if existing is not None else ""
+
+    # shards may have run on other machines, so look for the PDF in its folder
+    pdf = source / Path(pdf_path).name
+    if not pdf.is_file():
+        logging.warning(f"PDF of {query} not found in {source}.")
+        stats["missing"] += 1
+        return None if existing is not None else ""
+
+    merged = _copy_pdf(pdf, output / pdf.name, stats)
+    return str(merged.resolve())
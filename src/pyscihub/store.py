@@ -0,0 +1,183 @@
+"""Content-addressed PDF store and deduplication of concurrent downloads."""
+
+import errno
+import hashlib
+import logging
+import os
+import secrets
+import tempfile
+import threading
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Callable, Iterable, TypeVar
+
+from .tools import CHUNK_SIZE
+
+STORE_NAME = ".store"
+LINK_TYPES = ("hardlink", "symlink")
+
+T = TypeVar("T")
+
+
+class PdfStore(object):
+    """Stores every PDF once under its SHA-256 hash and links citation names to it.
+
+    Objects live in ``root/ab/abcdef....pdf``. The citation-named file in the output
+    folder is a hardlink to the object, or a relative symlink if ``link`` is
+    ``"symlink"``. Hardlinks fall back to symlinks when the store is on another
+    filesystem than the output folder.
+    """
+
+    def __init__(self, root: Path, link: str = "hardlink"):
+        """Initialises the store.
+
+        Args:
+            root (Path): Folder containing the stored PDFs, shared between outputs
+            link (str): Either "hardlink" or "symlink"
+
+        Raises:
+            ValueError: If ``link`` is not a known link type
+        """
+        if link not in LINK_TYPES:
+            raise ValueError(f"link should be one of {', '.join(LINK_TYPES)}.")
+
+        self.root = root
+        self.link = link
+        root.mkdir(parents=True, exist_ok=True)
+
+    def object_path(self, digest: str) -> Path:
+        return self.root / digest[:2] / f"{digest}.pdf"
+
+    def put(self, path: Path, chunks: Iterable[bytes]) -> int:
+        """Store ``chunks`` once by content and link ``path`` to the stored PDF.
+
+        Like ``tools.atomic_write``, a failure halfway through leaves no file behind,
+        neither in the store nor at ``path``.
+
+        Args:
+            path (Path): Citation-named location of the PDF
+            chunks (iterable(bytes)): Body of the PDF in chunks
+
+        Returns:
+            int: Number of bytes downloaded
+        """
+        fd, tmp_name = tempfile.mkstemp(dir=self.root, prefix=".", suffix=".part")
+        digest = hashlib.sha256()
+        n_bytes = 0
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    if chunk:
+                        f.write(chunk)
+                        digest.update(chunk)
+                        n_bytes += len(chunk)
+
+            obj = self._move(Path(tmp_name), digest.hexdigest(), path)
+        except BaseException:
+            Path(tmp_name).unlink(missing_ok=True)
+            raise
+
+        self._link(obj, path)
+        return n_bytes
+
+    def put_file(self, path: Path, source: Path) -> int:
+        """Move the finished file ``source`` into the store and link ``path`` to it.
+
+        The file is only read to hash it, it is not copied unless the store is on
+        another filesystem. ``source`` is gone afterwards, also if it was a duplicate.
+
+        Args:
+            path (Path): Citation-named location of the PDF
+            source (Path): Complete PDF, e.g. a finished partial download
+
+        Returns:
+            int: Size of the PDF in bytes
+        """
+        digest = hashlib.sha256()
+        with open(source, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+        n_bytes = source.stat().st_size
+
+        try:
+            obj = self._move(source, digest.hexdigest(), path)
+        except OSError as err:
+            if err.errno != errno.EXDEV:
+                raise
+            with open(source, "rb") as f:
+                self.put(path, iter(lambda: f.read(CHUNK_SIZE), b""))
+            source.unlink()
+            return n_bytes
+
+        self._link(obj, path)
+        return n_bytes
+
+    def _move(self, tmp: Path, digest: str, path: Path) -> Path:
+        """Move ``tmp`` to the object of ``digest``, or drop it if already stored."""
+        obj = self.object_path(digest)
+        if obj.is_file():
+            logging.debug(f"{path.name} is already stored as {obj.name}.")
+            os.unlink(tmp)
+        else:
+            obj.parent.mkdir(exist_ok=True)
+            os.replace(tmp, obj)
+        return obj
+
+    def _link(self, obj: Path, path: Path):
+        """Atomically point ``path`` at ``obj``, replacing whatever was there."""
+        tmp = path.with_name(f".{secrets.token_hex(8)}.link")
+        try:
+            if self.link == "hardlink":
+                try:
+                    os.link(obj, tmp)
+                except OSError:
+                    # e.g. a store on another filesystem
+                    os.symlink(os.path.relpath(obj, path.parent), tmp)
+            else:
+                os.symlink(os.path.relpath(obj, path.parent), tmp)
+            os.replace(tmp, path)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+
+
+class SingleFlight(object):
+    """Runs one call per key at a time, concurrent callers for the key share its result.
+
+    Used so that concurrent requests for the same PDF URL share a single download.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[str, Future] = dict()
+
+    def __len__(self) -> int:
+        """Number of calls that are running."""
+        with self._lock:
+            return len(self._calls)
+
+    def do(self, key: str, func: Callable[[], T]) -> tuple[T, bool]:
+        """Call ``func``, or wait for the call already running for ``key``.
+
+        Returns:
+            tuple: Result of the call and whether it was shared with another caller
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            shared = future is not None
+            if not shared:
+                future = self._calls[key] = Future()
+
+        if shared:
+            return future.result(), True
+
+        try:
+            result = func()
+            future.set_result(result)
+            return result, False
+        except BaseException as err:
+            future.set_exception(err)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
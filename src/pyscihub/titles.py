@@ -0,0 +1,330 @@
+"""Offline title-to-DOI resolution with a memory-mapped trigram index.
+
+The index is built once from a Crossref-style JSONL dump (one work per line with a
+``DOI`` and a ``title``) and stored as flat arrays of native integers:
+
+- ``records.bin``: ``doi<TAB>normalized title<LF>`` per work
+- ``records.idx``: offset of every record in ``records.bin`` (uint64)
+- ``titles.bin``: sorted CRC32 hash of every normalized title and its record id
+  (uint64, hash in the high 32 bits)
+- ``trigrams.bin``: sorted CRC32 hashes of all trigrams (uint32)
+- ``postings.idx``: offset of the posting list of every trigram (uint64)
+- ``postings.bin``: ids of the records containing each trigram (uint32)
+
+Lookups memory-map these files, so opening an index of tens of millions of works is
+instant and only the pages that are touched are read. Exact titles are found with a
+binary search of ``titles.bin``, other titles with the trigram posting lists.
+"""
+
+import array
+import gzip
+import heapq
+import itertools
+import json
+import math
+import mmap
+import os
+import sys
+import tempfile
+import zlib
+from bisect import bisect_left
+from collections import Counter
+from pathlib import Path
+from typing import IO, Iterable, Iterator, NamedTuple
+
+from .tools import normalize_title
+
+TITLES_NAME = "title_index"
+FORMAT_VERSION = 1
+# minimal Jaccard similarity of the trigrams of a query and a title
+THRESHOLD = 0.8
+# candidates verified per lookup, in order of the number of shared rare trigrams
+MAX_CANDIDATES = 256
+# posting entries read per lookup beyond the minimum, to filter candidates by count
+POSTINGS_BUDGET = 10_000
+# (trigram, record) pairs sorted in memory at once while building an index
+SORT_CHUNK = 2_000_000
+
+_FILES = (
+    "records.bin",
+    "records.idx",
+    "titles.bin",
+    "trigrams.bin",
+    "postings.idx",
+    "postings.bin",
+)
+
+
+def trigrams(normalized: str) -> set[int]:
+    """Hashes of the character trigrams of a normalized title, words padded."""
+    padded = f"  {normalized} "
+    return {zlib.crc32(padded[i : i + 3].encode()) for i in range(len(padded) - 2)}
+
+
+class TitleMatch(NamedTuple):
+    doi: str
+    title: str
+    score: float
+
+
+def iter_works(lines: Iterable[str]) -> Iterator[tuple[str, str]]:
+    """Yield (DOI, title) of every work in a Crossref-style JSONL dump.
+
+    Titles may be strings or lists of strings, as in the Crossref API. Lines that
+    are not JSON or lack a DOI or title are skipped.
+    """
+    for line in lines:
+        try:
+            work = json.loads(line)
+            doi = work.get("DOI") or work.get("doi")
+            title = work.get("title")
+        except (ValueError, AttributeError):
+            continue
+
+        if isinstance(title, list):
+            title = title[0] if title else None
+        if isinstance(doi, str) and isinstance(title, str):
+            yield doi.strip(), title
+
+
+def open_dump(path: Path) -> IO[str]:
+    """Open a JSONL dump, gzipped if its name ends with ``.gz``."""
+    if path.suffix == ".gz":
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def build_index(
+    works: Iterable[tuple[str, str]], path: Path, chunk_size: int = SORT_CHUNK
+) -> int:
+    """Build a title index at ``path`` from (DOI, title) pairs.
+
+    (title, record) and (trigram, record) pairs are sorted in chunks of
+    ``chunk_size`` that are spilled to disk and merged, so memory stays bounded
+    however big the dump is.
+
+    Args:
+        works (iterable(tuple)): DOI and title of every work
+        path (Path): Folder to write the index to
+        chunk_size (int): Number of pairs sorted in memory at once
+
+    Returns:
+        int: Number of indexed works
+    """
+    path.mkdir(parents=True, exist_ok=True)
+    for name in ("meta.json",) + _FILES:
+        (path / name).unlink(missing_ok=True)
+
+    with tempfile.TemporaryDirectory(dir=path) as tmp_dir:
+        runs: list[Path] = []
+        pairs = array.array("Q")
+        title_runs: list[Path] = []
+        titles = array.array("Q")
+        count = 0
+        offsets = array.array("Q", [0])
+        with open(path / "records.bin", "wb") as records, open(
+            path / "records.idx", "wb"
+        ) as records_idx:
+            for doi, title in works:
+                normalized = normalize_title(title)
+                if not normalized or "\t" in doi or "\n" in doi:
+                    continue
+
+                line = f"{doi}\t{normalized}\n".encode()
+                records.write(line)
+                offsets.append(offsets[-1] + len(line))
+                if len(offsets) >= chunk_size:
+                    offsets[:-1].tofile(records_idx)
+                    del offsets[:-1]
+
+                titles.append(zlib.crc32(normalized.encode()) << 32 | count)
+                pairs.extend(hash << 32 | count for hash in trigrams(normalized))
+                count += 1
+                if len(titles) >= chunk_size:
+                    title_runs.append(_spill(titles, Path(tmp_dir)))
+                    titles = array.array("Q")
+                if len(pairs) >= chunk_size:
+                    runs.append(_spill(pairs, Path(tmp_dir)))
+                    pairs = array.array("Q")
+            offsets.tofile(records_idx)
+
+        title_runs.append(_spill(titles, Path(tmp_dir)))
+        with open(path / "titles.bin", "wb") as f:
+            block = array.array("Q")
+            for pair in heapq.merge(*(_read_run(run) for run in title_runs)):
+                block.append(pair)
+                if len(block) >= 65536:
+                    block.tofile(f)
+                    block = array.array("Q")
+            block.tofile(f)
+
+        runs.append(_spill(pairs, Path(tmp_dir)))
+        _write_postings(heapq.merge(*(_read_run(run) for run in runs)), path)
+
+    meta = {"version": FORMAT_VERSION, "works": count, "byteorder": sys.byteorder}
+    (path / "meta.json").write_text(json.dumps(meta))
+    return count
+
+
+def _spill(pairs: array.array, folder: Path) -> Path:
+    """Write ``pairs`` sorted to a new file in ``folder``."""
+    fd, name = tempfile.mkstemp(dir=folder, suffix=".run")
+    with os.fdopen(fd, "wb") as f:
+        array.array("Q", sorted(pairs)).tofile(f)
+    return Path(name)
+
+
+def _read_run(path: Path, block: int = 65536) -> Iterator[int]:
+    with open(path, "rb") as f:
+        while data := f.read(8 * block):
+            yield from array.array("Q", data)
+
+
+def _write_postings(pairs: Iterable[int], path: Path):
+    """Write the trigram table and posting lists of sorted (trigram, record) pairs."""
+    with open(path / "trigrams.bin", "wb") as keys, open(
+        path / "postings.idx", "wb"
+    ) as index, open(path / "postings.bin", "wb") as postings:
+        offset = 0
+        array.array("Q", [0]).tofile(index)
+        for hash, group in itertools.groupby(pairs, key=lambda pair: pair >> 32):
+            ids = array.array("I", (pair & 0xFFFFFFFF for pair in group))
+            ids.tofile(postings)
+            offset += len(ids)
+            array.array("I", [hash]).tofile(keys)
+            array.array("Q", [offset]).tofile(index)
+
+
+class TitleIndex(object):
+    """Memory-mapped trigram index mapping normalized titles to DOIs.
+
+    A title that is indexed as is (after normalization) is found by hash. Otherwise
+    the lookup probes only the rarest trigrams of the query: a title with a Jaccard
+    similarity of at least ``threshold`` shares at least ``ceil(threshold * n)`` of
+    the ``n`` trigrams of the query, so it contains at least one of the
+    ``n - ceil(threshold * n) + 1`` rarest. Every further trigram that is probed
+    raises the number of probed trigrams a match must share by one, which filters
+    out most candidates before they are scored exactly.
+    """
+
+    def __init__(self, path: Path, threshold: float = THRESHOLD):
+        """Opens the index at ``path``.
+
+        Args:
+            path (Path): Folder written by ``build_index``
+            threshold (float): Minimal similarity between 0 and 1 of a match
+
+        Raises:
+            ValueError: If the folder does not contain a compatible index
+        """
+        if not 0 < threshold <= 1:
+            raise ValueError("threshold should be between 0 and 1.")
+        try:
+            meta = json.loads((path / "meta.json").read_text())
+        except (OSError, ValueError):
+            raise ValueError(f"{path} is not a title index.")
+        if meta.get("version") != FORMAT_VERSION or meta["byteorder"] != sys.byteorder:
+            raise ValueError(f"{path} was built by another version or machine.")
+
+        self.path = path
+        self.threshold = threshold
+        self._maps: list[mmap.mmap] = []
+        self._records = self._map("records.bin", None)
+        self._record_offsets = self._map("records.idx", "Q")
+        self._titles = self._map("titles.bin", "Q")
+        self._trigrams = self._map("trigrams.bin", "I")
+        self._posting_offsets = self._map("postings.idx", "Q")
+        self._postings = self._map("postings.bin", "I")
+
+    def _map(self, name: str, typecode: str | None) -> memoryview:
+        with open(self.path / name, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                view = memoryview(b"")
+            else:
+                self._maps.append(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+                view = memoryview(self._maps[-1])
+        return view if typecode is None else view.cast(typecode)
+
+    def __len__(self) -> int:
+        return max(len(self._record_offsets) - 1, 0)
+
+    def _posting_list(self, hash: int) -> memoryview | None:
+        i = bisect_left(self._trigrams, hash)
+        if i == len(self._trigrams) or self._trigrams[i] != hash:
+            return None
+        return self._postings[self._posting_offsets[i] : self._posting_offsets[i + 1]]
+
+    def _record(self, record: int) -> tuple[str, str]:
+        start, end = self._record_offsets[record], self._record_offsets[record + 1]
+        doi, title = bytes(self._records[start : end - 1]).decode().split("\t")
+        return doi, title
+
+    def lookup(self, title: str) -> TitleMatch | None:
+        """Find the DOI of the indexed title most similar to ``title``.
+
+        Args:
+            title (str): Title of the article
+
+        Returns:
+            TitleMatch: DOI, normalized title and similarity of the best match, None
+                if no title is at least ``threshold`` similar
+        """
+        normalized = normalize_title(title)
+        if not normalized:
+            return None
+
+        hash = zlib.crc32(normalized.encode())
+        i = bisect_left(self._titles, hash << 32)
+        while i < len(self._titles) and self._titles[i] >> 32 == hash:
+            doi, candidate = self._record(self._titles[i] & 0xFFFFFFFF)
+            if candidate == normalized:
+                return TitleMatch(doi, candidate, 1.0)
+            i += 1
+
+        query = trigrams(normalized)
+
+        postings = []
+        for hash in query:
+            posting_list = self._posting_list(hash)
+            if posting_list is None:
+                posting_list = memoryview(b"").cast("I")
+            postings.append(posting_list)
+        postings.sort(key=len)
+        prefix = len(query) - math.ceil(self.threshold * len(query)) + 1
+        candidates = Counter()
+        for posting_list in postings[:prefix]:
+            candidates.update(posting_list.tolist())
+
+        # only titles in the prefix can match, the next lists just count for them
+        min_count = 1
+        budget = POSTINGS_BUDGET
+        for posting_list in postings[prefix:]:
+            budget -= len(posting_list)
+            if budget < 0:
+                break
+            candidates.update(candidates.keys() & set(posting_list.tolist()))
+            min_count += 1
+
+        ranked = sorted(
+            (count, record)
+            for record, count in candidates.items()
+            if count >= min_count
+        )
+        best = None
+        for count, record in reversed(ranked[-MAX_CANDIDATES:]):
+            doi, candidate = self._record(record)
+            other = trigrams(candidate)
+            score = len(query & other) / len(query | other)
+            if score >= self.threshold and (best is None or score > best.score):
+                best = TitleMatch(doi, candidate, score)
+                if score == 1.0:
+                    break
+        return best
+
+    def close(self):
+        # views have to be released before their maps can be closed
+        self._records = self._record_offsets = self._titles = memoryview(b"")
+        self._trigrams = self._posting_offsets = self._postings = memoryview(b"")
+        for mm in self._maps:
+            mm.close()
+        self._maps = []
@@ -1,9 +1,19 @@
 """Tools for handling queries."""
 
 import logging
+import multiprocessing
 import os
 import re
+import tempfile
+import unicodedata
+from collections import OrderedDict
+from enum import Enum
 from pathlib import Path
+from typing import Iterable, Iterator, NamedTuple
+from urllib.parse import urlsplit, urlunsplit
+
+# size of the blocks in which PDFs are streamed to disk and copied
+CHUNK_SIZE = 64 * 1024
 
 
 def ref_regex() -> str:
@@ -55,27 +65,219 @@ def ref_regex_simple() -> str:
     return r"^" + ALL_AUTHORS + TITLE
 
 
+class QueryType(str, Enum):
+    DOI = "doi"
+    URL = "url"
+    TITLE = "title"
+    INVALID = "invalid"
+
+
+class Classification(NamedTuple):
+    type: QueryType
+    query: str | None
+
+
+# a line to classify, or a query of which the type is known, e.g. from a library
+Query = str | Classification
+
+
+DOI_REGEX = r"10.\d{4,9}\/[-._;()\/:a-zA-Z0-9]+"
+URL_REGEX = r"(?i)\b((?:https?://|www\d{0,3}[.]|[a-z0-9.\-]+[.][a-z]{2,4}/)(?:[^\s()<>]+|\(([^\s()<>]+|(\([^\s()<>]+\)))*\))+(?:\(([^\s()<>]+|(\([^\s()<>]+\)))*\)|[^\s`!()\[\]{};:'\".,<>?«»“”‘’]))"
+
+
+class QueryClassifier(object):
+    """Classifies lines as DOI, URL, title or invalid with patterns compiled once."""
+
+    def __init__(self):
+        self._doi = re.compile(DOI_REGEX)
+        self._url = re.compile(URL_REGEX)
+        self._ref = re.compile(ref_regex_simple())
+
+    def classify(self, string: str) -> Classification:
+        """Classify a single line and extract the query to send to Sci-Hub.
+
+        Args:
+            string (str): Line containing a DOI, URL or reference
+
+        Returns:
+            Classification: Type of the query and the extracted query
+        """
+        # every DOI starts with "10", skip the regex for most references
+        if "10" in string and (mo := self._doi.search(string)) is not None:
+            return Classification(QueryType.DOI, mo.group())
+        elif self._may_be_url(string) and (mo := self._url.search(string)) is not None:
+            return Classification(QueryType.URL, mo.group())
+        elif (mo := self._ref.search(string)) is not None:
+            return Classification(QueryType.TITLE, mo.group("title"))
+        else:
+            return Classification(QueryType.INVALID, None)
+
+    @staticmethod
+    def _may_be_url(string: str) -> bool:
+        """Cheap check whether the expensive URL regex can match at all."""
+        return "/" in string or "www" in string.lower()
+
+    def classify_many(
+        self, strings: Iterable[str], processes: int = 1, chunksize: int = 10_000
+    ) -> Iterator[Classification]:
+        """Classify many lines lazily, in order, optionally using a process pool.
+
+        Args:
+            strings (iterable(str)): Lines containing a DOI, URL or reference
+            processes (int): Number of worker processes, 1 classifies in this process
+            chunksize (int): Number of lines sent to a worker process at once
+
+        Returns:
+            iterator(Classification): Classification of every line
+        """
+        if processes == 1:
+            yield from map(self.classify, strings)
+        else:
+            with multiprocessing.Pool(processes) as pool:
+                yield from pool.imap(_classify, strings, chunksize=chunksize)
+
+
+_CLASSIFIER = QueryClassifier()
+
+
+def _classify(string: str) -> Classification:
+    return _CLASSIFIER.classify(string)
+
+
+def classify_query(string: str) -> Classification:
+    """Classify a single line with the shared, precompiled classifier."""
+    return _CLASSIFIER.classify(string)
+
+
 def extract_valid_query(string: str) -> str | None:
     """Valid query either contains title, doi or url."""
-    DOI_REGEX = r"10.\d{4,9}\/[-._;()\/:a-zA-Z0-9]+"
-    URL_REGEX = r"(?i)\b((?:https?://|www\d{0,3}[.]|[a-z0-9.\-]+[.][a-z]{2,4}/)(?:[^\s()<>]+|\(([^\s()<>]+|(\([^\s()<>]+\)))*\))+(?:\(([^\s()<>]+|(\([^\s()<>]+\)))*\)|[^\s`!()\[\]{};:'\".,<>?«»“”‘’]))"
-    REF_REGEX = ref_regex_simple()
-
-    if (mo := re.search(DOI_REGEX, string)) is not None:
-        query = mo.group()
-        logging.debug(f"{query} is DOI.")
-    elif (mo := re.search(URL_REGEX, string)) is not None:
-        query = mo.group()
-        logging.debug(f"{query} is URL.")
-    elif (mo := re.search(REF_REGEX, string)) is not None:
-        query = mo.group("title")
-        logging.debug(f"{query} is title.")
-    else:
-        return None
+    query_type, query = _CLASSIFIER.classify(string)
+    if query_type is not QueryType.INVALID:
+        logging.debug("%s is %s.", query, query_type.name)
 
     return query
 
 
+def normalize_url(url: str) -> str:
+    """Normalize a URL so that http/https, www. and trailing slash variants match.
+
+    The host is lower-cased without ``www.`` and default ports, the fragment dropped.
+    """
+    url = url.strip()
+    if "://" not in url:
+        url = f"https://{url}"
+
+    parts = urlsplit(url)
+    host = (parts.hostname or "").removeprefix("www.")
+    try:
+        if parts.port not in (None, 80, 443):
+            host = f"{host}:{parts.port}"
+    except ValueError:
+        pass
+
+    return urlunsplit(("https", host, parts.path.rstrip("/"), parts.query, ""))
+
+
+_NON_ALNUM = re.compile(r"[\W_]+")
+_TAGS = re.compile(r"<[^>]+>")
+
+
+def normalize_title(title: str) -> str:
+    """Lower-case ``title`` without accents, markup and punctuation."""
+    title = unicodedata.normalize("NFKD", _TAGS.sub(" ", title))
+    title = "".join(char for char in title if not unicodedata.combining(char))
+    return " ".join(_NON_ALNUM.sub(" ", title.casefold()).split())
+
+
+def normalize_query(classification: Classification) -> str | None:
+    """Normalize an extracted query so that trivial variants share one key.
+
+    DOIs are case-insensitive, trailing punctuation picked up from a citation is
+    dropped; titles are compared case- and whitespace-insensitively; URLs are
+    normalized with ``normalize_url``.
+    """
+    query_type, query = classification
+    if query is None:
+        return None
+    elif query_type is QueryType.DOI:
+        return query.rstrip(".,;").lower()
+    elif query_type is QueryType.URL:
+        return normalize_url(query)
+    else:
+        return " ".join(query.split()).casefold()
+
+
+def query_text(query: Query) -> str:
+    """Text of a query as recorded in the manifest."""
+    return (query.query or "") if isinstance(query, Classification) else query
+
+
+def canonical_key(string: Query) -> str:
+    """Canonical key of a query: lower-cased DOI, normalized URL or normalized line.
+
+    A DOI is found anywhere in the line, so "doi:10.1000/X", a doi.org link and a
+    full citation containing that DOI all share one key. Other lines are keyed by
+    the whole line normalized with ``normalize_title``: the extracted title stops at
+    the first period, so "1. Smith, J., ..." and "1. Doe, A., ..." would share a
+    key. Lines without letters or digits are keyed by themselves, stripped.
+
+    A ``Classification`` is keyed by its type and query, without classifying again.
+
+    Args:
+        string (str or Classification): Line containing a DOI, URL or reference
+
+    Returns:
+        str: Key under which the result of the query is stored
+    """
+    if isinstance(string, Classification):
+        classification, string = string, query_text(string)
+    else:
+        classification = _CLASSIFIER.classify(string)
+    if classification.type in (QueryType.DOI, QueryType.URL):
+        return normalize_query(classification)
+    return normalize_title(string) or string.strip()
+
+
+class RecentlySeen(object):
+    """Set of the ``capacity`` most recently added items, older items are forgotten."""
+
+    def __init__(self, capacity: int):
+        self._capacity = capacity
+        self._items: OrderedDict[str, None] = OrderedDict()
+
+    def add(self, item: str) -> bool:
+        """Add ``item`` and return whether it was already seen recently."""
+        if item in self._items:
+            self._items.move_to_end(item)
+            return True
+
+        self._items[item] = None
+        if len(self._items) > self._capacity:
+            self._items.popitem(last=False)
+        return False
+
+
+def iter_queries(lines: Iterable[Query], dedupe_size: int = 100_000) -> Iterator[Query]:
+    """Lazily strip lines, skip blank ones and drop recently seen duplicates.
+
+    Memory stays bounded by ``dedupe_size``: duplicates further apart than that are
+    not detected here, but are skipped by the manifest once the first one finished.
+    Classified queries are passed on as they are.
+
+    Args:
+        lines (iterable(str or Classification)): Lines of the input file
+        dedupe_size (int): Number of recent queries remembered for deduplication
+
+    Returns:
+        iterator(str or Classification): Cleaned queries
+    """
+    seen = RecentlySeen(dedupe_size)
+    for line in lines:
+        query = line.strip() if isinstance(line, str) else line
+        if query and not seen.add(query):
+            yield query
+
+
 def valid_fn(path: str, fn_name: str) -> str:
     """Shorten file name in case it exceeds system's maximum length."""
     PC_PATH_MAX = os.pathconf("/", "PC_PATH_MAX") - 4
@@ -90,3 +292,32 @@ def valid_fn(path: str, fn_name: str) -> str:
         fn_name = fn_name[0 : (PC_NAME_MAX - len(fn_name))]
 
     return fn_name
+
+
+def atomic_write(path: Path, chunks: Iterable[bytes]) -> int:
+    """Write ``chunks`` to a temporary file next to ``path`` and rename it into place.
+
+    A failure halfway through leaves no file at ``path``, so a truncated PDF is never
+    mistaken for a finished download.
+
+    Args:
+        path (Path): Final location of the file
+        chunks (iterable(bytes)): Body of the file in chunks
+
+    Returns:
+        int: Number of bytes written
+    """
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=".", suffix=".part")
+    n_bytes = 0
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in chunks:
+                if chunk:
+                    f.write(chunk)
+                    n_bytes += len(chunk)
+        os.replace(tmp_name, path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+    return n_bytes
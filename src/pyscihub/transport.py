@@ -0,0 +1,177 @@
+"""Pooled HTTP transport shared by search and PDF requests."""
+
+import threading
+from typing import TypedDict
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import MaxRetryError
+from urllib3.util import Retry
+
+# only these are retried by the transport, a failed search fails over to the next
+# mirror instead, under its rate limiter
+RETRY_METHODS = frozenset({"GET"})
+
+
+class TransportStats(TypedDict):
+    requests: int
+    connections_opened: int
+    connections_reused: int
+
+
+class _ConnectionCounter(object):
+    """Thread-safe counter of opened connections and sent requests."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.requests = 0
+
+    def count_connection(self):
+        with self._lock:
+            self.opened += 1
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+
+def _counting_pool(base: type, counter: _ConnectionCounter) -> type:
+    """Return a subclass of connection pool ``base`` that reports to ``counter``."""
+
+    def _new_conn(self):
+        counter.count_connection()
+        return base._new_conn(self)
+
+    def _make_request(self, *args, **kwargs):
+        counter.count_request()
+        return base._make_request(self, *args, **kwargs)
+
+    return type(
+        f"Counting{base.__name__}",
+        (base,),
+        {"_new_conn": _new_conn, "_make_request": _make_request},
+    )
+
+
+class _IdempotentRetry(Retry):
+    """Retry that never retries a method outside of ``allowed_methods``.
+
+    urllib3 retries connection errors of any method, this gives up right away on
+    e.g. a search POST, as if no retries were configured.
+    """
+
+    def increment(
+        self,
+        method=None,
+        url=None,
+        response=None,
+        error=None,
+        _pool=None,
+        _stacktrace=None,
+    ) -> Retry:
+        if method is not None and method.upper() not in self.allowed_methods:
+            raise MaxRetryError(_pool, url, error)
+        return super().increment(method, url, response, error, _pool, _stacktrace)
+
+
+class _CountingAdapter(HTTPAdapter):
+    """HTTPAdapter whose connection pools count opened and reused connections."""
+
+    def __init__(self, counter: _ConnectionCounter, **kwargs):
+        self._counter = counter
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _counting_pool(HTTPConnectionPool, self._counter),
+            "https": _counting_pool(HTTPSConnectionPool, self._counter),
+        }
+
+
+class Transport(object):
+    """Keep-alive HTTP session with connection pooling, timeouts and retries.
+
+    Only connection errors of GET requests are retried here. Searches, error
+    statuses and read timeouts are left to the mirror failover and rate limiters,
+    so a failing mirror costs a single request and timeout before the next is tried.
+    """
+
+    def __init__(
+        self,
+        pool_connections: int = 10,
+        pool_maxsize: int = 10,
+        timeout: float | tuple[float, float] = (10.0, 60.0),
+        retries: int = 3,
+        backoff_factor: float = 0.5,
+        backoff_jitter: float = 0.5,
+    ):
+        """Initialises the transport.
+
+        Args:
+            pool_connections (int): Number of hosts to keep a connection pool for
+            pool_maxsize (int): Maximum number of kept-alive connections per host
+            timeout (float or tuple): Connect and read timeout in seconds
+            retries (int): Number of retries for connection errors of GET requests
+            backoff_factor (float): Base of the exponential backoff between retries
+            backoff_jitter (float): Maximum random seconds added to every backoff
+        """
+        self.timeout = timeout
+        self._counter = _ConnectionCounter()
+
+        retry = _IdempotentRetry(
+            total=retries,
+            connect=retries,
+            read=0,
+            status=0,
+            other=0,
+            backoff_factor=backoff_factor,
+            backoff_jitter=backoff_jitter,
+            allowed_methods=RETRY_METHODS,
+            raise_on_status=False,
+        )
+        adapter = _CountingAdapter(
+            self._counter,
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=retry,
+        )
+
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Send a request through the pooled session using the default timeout.
+
+        Args:
+            method (str): HTTP method
+            url (str): URL to request
+            **kwargs: Passed on to ``requests.Session.request``
+
+        Returns:
+            Response: requests.Response object
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def stats(self) -> TransportStats:
+        """Return the number of requests sent and connections opened and reused."""
+        opened = self._counter.opened
+        sent = self._counter.requests
+        return {
+            "requests": sent,
+            "connections_opened": opened,
+            "connections_reused": max(sent - opened, 0),
+        }
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,41 @@
+"""Fixtures shared by the tests that download from local fake Sci-Hub mirrors."""
+
+import csv
+from pathlib import Path
+
+import pytest
+
+from pyscihub import pyscihub
+from pyscihub.ratelimit import RateLimiter
+from pyscihub.transport import Transport
+
+
+@pytest.fixture
+def make_scihub(tmp_path):
+    """Factory of ``SciHub``s for fake mirrors, failing fast and without rate limits."""
+
+    def make(
+        urls: str | list[str],
+        output: Path = tmp_path,
+        transport: Transport | None = None,
+    ) -> pyscihub.SciHub:
+        urls = [urls] if isinstance(urls, str) else urls
+        return pyscihub.SciHub(
+            urls,
+            output,
+            transport=transport or Transport(timeout=0.5, retries=0),
+            rate_limiters={url: RateLimiter(rate=1000, max_rate=1000) for url in urls},
+        )
+
+    return make
+
+
+@pytest.fixture
+def read_pdf_paths(tmp_path):
+    """Reads the pdf_paths.csv of an output folder as a dictionary by query."""
+
+    def read(output: Path = tmp_path) -> dict[str, str]:
+        with open(output / "pdf_paths.csv", newline="") as f:
+            return {row["query"]: row["pdf_path"] for row in csv.DictReader(f)}
+
+    return read
@@ -0,0 +1,204 @@
+"""Local stand-in for a Sci-Hub mirror serving search pages and PDFs."""
+
+import hashlib
+import html
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs
+
+PAGES = Path(__file__).parent / "data/pages"
+
+ARTICLE_PAGE = """<!DOCTYPE html>
+<html lang="en">
+<head><meta charset="UTF-8"><title>Sci-Hub | {title}</title></head>
+<body>
+    <div id="article">
+        <div id="buttons">
+            <ul>
+                <li><a href="#" onclick="location.href='{pdf_url}?download=true'">&darr; save</a></li>
+            </ul>
+        </div>
+        <div id="citation" onclick="clip(this)">{title}. <i>Journal of Fakes, 1</i>, 1&ndash;10.</div>
+        <div id="link"><a href="https://doi.org/{query}">https://doi.org/{query}</a></div>
+    </div>
+</body>
+</html>
+"""
+
+
+class FakeSciHub(object):
+    """Threaded HTTP server behaving like a Sci-Hub mirror.
+
+    ``mode`` decides what a search returns: ``"ok"`` (article page), ``"not_found"``,
+    ``"captcha"`` or ``"error"`` (HTTP 500). In ``"ok"`` mode, ``not_found_rate`` and
+    ``captcha_rate`` are the probabilities of serving those pages instead.
+    ``latency`` seconds are slept before every response and ``error_rate`` is the
+    probability of an HTTP 500 instead. PDFs are ``pdf_size`` bytes with a valid
+    header and trailer, served with an ETag and support for resuming with ``Range``.
+    The first ``broken_pdfs`` PDF responses are cut off halfway and the next
+    ``html_pdfs`` are HTML error pages with status 200.
+    """
+
+    def __init__(
+        self,
+        mode: str = "ok",
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        not_found_rate: float = 0.0,
+        captcha_rate: float = 0.0,
+        pdf_size: int = 4096,
+        seed: int = 0,
+        broken_pdfs: int = 0,
+        html_pdfs: int = 0,
+    ):
+        self.mode = mode
+        self.latency = latency
+        self.error_rate = error_rate
+        self.not_found_rate = not_found_rate
+        self.captcha_rate = captcha_rate
+        self.pdf_size = pdf_size
+        self.broken_pdfs = broken_pdfs
+        self.html_pdfs = html_pdfs
+        self.search_count = 0
+        self.pdf_count = 0
+        self.range_count = 0
+
+        self._pdf_body = b""
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, args=(0.05,), daemon=True
+        )
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self) -> "FakeSciHub":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeSciHub":
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def pdf_body(self) -> bytes:
+        if len(self._pdf_body) != self.pdf_size:
+            header = b"%PDF-1.4\n"
+            trailer = b"\n%%EOF\n"
+            padding = b"0" * max(self.pdf_size - len(header) - len(trailer), 0)
+            self._pdf_body = header + padding + trailer
+        return self._pdf_body
+
+    def _draw(self, probability: float) -> bool:
+        with self._lock:
+            return self._random.random() < probability
+
+    def _fail(self) -> bool:
+        return self._draw(self.error_rate)
+
+    def _pdf_response(self, headers) -> tuple[int, bytes, dict, bool]:
+        """Status, body, extra headers and whether to cut off the body of a PDF."""
+        with self._lock:
+            self.pdf_count += 1
+            broken = self.broken_pdfs > 0
+            self.broken_pdfs -= broken
+            html_page = not broken and self.html_pdfs > 0
+            self.html_pdfs -= html_page
+
+        if html_page:
+            return 200, b"<html><body>Server busy</body></html>", {}, False
+
+        body = self.pdf_body()
+        etag = f'"{hashlib.sha1(body).hexdigest()[:16]}"'
+        extra = {"ETag": etag, "Accept-Ranges": "bytes"}
+        mo = re.fullmatch(r"bytes=(\d+)-", headers.get("Range", ""))
+        if mo is None or headers.get("If-Range", etag) != etag:
+            return 200, body, extra, broken
+
+        start = int(mo.group(1))
+        if start >= len(body):
+            return 416, b"", extra, False
+        with self._lock:
+            self.range_count += 1
+        extra["Content-Range"] = f"bytes {start}-{len(body) - 1}/{len(body)}"
+        return 206, body[start:], extra, broken
+
+    def _search_page(self, query: str) -> tuple[int, bytes]:
+        with self._lock:
+            self.search_count += 1
+
+        if self.mode == "error" or self._fail():
+            return 500, b"Internal Server Error"
+        elif self.mode == "not_found" or self._draw(self.not_found_rate):
+            return 200, (PAGES / "not_found.html").read_bytes()
+        elif self.mode == "captcha" or self._draw(self.captcha_rate):
+            return 200, (PAGES / "captcha.html").read_bytes()
+
+        key = hashlib.sha1(query.encode()).hexdigest()
+        page = ARTICLE_PAGE.format(
+            title=f"Fake article {key[:12]}",
+            pdf_url=f"{self.url}/pdf/{key}.pdf",
+            query=html.escape(query),
+        )
+        return 200, page.encode()
+
+    def _handler(self) -> type:
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                form = parse_qs(self.rfile.read(length).decode())
+                time.sleep(fake.latency)
+                self._send(*fake._search_page(form.get("request", [""])[0]))
+
+            def do_GET(self):
+                time.sleep(fake.latency)
+                if not self.path.startswith("/pdf/"):
+                    self._send(404, b"Not Found")
+                elif fake._fail():
+                    self._send(500, b"Internal Server Error")
+                else:
+                    status, body, headers, broken = fake._pdf_response(self.headers)
+                    self._send(status, body, "application/pdf", headers, broken)
+
+            def _send(
+                self,
+                status: int,
+                body: bytes,
+                content_type: str = "text/html",
+                headers: dict | None = None,
+                broken: bool = False,
+            ):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or dict()).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                if broken:
+                    # send half of the body and hang up
+                    self.wfile.write(body[: len(body) // 2])
+                    self.close_connection = True
+                else:
+                    self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,73 @@
+"""Tests for `pyscihub.cache`."""
+
+import time
+
+from pyscihub import pyscihub, tools
+from pyscihub.cache import ResolutionCache
+from pyscihub.transport import Transport
+
+from .fake_scihub import FakeSciHub
+
+RESULT = {"citation": "Cruz et al.", "link": "https://doi.org/x", "pdf": "https://x"}
+
+
+def test_ttl_and_lru_eviction(tmp_path):
+    """Test that expired entries are dropped and the least recently used evicted."""
+    cache = ResolutionCache(tmp_path / "cache.sqlite", max_entries=2, evict_every=1)
+    cache.put("a", RESULT)
+    cache.put("b", RESULT)
+    assert cache.get("a") == RESULT
+
+    # "b" is the least recently used entry
+    time.sleep(0.01)
+    cache.put("c", RESULT)
+    assert cache.get("b") is None
+    assert cache.get("a") == RESULT
+    assert len(cache) == 2
+
+    cache.ttl = 0
+    assert cache.get("a") is None
+    assert (cache.hits, cache.misses) == (2, 2)
+
+
+def test_cache_is_shared_between_connections(tmp_path):
+    """Test that a second process opening the same file sees cached results."""
+    ResolutionCache(tmp_path / "cache.sqlite").put("a", RESULT)
+
+    assert ResolutionCache(tmp_path / "cache.sqlite").get("a") == RESULT
+
+
+def test_normalize_query():
+    """Test that DOI and title variants share a cache key."""
+    key = tools.normalize_query(tools.classify_query("doi:10.1016/J.COR.2016.09.025"))
+    assert key == "10.1016/j.cor.2016.09.025"
+    assert tools.normalize_query(tools.classify_query("Iterated  local SEARCH")) == (
+        "iterated local search"
+    )
+
+
+def test_cache_hit_skips_search(tmp_path):
+    """Test that a cached query goes straight to the PDF fetch."""
+    cache = ResolutionCache(tmp_path / "cache.sqlite")
+    with FakeSciHub() as mirror:
+        first = pyscihub.SciHub(mirror.url, tmp_path / "a", cache=cache)
+        first.download("10.1000/A1")
+        second = pyscihub.SciHub(mirror.url, tmp_path / "b", cache=cache)
+        second.download("10.1000/a1")
+
+        assert mirror.search_count == 1
+        assert mirror.pdf_count == 2
+
+
+def test_stale_cache_entry_is_searched_again(tmp_path):
+    """Test that a cached PDF link that stopped working is resolved again."""
+    cache = ResolutionCache(tmp_path / "cache.sqlite")
+    with FakeSciHub() as mirror:
+        cache.put("10.1000/a1", {**RESULT, "pdf": f"{mirror.url}/moved.pdf"})
+        transport = Transport(retries=0)
+        scihub = pyscihub.SciHub(mirror.url, tmp_path, transport=transport, cache=cache)
+        scihub.download("10.1000/a1")
+
+        assert mirror.search_count == 1
+        assert mirror.pdf_count == 1
+        assert cache.get("10.1000/a1")["pdf"].startswith(f"{mirror.url}/pdf/")
@@ -0,0 +1,51 @@
+"""Tests for `pyscihub.extract`."""
+
+from pathlib import Path
+
+import pytest
+
+from pyscihub import extract
+
+PAGES = Path(__file__).parent / "data/pages"
+
+
+def read_page(name: str) -> bytes:
+    return (PAGES / name).read_bytes()
+
+
+@pytest.mark.parametrize(
+    "name, status",
+    [
+        ("article.html", "ok"),
+        ("not_found.html", "not_found"),
+        ("captcha.html", "captcha"),
+    ],
+)
+def test_page_status(name, status):
+    """Test that missing articles and CAPTCHA pages are detected on the raw bytes."""
+    assert extract.page_status(read_page(name)) == status
+
+
+def test_fast_extract_matches_soup():
+    """Test that the fast path returns exactly what BeautifulSoup returns."""
+    page = read_page("article.html")
+
+    data = extract.fast_extract(page)
+    assert data == extract.soup_extract(page)
+    assert data["pdf"] == (
+        "https://zero.sci-hub.se/5720/3c2a9e34f5c7de3f5f2a8f0e4c1a1c5b/cruz2017.pdf"
+        "?download=true"
+    )
+    assert data["link"] == "https://doi.org/10.1016/j.cor.2016.09.025"
+    assert data["citation"].startswith(
+        "Cruz, F., Subramanian, A., Bruck, B. P., & Iori"
+    )
+
+
+def test_extract_falls_back_to_soup():
+    """Test that pages the fast path cannot handle are parsed with BeautifulSoup."""
+    page = read_page("article_nested.html")
+
+    assert extract.fast_extract(page) is None
+    assert extract.extract_data(page) == extract.soup_extract(page)
+    assert extract.fast_extract(read_page("not_found.html")) is None
@@ -0,0 +1,145 @@
+"""Tests for `pyscihub.manifest`."""
+
+import csv
+import sqlite3
+
+from click.testing import CliRunner
+
+from pyscihub import cli
+from pyscihub import manifest as manifest_module
+from pyscihub.manifest import CSV_NAME, DB_NAME, Manifest, Reason
+
+
+def test_record_is_committed_immediately(tmp_path):
+    """Test that a recorded result is visible to a second connection right away."""
+    manifest = Manifest.open(tmp_path)
+    manifest.record("query a", "/tmp/a.pdf")
+    manifest.record("query b", "")
+    manifest.record("query a", "/tmp/a2.pdf")
+
+    conn = sqlite3.connect(tmp_path / DB_NAME)
+    rows = conn.execute(
+        """SELECT query, pdf_path FROM queries JOIN results USING (key)
+        ORDER BY queries.rowid"""
+    ).fetchall()
+    assert rows == [("query a", "/tmp/a2.pdf"), ("query b", "")]
+    assert "query b" in manifest
+    assert manifest.get("query c") is None
+    assert len(manifest) == 2
+
+
+def test_migrate_and_export_csv(tmp_path):
+    """Test that an existing pdf_paths.csv is migrated and exported unchanged."""
+    rows = [["query", "pdf_path"], ["query, with comma", "/tmp/a.pdf"], ["b", ""]]
+    with open(tmp_path / CSV_NAME, "w", newline="") as f:
+        csv.writer(f).writerows(rows)
+
+    manifest = Manifest.open(tmp_path)
+    assert list(manifest.items(batch_size=1)) == [
+        ("query, with comma", "/tmp/a.pdf"),
+        ("b", ""),
+    ]
+
+    assert manifest.export_csv(tmp_path / "export.csv") == 2
+    assert list(csv.reader(open(tmp_path / "export.csv", newline=""))) == rows
+
+
+def test_manifest_cli(tmp_path):
+    """Test the manifest import and export commands."""
+    with open(tmp_path / "old.csv", "w", newline="") as f:
+        csv.writer(f).writerows([["query", "pdf_path"], ["a", "/tmp/a.pdf"]])
+
+    runner = CliRunner()
+    result = runner.invoke(
+        cli.cli, ["-o", str(tmp_path), "manifest", "import", str(tmp_path / "old.csv")]
+    )
+    assert result.exit_code == 0
+    assert "Imported 1 rows." in result.output
+
+    result = runner.invoke(cli.cli, ["-o", str(tmp_path), "manifest", "export"])
+    assert result.exit_code == 0
+    assert (tmp_path / CSV_NAME).is_file()
+
+
+def test_variants_share_a_result(tmp_path):
+    """Test that DOI variants are stored once and every original query maps to it."""
+    manifest = Manifest.open(tmp_path)
+    manifest.record("10.1016/J.COR.2016.09.025", "/tmp/a.pdf")
+    manifest.record("https://doi.org/10.1016/j.cor.2016.09.025", "")
+    manifest.alias("doi:10.1016/j.cor.2016.09.025", "10.1016/j.cor.2016.09.025")
+
+    # a failed variant does not overwrite the download
+    assert list(manifest.results()) == [("10.1016/j.cor.2016.09.025", "/tmp/a.pdf")]
+    assert list(manifest.items()) == [
+        ("10.1016/J.COR.2016.09.025", "/tmp/a.pdf"),
+        ("https://doi.org/10.1016/j.cor.2016.09.025", "/tmp/a.pdf"),
+        ("doi:10.1016/j.cor.2016.09.025", "/tmp/a.pdf"),
+    ]
+    assert manifest.get("Some citation, doi: 10.1016/j.COR.2016.09.025") == (
+        "/tmp/a.pdf"
+    )
+
+
+def test_migrate_query_indexed_database(tmp_path):
+    """Test that a database of an older version is migrated to canonical keys."""
+    conn = sqlite3.connect(tmp_path / DB_NAME)
+    conn.execute(
+        "CREATE TABLE results (query TEXT PRIMARY KEY, pdf_path TEXT, updated REAL)"
+    )
+    conn.executemany(
+        "INSERT INTO results VALUES (?, ?, 0)",
+        [("10.1000/A\n", "/tmp/a.pdf"), ("doi:10.1000/a", ""), ("b", "")],
+    )
+    conn.commit()
+    conn.close()
+
+    manifest = Manifest.open(tmp_path)
+    assert list(manifest.items()) == [
+        ("10.1000/A", "/tmp/a.pdf"),
+        ("doi:10.1000/a", "/tmp/a.pdf"),
+        ("b", ""),
+    ]
+    assert len(list(manifest.results())) == 2
+
+
+def test_rekey_title_results(tmp_path):
+    """Test that results stored under cut-off title keys move to the new keys."""
+    manifest = Manifest.open(tmp_path)
+    # keys as computed before titles were keyed by the whole line
+    manifest.record("1. Smith, J., Graph search. Nature, 2001.", "/tmp/a.pdf", "1.")
+    manifest.record("1. Doe, A., Protein folding. Cell, 1999.", "/tmp/b.pdf", "1.")
+    manifest.record("Iterated local search. Springer", "/tmp/c.pdf", "iterated")
+    manifest._conn.execute("PRAGMA user_version = 0")
+    manifest.close()
+
+    manifest = Manifest.open(tmp_path)
+    # the shared result is ambiguous, the other one is kept
+    assert manifest.get("1. Smith, J., Graph search. Nature, 2001.") is None
+    assert manifest.get("1. Doe, A., Protein folding. Cell, 1999.") is None
+    assert manifest.get("Iterated local search. Springer") == "/tmp/c.pdf"
+    assert list(manifest.results()) == [
+        ("iterated local search springer", "/tmp/c.pdf")
+    ]
+    assert len(manifest) == 3
+
+
+def test_failures_back_off(tmp_path, monkeypatch):
+    """Test that transient failures back off exponentially and permanent ones stay."""
+    monkeypatch.setattr(manifest_module.time, "time", lambda: 1000.0)
+    manifest = Manifest(tmp_path / DB_NAME, retry_base=10, retry_max=25)
+    manifest.record_failure("10.1000/missing", Reason.NOT_FOUND)
+    for _ in range(3):
+        manifest.record_failure("10.1000/busy", Reason.CAPTCHA)
+    manifest.record("10.1000/done", "/tmp/a.pdf")
+    manifest.record_failure("10.1000/DONE", Reason.HTTP_ERROR)
+
+    assert list(manifest.failures(batch_size=1)) == [
+        ("10.1000/missing", Reason.NOT_FOUND, 1, None),
+        ("10.1000/busy", Reason.CAPTCHA, 3, 1025.0),
+    ]
+    # the failed variant maps to the download
+    assert manifest.get("10.1000/DONE") == "/tmp/a.pdf"
+
+    # a success clears the failure
+    manifest.record("10.1000/busy", "/tmp/b.pdf")
+    assert [key for key, *_ in manifest.failures()] == ["10.1000/missing"]
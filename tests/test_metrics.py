@@ -0,0 +1,104 @@
+"""Tests for `pyscihub.metrics`."""
+
+import json
+import pstats
+import threading
+
+import pytest
+from click.testing import CliRunner
+
+from pyscihub import cli, pyscihub
+from pyscihub.metrics import Metrics, MetricsExporter, Profiler
+
+from .fake_scihub import FakeSciHub
+
+
+def test_histogram_and_prometheus_export(tmp_path):
+    """Test that durations end up in cumulative buckets of the text export."""
+    metrics = Metrics()
+    metrics.observe("search", 0.003)
+    metrics.observe("search", 0.2)
+    metrics.count("success")
+
+    text = metrics.to_prometheus()
+    assert 'pyscihub_phase_seconds_bucket{phase="search",le="0.001"} 0' in text
+    assert 'pyscihub_phase_seconds_bucket{phase="search",le="0.005"} 1' in text
+    assert 'pyscihub_phase_seconds_bucket{phase="search",le="+Inf"} 2' in text
+    assert 'pyscihub_phase_seconds_count{phase="search"} 2' in text
+    assert 'pyscihub_outcomes_total{outcome="success"} 1' in text
+
+    with MetricsExporter(metrics, tmp_path / "metrics.json", interval=0.01):
+        metrics.count("captcha")
+    summary = json.loads((tmp_path / "metrics.json").read_text())
+    assert summary["outcomes"]["captcha"] == 1
+    assert summary["phases"]["search"]["max"] == 0.2
+
+
+def test_profiler_profiles_one_thread(tmp_path):
+    """Test that the profiler dumps a loadable pstats file of a single thread."""
+    profiler = Profiler()
+    profiler.call(sum, range(10))
+    profiler.dump(tmp_path / "profile.pstats")
+    assert pstats.Stats(str(tmp_path / "profile.pstats")).total_calls > 0
+
+    errors = []
+
+    def call():
+        try:
+            profiler.call(sum, range(10))
+        except RuntimeError as err:
+            errors.append(err)
+
+    thread = threading.Thread(target=call)
+    thread.start()
+    thread.join()
+    assert len(errors) == 1
+
+
+def test_profile_needs_one_worker(tmp_path):
+    """Test that profiling concurrent downloads is rejected up front."""
+    result = CliRunner().invoke(
+        cli.cli,
+        ["-o", str(tmp_path), "--profile", str(tmp_path / "profile.pstats")]
+        + ["file", "--jobs", "4", "-"],
+        input="10.1000/a1\n",
+    )
+    assert result.exit_code == 2
+    assert "--profile needs a single worker" in result.output
+
+    scihub = pyscihub.SciHub("https://sci-hub.example", tmp_path, profiler=Profiler())
+    with pytest.raises(ValueError):
+        scihub.iter_download(["10.1000/a1"], concurrency=4)
+
+
+def test_cli_exports_metrics_and_profile(tmp_path):
+    """Test that a CLI run records every phase and outcome."""
+    with FakeSciHub(not_found_rate=0.5, seed=1) as mirror:
+        result = CliRunner().invoke(
+            cli.cli,
+            [
+                "-o",
+                str(tmp_path),
+                "-m",
+                mirror.url,
+                "--rate",
+                "1000",
+                "--max-rate",
+                "1000",
+                "--metrics",
+                str(tmp_path / "metrics.prom"),
+                "--profile",
+                str(tmp_path / "profile.pstats"),
+                "file",
+                "-",
+            ],
+            input="10.1000/a1\n10.1000/a2\n10.1000/a3\n10.1000/a4\nnot a query.\n",
+        )
+    assert result.exit_code == 0
+
+    text = (tmp_path / "metrics.prom").read_text()
+    for phase in ("classify", "search", "parse", "pdf_get", "write"):
+        assert f'pyscihub_phase_seconds_count{{phase="{phase}"}} 0' not in text
+    assert 'pyscihub_outcomes_total{outcome="not_found"} 0' not in text
+    assert 'pyscihub_outcomes_total{outcome="success"} 0' not in text
+    assert (tmp_path / "profile.pstats").is_file()
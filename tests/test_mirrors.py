@@ -0,0 +1,85 @@
+"""Tests for mirror failover against local fake Sci-Hub mirrors."""
+
+import pytest
+
+from pyscihub.mirrors import MirrorPool
+from pyscihub.transport import Transport
+
+from .fake_scihub import FakeSciHub
+
+
+def test_pool_prefers_healthy_mirrors():
+    """Test that failing and slow mirrors are ranked behind healthy ones."""
+    pool = MirrorPool(["https://a", "https://b", "https://c"])
+    a, b, c = pool.mirrors
+    assert pool.ranked() == [a, b, c]
+
+    pool.record_failure(a)
+    pool.record_success(b, 2.0)
+    pool.record_success(c, 0.1)
+    assert pool.ranked() == [c, b, a]
+
+    with pytest.raises(ValueError):
+        MirrorPool([])
+
+
+@pytest.mark.parametrize("failing_mode", ["captcha", "error"])
+def test_failover(tmp_path, failing_mode, make_scihub, read_pdf_paths):
+    """Test that queries move to the next mirror after a CAPTCHA or HTTP error."""
+    with FakeSciHub(mode=failing_mode) as bad, FakeSciHub() as good:
+        scihub = make_scihub([bad.url, good.url])
+        scihub.download(["10.1000/a1", "10.1000/a2", "10.1000/a3"])
+
+        pdf_paths = read_pdf_paths()
+        assert all(pdf_paths.values())
+        assert good.pdf_count == 3
+        # the failing mirror is ranked last after its first failure
+        assert bad.search_count == 1
+        assert scihub.mirrors.ranked()[0].url == good.url
+
+        # the failed search is counted as an attempt, each query has one outcome
+        assert scihub.metrics.outcomes["success"] == 3
+        assert sum(scihub.metrics.outcomes.values()) == 3
+        assert sum(scihub.metrics.failures.values()) == 1
+
+
+def test_default_transport_fails_over_at_once(tmp_path, make_scihub):
+    """Test that a failing search is not retried by the transport before failover."""
+    with FakeSciHub(mode="error") as bad, FakeSciHub() as good:
+        scihub = make_scihub([bad.url, good.url], transport=Transport())
+        scihub.download("10.1000/a1")
+
+        assert bad.search_count == 1
+        assert good.pdf_count == 1
+        assert scihub.mirrors.mirrors[0].limiter.rate < 1000
+
+
+def test_failover_on_timeout(tmp_path, make_scihub, read_pdf_paths):
+    """Test that queries move to the next mirror when a mirror times out."""
+    with FakeSciHub(latency=1.0) as slow, FakeSciHub() as good:
+        scihub = make_scihub([slow.url, good.url])
+        scihub.download("10.1000/a1")
+
+        assert read_pdf_paths()["10.1000/a1"]
+        assert good.pdf_count == 1
+
+
+def test_not_found_does_not_fail_over(tmp_path, make_scihub):
+    """Test that a missing article is a valid answer and not retried elsewhere."""
+    with FakeSciHub(mode="not_found") as missing, FakeSciHub() as good:
+        scihub = make_scihub([missing.url, good.url])
+        scihub.download("10.1000/a1")
+
+        assert missing.search_count == 1
+        assert good.search_count == 0
+
+
+def test_captcha_lowers_rate(tmp_path, make_scihub):
+    """Test that a CAPTCHA halves the search rate of the mirror that showed it."""
+    with FakeSciHub(mode="captcha") as bad, FakeSciHub() as good:
+        scihub = make_scihub([bad.url, good.url])
+        scihub.download("10.1000/a1")
+
+        bad_mirror, good_mirror = scihub.mirrors.mirrors
+        assert bad_mirror.limiter.rate == 500
+        assert good_mirror.limiter.rate == 1000
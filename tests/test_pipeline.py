@@ -0,0 +1,99 @@
+"""Tests for `pyscihub.pipeline`."""
+
+import threading
+import time
+
+import pytest
+
+from pyscihub.pipeline import Pipeline
+
+
+def test_every_query_finishes():
+    """Test that forwarded and finished queries all come out of the pipeline."""
+
+    def resolve(query):
+        if query % 3 == 0:
+            return False, "skipped"
+        return True, query * 10
+
+    def fetch(query, item):
+        if query == 4:
+            raise RuntimeError("connection reset")
+        return item + 1
+
+    pipeline = Pipeline(resolve, fetch, resolve_workers=2, fetch_workers=3)
+    results = dict(pipeline.run(range(20)))
+
+    assert len(results) == 20
+    assert results[3] == "skipped"
+    assert results[4] is None
+    assert results[5] == 51
+
+
+def test_stages_use_their_own_workers():
+    """Test that a slow fetch stage gets more workers than the resolve stage."""
+    lock = threading.Lock()
+    active = {"resolve": 0, "fetch": 0}
+    peak = {"resolve": 0, "fetch": 0}
+
+    def track(stage, seconds):
+        with lock:
+            active[stage] += 1
+            peak[stage] = max(peak[stage], active[stage])
+        time.sleep(seconds)
+        with lock:
+            active[stage] -= 1
+
+    def resolve(query):
+        track("resolve", 0.005)
+        return True, query
+
+    def fetch(query, item):
+        track("fetch", 0.05)
+        return item
+
+    pipeline = Pipeline(resolve, fetch, resolve_workers=1, fetch_workers=4)
+    assert len(list(pipeline.run(range(20)))) == 20
+    assert peak["resolve"] == 1
+    assert 1 < peak["fetch"] <= 4
+
+
+def test_queries_are_read_lazily():
+    """Test that a blocked fetch stage stops the input from being read."""
+    read = []
+    release = threading.Event()
+
+    def queries():
+        for i in range(100):
+            read.append(i)
+            yield i
+
+    def fetch(query, item):
+        release.wait()
+        return item
+
+    pipeline = Pipeline(lambda q: (True, q), fetch, queue_size=2)
+    results = pipeline.run(queries())
+    time.sleep(0.3)
+
+    # one query per worker plus two per queue, and one waiting to be put
+    assert len(read) < 10
+    release.set()
+    assert len(list(results)) == 100
+
+
+def test_input_error_is_raised():
+    """Test that an error while reading the queries is raised by run()."""
+
+    def queries():
+        yield 1
+        raise OSError("disk gone")
+
+    pipeline = Pipeline(lambda q: (True, q), lambda q, item: item)
+    with pytest.raises(OSError):
+        list(pipeline.run(queries()))
+
+
+def test_worker_count_must_be_positive():
+    with pytest.raises(ValueError):
+        Pipeline(lambda q: (True, q), lambda q, item: item, fetch_workers=0)
@@ -3,9 +3,12 @@
 """Tests for `pyscihub` package."""
 
 
+import asyncio
 import csv
 import re
 import shutil
+import subprocess
+import sys
 from pathlib import Path
 
 import pytest
@@ -13,6 +16,8 @@ from click.testing import CliRunner
 
 from pyscihub import cli, pyscihub, tools
 
+from .fake_scihub import FakeSciHub
+
 TEST_REFERENCES = [
     {
         "query": "A heuristic algorithm for a single vehicle static bike sharing rebalancing problem",
@@ -150,14 +155,20 @@ def test_populated_pdf_paths(init_populated_scihub: pyscihub.SciHub):
     pdf_paths = scihub._get_pdf_paths()
     print(pdf_paths)
     assert pdf_paths[
-        "A heuristic algorithm for a single vehicle static bike sharing rebalancing problem"
+        tools.canonical_key(
+            "A heuristic algorithm for a single vehicle static bike sharing rebalancing problem"
+        )
     ]
     assert pdf_paths[
-        "Forbes, H., et al., The Effects of Group Membership on College Students' Social Exclusion of Peers and Bystander Behavior. Journal of Psychology, 2020. 154(1): p. 15-37."
+        tools.canonical_key(
+            "Forbes, H., et al., The Effects of Group Membership on College Students' Social Exclusion of Peers and Bystander Behavior. Journal of Psychology, 2020. 154(1): p. 15-37."
+        )
     ]
     with pytest.raises(KeyError) as excinfo:
         pdf_paths[
-            "Foo, B., et al., hERG quality control and the long QT syndrome. Journal of Physiology, 2016. 594(9): p. 2469-81."
+            tools.canonical_key(
+                "Foo, B., et al., hERG quality control and the long QT syndrome. Journal of Physiology, 2016. 594(9): p. 2469-81."
+            )
         ]
         assert (
             "KeyError: 'Foo, B., et al., hERG quality control and the long QT syndrome. Journal of Physiology, 2016. 594(9): p. 2469-81.'"
@@ -180,3 +191,226 @@ def test_command_line_interface():
     help_result = runner.invoke(cli.cli, ["--help"])
     assert help_result.exit_code == 0
     assert "Show this message" in help_result.output
+
+
+def test_single_query_is_not_split(init_empty_scihub: pyscihub.SciHub, monkeypatch):
+    """Test that a single string query is downloaded as one query."""
+    scihub = init_empty_scihub
+    seen = []
+    monkeypatch.setattr(scihub, "_fetch_search", lambda query: seen.append(query))
+
+    scihub.download("10.1016/j.cor.2016.09.025")
+    assert seen == ["10.1016/j.cor.2016.09.025"]
+
+
+def test_concurrent_download(init_empty_scihub: pyscihub.SciHub, monkeypatch):
+    """Test that concurrent downloads record every query in pdf_paths.csv."""
+    scihub = init_empty_scihub
+    queries = [f"query {i}" for i in range(25)]
+
+    def fake_resolve(query):
+        return {"key": query, "clean_query": query, "data": {}, "cached": False}
+
+    def fake_fetch(query, resolved):
+        if query == "query 3":
+            raise RuntimeError("connection reset")
+        return f"/tmp/{query}.pdf"
+
+    monkeypatch.setattr(scihub, "_resolve_query", fake_resolve)
+    monkeypatch.setattr(scihub, "_fetch_resolved", fake_fetch)
+    scihub.download(queries, concurrency=4)
+
+    rows = list(csv.DictReader(open(scihub._output_path / "pdf_paths.csv")))
+    pdf_paths = {row["query"]: row["pdf_path"] for row in rows}
+    assert len(pdf_paths) == 25
+    assert pdf_paths["query 3"] == ""
+    assert pdf_paths["query 7"] == "/tmp/query 7.pdf"
+
+
+def test_host_slot_is_shared_per_host(init_empty_scihub: pyscihub.SciHub):
+    """Test that requests to the same host share one concurrency limit."""
+    scihub = init_empty_scihub
+
+    slot = scihub._host_slot("https://sci-hub.se/")
+    assert slot is scihub._host_slot("https://sci-hub.se/some/other/path")
+    assert slot is not scihub._host_slot("https://moscow.sci-hub.se/pdf.pdf")
+
+
+def test_interrupt_saves_pdf_paths(init_empty_scihub: pyscihub.SciHub, monkeypatch):
+    """Test that finished queries are saved when the download is interrupted."""
+    scihub = init_empty_scihub
+
+    def fake_fetch(query):
+        if query == "query 5":
+            raise KeyboardInterrupt
+        return f"/tmp/{query}.pdf"
+
+    monkeypatch.setattr(scihub, "_fetch_search", fake_fetch)
+    scihub.download([f"query {i}" for i in range(10)], concurrency=1)
+
+    rows = list(csv.DictReader(open(scihub._output_path / "pdf_paths.csv")))
+    assert [row["query"] for row in rows] == [f"query {i}" for i in range(5)]
+
+
+def test_file_command_reads_stdin(tmp_path, monkeypatch):
+    """Test that the file command streams queries from stdin."""
+    seen = []
+
+    def fake_fetch(self, query):
+        seen.append(query)
+        return f"/tmp/{query}.pdf"
+
+    monkeypatch.setattr(pyscihub.SciHub, "_fetch_search", fake_fetch)
+    runner = CliRunner()
+    result = runner.invoke(
+        cli.cli, ["-o", str(tmp_path), "file", "-"], input="q1\n\nq2\nq1\n"
+    )
+    assert result.exit_code == 0
+    assert seen == ["q1", "q2"]
+
+
+def test_query_variants_are_downloaded_once(tmp_path):
+    """Test that variants of a DOI share one download and all map to its PDF."""
+    queries = [
+        "10.1000/VARIANT",
+        "doi:10.1000/variant",
+        "https://doi.org/10.1000/variant",
+    ]
+    with FakeSciHub() as mirror:
+        scihub = pyscihub.SciHub(mirror.url, tmp_path)
+        scihub.download(queries, concurrency=2)
+        scihub.download(["Some citation. doi: 10.1000/Variant"])
+        assert mirror.search_count == 1
+
+    rows = list(csv.DictReader(open(tmp_path / "pdf_paths.csv")))
+    assert sorted(row["query"] for row in rows) == sorted(
+        queries + ["Some citation. doi: 10.1000/Variant"]
+    )
+    assert len({row["pdf_path"] for row in rows}) == 1
+    assert rows[0]["pdf_path"]
+
+
+def test_get_pdf_paths_lists_output_once(tmp_path, monkeypatch):
+    """Test that PDFs in the output folder are checked without a stat per row."""
+    outside = tmp_path / "elsewhere.pdf"
+    outside.write_bytes(b"%PDF")
+    output = tmp_path / "output"
+    scihub = pyscihub.SciHub("https://sci-hub.se", output)
+    (output / "a.pdf").write_bytes(b"%PDF")
+    scihub.manifest.record("10.1000/a", str(output.resolve() / "a.pdf"))
+    scihub.manifest.record("10.1000/b", str(output.resolve() / "b.pdf"))
+    scihub.manifest.record("10.1000/c", str(outside))
+
+    checked = []
+    isfile = pyscihub.os.path.isfile
+    monkeypatch.setattr(
+        pyscihub.os.path, "isfile", lambda path: checked.append(path) or isfile(path)
+    )
+    assert set(scihub._get_pdf_paths()) == {"10.1000/a", "10.1000/c"}
+    assert checked == [str(outside)]
+
+
+def test_failures_are_not_retried_too_soon(tmp_path):
+    """Test that failed queries are skipped in the next run until they are due."""
+    with FakeSciHub(mode="not_found") as mirror:
+        scihub = pyscihub.SciHub(mirror.url, tmp_path)
+        scihub.download(["10.1000/missing"])
+        mirror.mode = "captcha"
+        scihub.download(["10.1000/missing", "10.1000/busy"])
+        assert mirror.search_count == 2
+
+        # not due yet, unless all failures are retried
+        mirror.mode = "ok"
+        scihub.download(["10.1000/missing", "10.1000/busy"])
+        assert mirror.search_count == 2
+        scihub.download(["10.1000/busy"], retry_failed=True)
+        assert mirror.search_count == 3
+
+    failures = {key: reason for key, reason, *_ in scihub.manifest.failures()}
+    assert failures == {"10.1000/missing": pyscihub.Reason.NOT_FOUND}
+    assert scihub.manifest.get("10.1000/busy")
+
+
+def test_numbered_references_are_not_skipped(tmp_path):
+    """Test that references sharing their text up to the first period are kept apart."""
+    queries = [
+        "1. Smith, J., Graph search. Nature, 2001.",
+        "1. Doe, A., Protein folding. Cell, 1999.",
+    ]
+    with FakeSciHub(mode="not_found") as mirror:
+        scihub = pyscihub.SciHub(mirror.url, tmp_path)
+        results = list(scihub.iter_download(queries))
+    assert [result["status"] for result in results] == ["not_found", "not_found"]
+    assert len({result["key"] for result in results}) == 2
+
+
+def test_iter_download_yields_results_as_they_complete(tmp_path):
+    """Test that every query gets a structured result, including skipped ones."""
+    with FakeSciHub(pdf_size=10_000) as mirror:
+        scihub = pyscihub.SciHub(mirror.url, tmp_path)
+        (result,) = scihub.iter_download(["doi:10.1000/A"])
+        assert result["query"] == "doi:10.1000/A"
+        assert result["key"] == "10.1000/a"
+        assert result["status"] == "success"
+        assert result["data"]["pdf"].startswith(f"{mirror.url}/pdf/")
+        assert result["size"] == 10_000
+        assert result["resolve_time"] > 0 and result["fetch_time"] > 0
+
+        mirror.mode = "not_found"
+        queries = ["10.1000/a", "10.1000/b", "https://doi.org/10.1000/B"]
+        results = list(scihub.iter_download(iter(queries), concurrency=2))
+
+    by_query = {result["query"]: result for result in results}
+    assert list(by_query) == ["10.1000/a", "10.1000/b", "https://doi.org/10.1000/B"]
+    assert by_query["10.1000/a"]["status"] == "existing"
+    assert by_query["10.1000/a"]["pdf_path"] == result["pdf_path"]
+    # the variant gets the result of the query it duplicates
+    assert by_query["10.1000/b"]["status"] == "not_found"
+    assert by_query["https://doi.org/10.1000/B"]["status"] == "not_found"
+    assert by_query["10.1000/b"]["data"] is None
+
+
+def test_aiter_download(tmp_path):
+    """Test that the asynchronous iterator yields the same results."""
+
+    async def collect(scihub):
+        return [result async for result in scihub.aiter_download(["10.1000/a"])]
+
+    with FakeSciHub() as mirror:
+        scihub = pyscihub.SciHub(mirror.url, tmp_path)
+        (result,) = asyncio.run(collect(scihub))
+    assert result["status"] == "success"
+    assert scihub.manifest.get("10.1000/a") == result["pdf_path"]
+
+
+def test_cli_import_is_lazy():
+    """Test that the CLI starts without importing requests or BeautifulSoup."""
+    code = (
+        "import sys, pyscihub.cli; "
+        "print(any(m in sys.modules for m in ('requests', 'bs4')))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip() == "False"
+
+
+def test_finished_keys_leave_the_schedule(tmp_path):
+    """Test that only the keys of queries in flight are remembered."""
+    scihub = pyscihub.SciHub("https://sci-hub.example", tmp_path)
+    schedule = pyscihub._Schedule()
+    pdf_paths: dict[str, str] = dict()
+    queries = scihub._exclude_existing_queries(
+        iter(["10.1000/a", "doi:10.1000/A", "10.1000/b"]), pdf_paths, schedule
+    )
+    assert next(queries) == "10.1000/a"
+    assert next(queries) == "10.1000/b"
+    assert schedule.keys == {"10.1000/a", "10.1000/b"}
+
+    result = scihub._outcome("10.1000/a", pyscihub.Reason.NOT_FOUND)
+    pdf_paths[result["key"]] = ""
+    (copy,) = scihub._release(schedule, pdf_paths, result)
+    assert copy["query"] == "doi:10.1000/A"
+    assert copy["status"] == "not_found"
+    assert schedule.keys == {"10.1000/b"}
+    assert not schedule.held
@@ -0,0 +1,35 @@
+"""Tests for `pyscihub.ratelimit`."""
+
+import time
+
+import pytest
+
+from pyscihub.ratelimit import RateLimiter
+
+
+def test_aimd():
+    """Test additive increase on success and multiplicative decrease on throttling."""
+    limiter = RateLimiter(rate=1.0, min_rate=0.2, max_rate=1.25, increase=0.1)
+
+    limiter.on_success()
+    assert limiter.rate == pytest.approx(1.1)
+    limiter.on_success()
+    limiter.on_success()
+    assert limiter.rate == 1.25
+
+    limiter.on_throttle()
+    assert limiter.rate == 0.625
+    for _ in range(5):
+        limiter.on_throttle()
+    assert limiter.rate == 0.2
+
+
+def test_acquire_respects_rate():
+    """Test that requests are spaced according to the current rate."""
+    limiter = RateLimiter(rate=20.0, max_rate=20.0)
+
+    start = time.monotonic()
+    for _ in range(5):
+        limiter.acquire()
+    # the first token is available right away, the others every 50 ms
+    assert time.monotonic() - start == pytest.approx(0.2, abs=0.05)
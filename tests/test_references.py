@@ -0,0 +1,194 @@
+"""Tests for `pyscihub.references`."""
+
+import io
+import json
+
+from click.testing import CliRunner
+
+from pyscihub import cli, pyscihub
+from pyscihub.references import (
+    Reference,
+    detect_format,
+    iter_bibtex,
+    iter_csl_json,
+    iter_ris,
+    read_queries,
+)
+from pyscihub.tools import Classification, QueryType
+
+from .fake_scihub import FakeSciHub
+
+BIBTEX = r"""% exported library
+@string{ejor = "European Journal of Operational Research"}
+
+@incollection{lourenco2010,
+  author    = {Louren{\c{c}}o, Helena R. and Martin, Olivier C.},
+  title     = {Iterated Local Search: Framework and
+               Applications},
+  booktitle = {Handbook of Metaheuristics},
+  doi       = {10.1007/978-1-4419-1665-5\_12},
+  year      = 2010,
+}
+@Article{vidal2013,
+  title   = "A {Hybrid} Genetic Algorithm for the {\'E}l{\`e}ve {VRP}",
+  journal = ejor # " (special issue)",
+  month   = jan,
+}
+@comment{@article{ignored, doi = {10.1000/ignored}}}
+@misc(url_only,
+  url = {https://example.org/paper.pdf}
+)
+@book{empty, author = {Nobody}}
+"""
+
+RIS = """TY  - JOUR
+AU  - Lourenço, Helena R.
+AU  - Martin, Olivier C.
+T1  - Iterated Local Search: Framework and Applications
+DO  - 10.1007/978-1-4419-1665-5_12
+ER  -
+
+TY  - JOUR
+TI  - A hybrid genetic algorithm for
+  the vehicle routing problem
+ER  -
+"""
+
+CSL = [
+    {"id": "a", "DOI": "10.1007/978-1-4419-1665-5_12", "title": "Iterated"},
+    {"id": "b", "title": "A hybrid genetic algorithm, [with] {braces}"},
+    {"id": "c", "URL": "https://example.org/paper.pdf"},
+]
+
+
+def test_bibtex():
+    """Test that fields spanning lines, macros and LaTeX are parsed."""
+    assert list(iter_bibtex(BIBTEX.splitlines(keepends=True))) == [
+        Reference(
+            "10.1007/978-1-4419-1665-5_12",
+            "Iterated Local Search: Framework and Applications",
+            None,
+        ),
+        Reference(None, "A Hybrid Genetic Algorithm for the Eleve VRP", None),
+        Reference(None, None, "https://example.org/paper.pdf"),
+        Reference(None, None, None),
+    ]
+
+
+def test_ris():
+    assert list(iter_ris(RIS.splitlines(keepends=True))) == [
+        Reference(
+            "10.1007/978-1-4419-1665-5_12",
+            "Iterated Local Search: Framework and Applications",
+        ),
+        Reference(None, "A hybrid genetic algorithm for the vehicle routing problem"),
+    ]
+
+
+def test_csl_json():
+    """Test that items are decoded from arrays split anywhere and from JSON lines."""
+    text = json.dumps(CSL, indent=2)
+    chunks = [text[i : i + 7] for i in range(0, len(text), 7)]
+    references = list(iter_csl_json(chunks))
+    assert [ref.query for ref in references] == [
+        "10.1007/978-1-4419-1665-5_12",
+        "A hybrid genetic algorithm, [with] {braces}",
+        "https://example.org/paper.pdf",
+    ]
+    lines = [json.dumps(item) + "\n" for item in CSL]
+    assert list(iter_csl_json(lines)) == references
+
+
+def test_detect_format():
+    assert detect_format("library.BIB", "") == "bibtex"
+    assert detect_format("export.ris", "") == "ris"
+    assert detect_format("items.json", "") == "csl-json"
+    assert detect_format("<stdin>", "@article{key,") == "bibtex"
+    assert detect_format("<stdin>", "TY  - JOUR") == "ris"
+    assert detect_format("<stdin>", "[") == "csl-json"
+    assert detect_format("<stdin>", "10.1000/abc") == "lines"
+    assert detect_format("queries.txt", "A title: with @ sign") == "lines"
+    assert detect_format("refs.txt", "[{") == "lines"
+    assert detect_format("<stdin>", '[{"id": "a"}]') == "csl-json"
+    assert detect_format("<stdin>", '{"id": "a"}') == "csl-json"
+    assert detect_format("<stdin>", "[]") == "csl-json"
+    assert detect_format("<stdin>", "[1] Forbes, H., Title. 2010.") == "lines"
+    assert detect_format("<stdin>", "{1} Forbes, H., Title. 2010.") == "lines"
+
+    minified = io.StringIO(json.dumps(CSL))
+    assert len(list(read_queries(minified))) == 3
+
+    text = "\nTY  - JOUR\nDO  - 10.1000/a\nER  -\n" * 2
+    assert list(read_queries(io.StringIO(text))) == [
+        Classification(QueryType.DOI, "10.1000/a")
+    ]
+    assert list(read_queries(io.StringIO(text), "lines")) == [
+        "TY  - JOUR",
+        "DO  - 10.1000/a",
+        "ER  -",
+    ]
+
+
+def test_file_cli_reads_library(tmp_path):
+    """Test that every entry of a library is downloaded once, by DOI or title."""
+    library = tmp_path / "library.bib"
+    library.write_text(BIBTEX)
+
+    with FakeSciHub() as mirror:
+        result = CliRunner().invoke(
+            cli.cli,
+            ["-o", str(tmp_path), "-m", mirror.url, "--rate", "1000"]
+            + ["--max-rate", "1000", "file", str(library)],
+        )
+        assert result.exit_code == 0
+        assert mirror.search_count == 3
+
+
+def test_numbered_references_are_read_as_lines(tmp_path):
+    """Test that a numbered reference list is not mistaken for CSL-JSON."""
+    refs = "[1] Forbes, H., A title. 2010.\n[2] Doe, A., 10.1000/doe\n"
+    assert list(read_queries(io.StringIO(refs))) == [
+        "[1] Forbes, H., A title. 2010.",
+        "[2] Doe, A., 10.1000/doe",
+    ]
+
+    path = tmp_path / "refs.txt"
+    path.write_text(refs)
+    with open(path) as f:
+        assert len(list(read_queries(f))) == 2
+
+
+def test_empty_library_warns(caplog):
+    assert list(read_queries(io.StringIO("@comment{nothing}\n"))) == []
+    assert "Found no bibtex entries" in caplog.text
+
+
+def test_titles_are_searched_whole(tmp_path, monkeypatch):
+    """Test that a title with periods is searched as a title, not cut at "U."."""
+    title = "U.S. health policy after 2010: a review"
+    library = (
+        f"@article{{us, title = {{{title}}}}}\n@article{{doi, doi = {{doi:10.1000/A}}}}"
+    )
+    queries = list(read_queries(io.StringIO(library)))
+    assert queries == [
+        Classification(QueryType.TITLE, title),
+        Classification(QueryType.DOI, "10.1000/A"),
+    ]
+
+    searched = []
+    scihub = pyscihub.SciHub("https://sci-hub.example", tmp_path)
+    monkeypatch.setattr(scihub, "_resolve", searched.append)
+    results = list(scihub.iter_download(queries))
+    assert searched == [title, "10.1000/A"]
+    assert [result["query"] for result in results] == [title, "10.1000/A"]
+    assert results[1]["key"] == "10.1000/a"
+
+
+def test_bibtex_recovers_from_unterminated_entry():
+    lines = [
+        "@article{broken, title = {No closing brace,\n",
+        "@article{next, doi = {10.1000/next}}\n",
+        "@article\n",
+        "{split, doi = {10.1000/split}}\n",
+    ]
+    assert [ref.doi for ref in iter_bibtex(lines)] == ["10.1000/next", "10.1000/split"]
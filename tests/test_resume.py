@@ -0,0 +1,96 @@
+"""Tests for `pyscihub.resume`."""
+
+import socket
+
+import pytest
+
+from pyscihub import pyscihub
+from pyscihub.manifest import Reason
+from pyscihub.resume import InvalidPdf, validate_pdf
+
+from .fake_scihub import FakeSciHub
+
+
+@pytest.mark.parametrize(
+    "body, size, valid",
+    [
+        (b"%PDF-1.4\n...\n%%EOF\n", None, True),
+        (b"%PDF-1.4\n...\n%%EOF\n", 19, True),
+        (b"%PDF-1.4\n...\n%%EOF\n", 40, False),
+        (b"%PDF-1.4\n...", None, False),
+        (b"<html>Server busy</html>\n%%EOF", None, False),
+    ],
+)
+def test_validate_pdf(tmp_path, body, size, valid):
+    path = tmp_path / "a.pdf"
+    path.write_bytes(body)
+    if valid:
+        validate_pdf(path, size)
+    else:
+        with pytest.raises(InvalidPdf):
+            validate_pdf(path, size)
+
+
+def test_interrupted_download_is_resumed(tmp_path, make_scihub, read_pdf_paths):
+    """Test that an interrupted download continues where it stopped."""
+    with FakeSciHub(pdf_size=1_000_000, broken_pdfs=1) as mirror:
+        scihub = make_scihub(mirror.url)
+        scihub.download("10.1000/resume")
+        assert mirror.pdf_count == 2
+        assert mirror.range_count == 1
+
+        (pdf,) = tmp_path.glob("*.pdf")
+        assert pdf.read_bytes() == mirror.pdf_body()
+    assert read_pdf_paths()["10.1000/resume"] == str(pdf.resolve())
+    assert list((tmp_path / ".partial").iterdir()) == []
+
+
+def test_download_is_resumed_in_next_run(tmp_path, make_scihub, read_pdf_paths):
+    """Test that a download interrupted on every attempt is resumed by the next run."""
+    with FakeSciHub(pdf_size=1_000_000, broken_pdfs=pyscihub.PDF_ATTEMPTS) as mirror:
+        make_scihub(mirror.url).download("10.1000/resume")
+        assert not (tmp_path / "pdf_paths.csv").exists()
+        assert list(tmp_path.glob("*.pdf")) == []
+
+        make_scihub(mirror.url).download("10.1000/resume")
+        assert mirror.range_count == pyscihub.PDF_ATTEMPTS
+
+        (pdf,) = tmp_path.glob("*.pdf")
+        assert pdf.read_bytes() == mirror.pdf_body()
+    assert read_pdf_paths()["10.1000/resume"]
+
+
+def test_html_page_is_not_saved(tmp_path, make_scihub, read_pdf_paths):
+    """Test that an HTML page served as PDF is retried and never recorded."""
+    with FakeSciHub(html_pdfs=pyscihub.PDF_ATTEMPTS + 1) as mirror:
+        scihub = make_scihub(mirror.url)
+        scihub.download("10.1000/html")
+        assert scihub.metrics.failures["invalid_pdf"] == pyscihub.PDF_ATTEMPTS
+        assert scihub.metrics.outcomes["invalid_pdf"] == 1
+        assert list(tmp_path.glob("*.pdf")) == []
+        assert not (tmp_path / "pdf_paths.csv").exists()
+
+        # the last HTML page is followed by the real PDF
+        scihub.download("10.1000/html")
+        assert scihub.metrics.outcomes["success"] == 1
+    assert read_pdf_paths()["10.1000/html"]
+
+
+def test_refused_pdf_host_is_backed_off(make_scihub, monkeypatch):
+    """Test that a PDF host refusing connections is recorded as a transient failure."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        pdf = f"http://127.0.0.1:{sock.getsockname()[1]}/doe.pdf"
+    scihub = make_scihub("https://sci-hub.example")
+    data = {"citation": "Doe, J. (2020). Paper.", "link": None, "pdf": pdf}
+    monkeypatch.setattr(scihub, "_resolve", lambda clean_query: data)
+
+    (result,) = scihub.iter_download(["10.1000/refused"])
+    assert result["status"] == "connection_error"
+    assert scihub.metrics.failures["connection_error"] == 1
+    ((key, reason, attempts, next_attempt),) = scihub.manifest.failures()
+    assert (key, reason, attempts) == ("10.1000/refused", Reason.CONNECTION_ERROR, 1)
+    assert next_attempt is not None
+
+    (result,) = scihub.iter_download(["10.1000/refused"])
+    assert result["status"] == "skipped"
@@ -0,0 +1,134 @@
+"""Tests for `pyscihub.server`."""
+
+import http.client
+import json
+import socket
+import threading
+
+import pytest
+
+from pyscihub import pyscihub
+from pyscihub.ratelimit import RateLimiter
+from pyscihub.server import DownloadService, make_server
+
+from .fake_scihub import FakeSciHub
+
+
+@pytest.fixture
+def mirror():
+    with FakeSciHub(latency=0.1) as mirror:
+        yield mirror
+
+
+@pytest.fixture
+def service(mirror, tmp_path):
+    scihub = pyscihub.SciHub(
+        mirror.url,
+        tmp_path,
+        rate_limiters={mirror.url: RateLimiter(rate=1000, max_rate=1000)},
+    )
+    service = DownloadService(scihub, workers=4)
+    yield service
+    service.close()
+
+
+def serve(server):
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    return server
+
+
+def request(conn, method: str, path: str, body: dict | None = None):
+    conn.request(method, path, body=None if body is None else json.dumps(body))
+    response = conn.getresponse()
+    return response.status, response.read()
+
+
+def test_duplicate_queries_are_coalesced(service, mirror):
+    """Test that variants submitted by different clients share one download."""
+    server = serve(make_server(service, port=0))
+    port = server.server_address[1]
+    jobs = []
+
+    def submit(query):
+        conn = http.client.HTTPConnection("127.0.0.1", port)
+        jobs.append(json.loads(request(conn, "POST", "/jobs", {"queries": [query]})[1]))
+
+    threads = [
+        threading.Thread(target=submit, args=(query,))
+        for query in [
+            "10.1000/same",
+            "doi:10.1000/SAME",
+            "https://doi.org/10.1000/same",
+        ]
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    paths = set()
+    for job in jobs:
+        status, body = request(conn, "GET", f"/jobs/{job['id']}?wait=5")
+        assert status == 200
+        (result,) = json.loads(body)["results"]
+        assert result["status"] == "success"
+        paths.add(result["pdf_path"])
+    assert len(paths) == 1
+    assert mirror.search_count == 1
+
+    # a later job is answered from the warm index
+    status, body = request(conn, "POST", "/jobs", {"queries": ["10.1000/SAME"]})
+    job = json.loads(body)
+    status, body = request(conn, "GET", f"/jobs/{job['id']}?wait=5")
+    assert json.loads(body)["results"][0]["status"] == "existing"
+    assert mirror.search_count == 1
+    server.shutdown()
+    server.server_close()
+
+
+def test_stream_over_unix_socket(service, tmp_path):
+    """Test that results are streamed as JSON lines over a Unix socket."""
+    socket_path = tmp_path / "pyscihub.sock"
+    server = serve(make_server(service, socket_path=socket_path))
+    job = service.submit(["10.1000/a", "10.1000/b", ""])
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(str(socket_path))
+    sock.sendall(f"GET /jobs/{job.id}/stream HTTP/1.0\r\n\r\n".encode())
+    data = b""
+    while chunk := sock.recv(65536):
+        data += chunk
+    sock.close()
+
+    head, body = data.split(b"\r\n\r\n", 1)
+    assert head.startswith(b"HTTP/1.0 200")
+    results = [json.loads(line) for line in body.splitlines()]
+    assert sorted(result["query"] for result in results) == [
+        "",
+        "10.1000/a",
+        "10.1000/b",
+    ]
+    assert {result["query"]: result["status"] for result in results}[""] == (
+        "invalid_query"
+    )
+    server.shutdown()
+    server.server_close()
+
+
+def test_invalid_requests(service):
+    server = serve(make_server(service, port=0))
+    conn = http.client.HTTPConnection("127.0.0.1", server.server_address[1])
+    assert request(conn, "POST", "/jobs", {"query": "a"})[0] == 400
+    assert request(conn, "GET", "/jobs/unknown")[0] == 404
+    status, body = request(conn, "GET", "/status")
+    assert status == 200
+    assert json.loads(body)["in_flight"] == 0
+    status, body = request(conn, "POST", "/jobs", {"queries": ["10.1000/wait"]})
+    job = json.loads(body)
+    for wait in ("nan", "inf", "soon"):
+        assert request(conn, "GET", f"/jobs/{job['id']}?wait={wait}")[0] == 400
+    assert request(conn, "GET", f"/jobs/{job['id']}?wait=-1")[0] == 200
+    server.shutdown()
+    server.server_close()
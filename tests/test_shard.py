@@ -0,0 +1,159 @@
+"""Tests for `pyscihub.shard`."""
+
+import csv
+from pathlib import Path
+
+import pytest
+from click.testing import CliRunner
+
+from pyscihub import cli
+from pyscihub.manifest import CSV_NAME, Manifest, Reason
+from pyscihub.shard import Shard, iter_shard, merge, shard_index
+
+from .fake_scihub import FakeSciHub
+
+
+def test_parse_shard():
+    assert Shard.parse("2/8") == Shard(2, 8)
+    assert Shard(2, 8).suffix == ".shard-2-of-8"
+    for value in ("0/8", "9/8", "2", "a/b"):
+        with pytest.raises(ValueError):
+            Shard.parse(value)
+
+
+def test_shards_partition_queries():
+    """Test that every query lands in exactly one shard, variants in the same one."""
+    queries = [f"10.1000/item.{i}" for i in range(200)]
+    shards = [list(iter_shard(queries, Shard(i, 4))) for i in range(1, 5)]
+
+    assert sorted(sum(shards, [])) == sorted(queries)
+    assert all(shards)
+    assert shard_index("10.1000/ABC", 4) == shard_index(" 10.1000/abc", 4)
+
+
+def test_merge(tmp_path):
+    """Test that shard folders are merged with duplicates and conflicts detected."""
+    output, node_1, node_2 = (tmp_path / name for name in ("out", "n1", "n2"))
+    for folder in (output, node_1, node_2):
+        folder.mkdir()
+
+    (node_1 / "a.pdf").write_bytes(b"%PDF a")
+    (node_2 / "b.pdf").write_bytes(b"%PDF b")
+    (node_2 / "a.pdf").write_bytes(b"%PDF a")
+    (output / "c.pdf").write_bytes(b"%PDF c")
+
+    shard_1 = Manifest.open(node_1, Shard(1, 2).suffix)
+    shard_1.record("query a", "/elsewhere/a.pdf")
+    shard_1.record("query b", "")
+    shard_1.close()
+    # a shard from an older version that only wrote a CSV
+    with open(node_2 / "pdf_paths.shard-2-of-2.csv", "w", newline="") as f:
+        csv.writer(f).writerows(
+            [
+                ["query", "pdf_path"],
+                ["query b", "/elsewhere/b.pdf"],
+                ["query a", "/elsewhere/a.pdf"],
+                ["query d", "/elsewhere/d.pdf"],
+            ]
+        )
+    existing = Manifest.open(output)
+    existing.record("query c", str(output / "c.pdf"))
+    existing.close()
+
+    stats = merge([node_1, node_2, output], output)
+    assert stats == {
+        "manifests": 2,
+        "queries": 5,
+        "copied": 2,
+        "duplicates": 1,
+        "conflicts": 0,
+        "missing": 1,
+    }
+
+    rows = list(csv.DictReader(open(output / CSV_NAME)))
+    pdf_paths = {row["query"]: row["pdf_path"] for row in rows}
+    assert pdf_paths == {
+        "query a": str((output / "a.pdf").resolve()),
+        "query b": str((output / "b.pdf").resolve()),
+        "query c": str(output / "c.pdf"),
+        "query d": "",
+    }
+    assert (output / "b.pdf").read_bytes() == b"%PDF b"
+
+
+def test_merge_never_shares_a_different_pdf(tmp_path):
+    """Test that PDFs with the same name but other content are copied aside."""
+    output, node_1, node_2 = (tmp_path / name for name in ("out", "n1", "n2"))
+    output.mkdir()
+    for folder, query, body in (
+        (node_1, "10.1000/a", b"%PDF A"),
+        (node_2, "10.1000/b", b"%PDF B"),
+    ):
+        folder.mkdir()
+        (folder / "same.pdf").write_bytes(body)
+        manifest = Manifest.open(folder)
+        manifest.record(query, str(folder / "same.pdf"))
+        manifest.close()
+
+    stats = merge([node_1, node_2], output)
+    assert stats["copied"] == 2
+    assert stats["conflicts"] == 1
+    # merging again finds the PDFs that were copied before
+    stats = merge([node_1, node_2], output)
+    assert stats["conflicts"] == 0
+    assert stats["duplicates"] == 2
+
+    rows = csv.DictReader(open(output / CSV_NAME))
+    pdf_paths = {row["query"]: Path(row["pdf_path"]) for row in rows}
+    assert pdf_paths["10.1000/a"].read_bytes() == b"%PDF A"
+    assert pdf_paths["10.1000/b"].read_bytes() == b"%PDF B"
+    assert pdf_paths["10.1000/b"].name == "same-2.pdf"
+
+
+def test_merge_keeps_failures(tmp_path):
+    """Test that the reason and backoff of failed queries survive a merge."""
+    output, node_1, node_2 = (tmp_path / name for name in ("out", "n1", "n2"))
+    for folder in (output, node_1, node_2):
+        folder.mkdir()
+
+    shard_1 = Manifest.open(node_1, Shard(1, 2).suffix)
+    shard_1.record_failure("10.1000/missing", Reason.NOT_FOUND)
+    shard_1.record_failure("10.1000/busy", Reason.CAPTCHA)
+    shard_1.record_failure("10.1000/busy", Reason.CAPTCHA)
+    expected = {key: failure for key, *failure in shard_1.failures()}
+    shard_1.close()
+    shard_2 = Manifest.open(node_2, Shard(2, 2).suffix)
+    shard_2.record_failure("10.1000/busy", Reason.HTTP_ERROR)
+    shard_2.close()
+
+    merge([node_1, node_2], output)
+    merged = Manifest.open(output)
+    assert {key: failure for key, *failure in merged.failures()} == expected
+    assert expected["10.1000/busy"][1] == 2
+    assert expected["10.1000/missing"][2] is None
+    merged.close()
+
+
+def test_sharded_cli_run_and_merge(tmp_path):
+    """Test that two shards of one file download everything once between them."""
+    queries = "".join(f"10.1000/shard.{i}\n" for i in range(12))
+
+    with FakeSciHub() as mirror:
+        for shard in ("1/2", "2/2"):
+            result = CliRunner().invoke(
+                cli.cli,
+                ["-o", str(tmp_path), "-m", mirror.url, "--rate", "1000"]
+                + ["--max-rate", "1000", "file", "--shard", shard, "-"],
+                input=queries,
+            )
+            assert result.exit_code == 0
+        assert mirror.search_count == 12
+
+    assert (tmp_path / "pdf_paths.shard-1-of-2.csv").is_file()
+    result = CliRunner().invoke(cli.cli, ["-o", str(tmp_path), "merge", str(tmp_path)])
+    assert result.exit_code == 0
+    assert "Merged 12 results from 2 manifests" in result.output
+
+    rows = list(csv.DictReader(open(tmp_path / CSV_NAME)))
+    assert len(rows) == 12
+    assert all(row["pdf_path"] for row in rows)
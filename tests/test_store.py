@@ -0,0 +1,142 @@
+"""Tests for `pyscihub.store`."""
+
+import threading
+import time
+
+import pytest
+
+from pyscihub import pyscihub
+from pyscihub.ratelimit import RateLimiter
+from pyscihub.store import PdfStore, SingleFlight
+
+from .fake_scihub import FakeSciHub
+
+
+@pytest.mark.parametrize("link", ["hardlink", "symlink"])
+def test_identical_pdfs_are_stored_once(tmp_path, link):
+    """Test that byte-identical PDFs share one stored object."""
+    store = PdfStore(tmp_path / "store", link=link)
+    output = tmp_path / "output"
+    output.mkdir()
+
+    assert store.put(output / "a.pdf", [b"%PDF-1.4", b" same"]) == 13
+    store.put(output / "b.pdf", [b"%PDF-1.4 same"])
+    store.put(output / "c.pdf", [b"%PDF-1.4 other"])
+
+    objects = list((tmp_path / "store").glob("*/*.pdf"))
+    assert len(objects) == 2
+    assert (output / "a.pdf").read_bytes() == b"%PDF-1.4 same"
+    if link == "hardlink":
+        assert (output / "a.pdf").samefile(output / "b.pdf")
+        assert (output / "a.pdf").stat().st_nlink == 3
+    else:
+        assert (output / "a.pdf").is_symlink()
+        assert (output / "a.pdf").resolve() == (output / "b.pdf").resolve()
+
+
+def test_failed_put_leaves_nothing(tmp_path):
+    store = PdfStore(tmp_path)
+
+    def chunks():
+        yield b"%PDF"
+        raise ConnectionError("connection reset")
+
+    with pytest.raises(ConnectionError):
+        store.put(tmp_path / "a.pdf", chunks())
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_put_file_moves_the_file(tmp_path):
+    """Test that a finished file is moved into the store instead of copied."""
+    store = PdfStore(tmp_path / "store")
+    part = tmp_path / "a.part"
+    part.write_bytes(b"%PDF-1.4 same")
+    inode = part.stat().st_ino
+
+    assert store.put_file(tmp_path / "a.pdf", part) == 13
+    assert not part.exists()
+    assert (tmp_path / "a.pdf").stat().st_ino == inode
+
+    part.write_bytes(b"%PDF-1.4 same")
+    store.put_file(tmp_path / "b.pdf", part)
+    assert not part.exists()
+    assert (tmp_path / "a.pdf").samefile(tmp_path / "b.pdf")
+    assert len(list((tmp_path / "store").glob("*/*.pdf"))) == 1
+
+
+def test_single_flight_shares_concurrent_calls():
+    """Test that concurrent calls for one key run once and share the result."""
+    flight = SingleFlight()
+    calls = []
+    results = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.1)
+        return "result"
+
+    threads = [
+        threading.Thread(target=lambda: results.append(flight.do("key", slow)))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert sorted(results) == [("result", False)] + [("result", True)] * 3
+    # the key is free again once the call finished
+    assert flight.do("key", lambda: "again") == ("again", False)
+
+
+def test_scihub_shares_pdf_downloads(tmp_path):
+    """Test that identical PDFs are downloaded once per URL and stored once."""
+    with FakeSciHub(latency=0.1) as mirror:
+        scihub = pyscihub.SciHub(
+            mirror.url,
+            tmp_path / "output",
+            store=PdfStore(tmp_path / "store"),
+            rate_limiters={mirror.url: RateLimiter(rate=1000, max_rate=1000)},
+        )
+        data = {
+            "citation": "Fake article",
+            "link": None,
+            "pdf": f"{mirror.url}/pdf/a.pdf",
+        }
+        paths = []
+        threads = [
+            threading.Thread(target=lambda: paths.append(scihub._save_pdf(data)))
+            for _ in range(3)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert mirror.pdf_count == 1
+
+        scihub.download(["10.1000/store.1", "10.1000/store.2"])
+
+    assert len(set(paths)) == 1
+    assert len(list((tmp_path / "output").glob("*.pdf"))) == 3
+    # every fake PDF has the same body
+    assert len(list((tmp_path / "store").glob("*/*.pdf"))) == 1
+
+
+def test_shared_download_failure_keeps_its_reason(tmp_path, monkeypatch):
+    """Test that queries waiting on a failed shared download get its reason."""
+    scihub = pyscihub.SciHub("https://sci-hub.example", tmp_path)
+    data = {"citation": "Fake article", "link": None, "pdf": "https://pdf/a.pdf"}
+    monkeypatch.setattr(scihub, "_resolve", lambda clean_query: data)
+
+    def download_pdf(data):
+        time.sleep(0.2)
+        scihub._fail(pyscihub.Reason.HTTP_ERROR)
+        return None
+
+    monkeypatch.setattr(scihub, "_download_pdf", download_pdf)
+    results = list(scihub.iter_download(["10.1000/a", "10.1000/b"], concurrency=2))
+    assert [result["status"] for result in results] == ["http_error", "http_error"]
+    assert scihub.metrics.outcomes["http_error"] == 2
+    assert scihub.metrics.failures["http_error"] == 1
+    assert len(list(scihub.manifest.failures())) == 2
@@ -0,0 +1,110 @@
+"""Tests for `pyscihub.titles`."""
+
+import gzip
+import json
+
+import pytest
+from click.testing import CliRunner
+
+from pyscihub import cli, pyscihub
+from pyscihub.ratelimit import RateLimiter
+from pyscihub.titles import TitleIndex, build_index, iter_works, normalize_title
+
+from .fake_scihub import FakeSciHub
+
+WORKS = [
+    {
+        "DOI": "10.1007/978-1-4419-1665-5_12",
+        "title": ["Iterated Local Search: Framework and Applications"],
+    },
+    {
+        "DOI": "10.1016/j.cor.2016.09.025",
+        "title": "A <i>hybrid</i> genetic algorithm for the vehicle routing problem",
+    },
+    {"DOI": "10.1000/other", "title": ["Pathology of sport-related sudden death"]},
+    {"DOI": "10.1000/no-title", "title": []},
+    {"title": "No DOI"},
+]
+
+
+@pytest.fixture
+def index(tmp_path):
+    with gzip.open(tmp_path / "dump.jsonl.gz", "wt") as f:
+        f.writelines(json.dumps(work) + "\n" for work in WORKS)
+    with gzip.open(tmp_path / "dump.jsonl.gz", "rt") as f:
+        # a tiny chunk size merges several sorted runs
+        assert build_index(iter_works(f), tmp_path / "index", chunk_size=16) == 3
+    index = TitleIndex(tmp_path / "index")
+    yield index
+    index.close()
+
+
+def test_normalize_title():
+    assert normalize_title("  A <i>Café</i>-Study:  of X_Y ") == "a cafe study of x y"
+
+
+def test_lookup(index):
+    """Test that exact and slightly different titles resolve to their DOI."""
+    assert len(index) == 3
+    match = index.lookup("Iterated local search: framework and applications.")
+    assert match.doi == "10.1007/978-1-4419-1665-5_12"
+    assert match.score == 1.0
+
+    match = index.lookup("A hybrid genetic algorithm for the vehicle-routing problems")
+    assert match.doi == "10.1016/j.cor.2016.09.025"
+    assert 0.8 <= match.score < 1.0
+
+    assert index.lookup("Iterated local search") is None
+    assert index.lookup("") is None
+
+
+def test_threshold(index):
+    loose = TitleIndex(index.path, threshold=0.3)
+    assert loose.lookup("Iterated local search").doi == "10.1007/978-1-4419-1665-5_12"
+    loose.close()
+    with pytest.raises(ValueError):
+        TitleIndex(index.path, threshold=0)
+    with pytest.raises(ValueError):
+        TitleIndex(index.path.parent)
+
+
+def test_titles_are_searched_by_doi(index, tmp_path):
+    """Test that a title query found in the index is searched by its DOI."""
+    with FakeSciHub() as mirror:
+        scihub = pyscihub.SciHub(
+            mirror.url,
+            tmp_path / "output",
+            titles=index,
+            rate_limiters={mirror.url: RateLimiter(rate=1000, max_rate=1000)},
+        )
+        (result,) = scihub.iter_download(
+            ["Lourenço, H.R., Iterated local search: Framework and applications"]
+        )
+    assert result["status"] == "success"
+    assert result["data"]["link"] == "https://doi.org/10.1007/978-1-4419-1665-5_12"
+    assert scihub.metrics.phases["title_lookup"].count == 1
+
+
+def test_titles_cli(tmp_path):
+    with open(tmp_path / "dump.jsonl", "w") as f:
+        f.writelines(json.dumps(work) + "\n" for work in WORKS)
+
+    runner = CliRunner()
+    result = runner.invoke(
+        cli.cli, ["-o", str(tmp_path), "titles", "index", str(tmp_path / "dump.jsonl")]
+    )
+    assert result.exit_code == 0
+    assert "Indexed 3 titles" in result.output
+    assert (tmp_path / "title_index" / "meta.json").is_file()
+
+    result = runner.invoke(
+        cli.cli,
+        [
+            "-o",
+            str(tmp_path),
+            "titles",
+            "lookup",
+            "Pathology of sport related sudden death",
+        ],
+    )
+    assert result.output.startswith("10.1000/other\t1.000")
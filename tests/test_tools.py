@@ -0,0 +1,116 @@
+"""Tests for `pyscihub.tools`."""
+
+import pytest
+
+from pyscihub import tools
+
+
+def test_atomic_write(tmp_path):
+    """Test that chunks end up in the target file and no temporary file is left."""
+    target = tmp_path / "paper.pdf"
+
+    n_bytes = tools.atomic_write(target, iter([b"%PDF-1.4\n", b"", b"body\n"]))
+    assert n_bytes == 14
+    assert target.read_bytes() == b"%PDF-1.4\nbody\n"
+    assert [p.name for p in tmp_path.iterdir()] == ["paper.pdf"]
+
+
+def test_atomic_write_failure_leaves_no_file(tmp_path):
+    """Test that an interrupted body does not leave a truncated file behind."""
+    target = tmp_path / "paper.pdf"
+
+    def broken_body():
+        yield b"%PDF-1.4\n"
+        raise ConnectionError("connection reset")
+
+    with pytest.raises(ConnectionError):
+        tools.atomic_write(target, broken_body())
+    assert list(tmp_path.iterdir()) == []
+
+
+CLASSIFY_LINES = [
+    (
+        "Cruz, F. (2017). A heuristic algorithm. doi:10.1016/j.cor.2016.09.025",
+        tools.Classification(tools.QueryType.DOI, "10.1016/j.cor.2016.09.025"),
+    ),
+    (
+        "https://www.sciencedirect.com/science/article/abs/pii/S0305054816302489",
+        tools.Classification(
+            tools.QueryType.URL,
+            "https://www.sciencedirect.com/science/article/abs/pii/S0305054816302489",
+        ),
+    ),
+    (
+        "Fornes, P. and D. Lecomte, Pathology of sport-related sudden death. [French].",
+        tools.Classification(
+            tools.QueryType.TITLE, "Pathology of sport-related sudden death."
+        ),
+    ),
+    ("", tools.Classification(tools.QueryType.INVALID, None)),
+]
+
+
+@pytest.mark.parametrize("line, classification", CLASSIFY_LINES)
+def test_classify(line, classification):
+    """Test that lines are classified and agree with extract_valid_query."""
+    assert tools.QueryClassifier().classify(line) == classification
+    assert tools.extract_valid_query(line) == classification.query
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_classify_many(processes):
+    """Test that batch classification keeps the order of the input lines."""
+    lines = [line for line, _ in CLASSIFY_LINES] * 5
+    expected = [classification for _, classification in CLASSIFY_LINES] * 5
+
+    classifier = tools.QueryClassifier()
+    result = classifier.classify_many(iter(lines), processes=processes, chunksize=3)
+    assert list(result) == expected
+
+
+def test_iter_queries():
+    """Test that lines are stripped, blank lines skipped and duplicates dropped."""
+    lines = iter(["a\n", "  \n", "b\n", "a\n", "c\n", "b", "a\n"])
+
+    assert list(tools.iter_queries(lines, dedupe_size=2)) == ["a", "b", "c", "b", "a"]
+
+
+@pytest.mark.parametrize(
+    "line, key",
+    [
+        ("10.1016/J.COR.2016.09.025", "10.1016/j.cor.2016.09.025"),
+        ("doi:10.1016/j.cor.2016.09.025", "10.1016/j.cor.2016.09.025"),
+        ("https://doi.org/10.1016/j.cor.2016.09.025", "10.1016/j.cor.2016.09.025"),
+        (
+            "Raviv, T., et al., Static repositioning. Computers & Operations "
+            "Research, 2017. https://doi.org/10.1016/j.cor.2016.09.025.",
+            "10.1016/j.cor.2016.09.025",
+        ),
+        ("http://WWW.Example.com:80/article/1/#top", "https://example.com/article/1"),
+        ("www.example.com/article/1?v=2", "https://example.com/article/1?v=2"),
+        ("not a query ", "not a query"),
+        ("  ", ""),
+    ],
+)
+def test_canonical_key(line, key):
+    """Test that DOI and URL variants share one canonical key."""
+    assert tools.canonical_key(line) == key
+
+
+def test_title_keys_use_the_whole_line():
+    """Test that references differing after their first period get their own key."""
+    numbered = [
+        "1. Smith, J., Graph search. Nature, 2001.",
+        "1. Doe, A., Protein folding. Cell, 1999.",
+    ]
+    assert tools.canonical_key(numbered[0]) != tools.canonical_key(numbered[1])
+    assert tools.canonical_key("U.S. health policy after 2010: a review") == (
+        "u s health policy after 2010 a review"
+    )
+    assert tools.canonical_key("U.S. trade policy") != tools.canonical_key(
+        "U.S. health policy after 2010: a review"
+    )
+    # case, spacing and punctuation variants still share a key
+    assert tools.canonical_key("Iterated  local search: Framework.") == (
+        tools.canonical_key("iterated local search framework")
+    )
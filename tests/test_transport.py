@@ -0,0 +1,75 @@
+"""Tests for `pyscihub.transport`."""
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import socket
+
+import pytest
+import requests
+
+from pyscihub.transport import Transport
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """Answers every other request with a 503."""
+
+    protocol_version = "HTTP/1.1"
+    calls = 0
+
+    def do_GET(self):
+        self.do_POST()
+
+    def do_POST(self):
+        type(self).calls += 1
+        status = 503 if type(self).calls % 2 == 1 else 200
+        body = b"ok"
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def flaky_server():
+    FlakyHandler.calls = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FlakyHandler)
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_connection_reuse(flaky_server):
+    """Test that keep-alive connections are reused and 5xx responses returned."""
+    transport = Transport(retries=2, backoff_factor=0, backoff_jitter=0)
+
+    statuses = [transport.get(f"{flaky_server}/paper.pdf").status_code for _ in "abc"]
+    statuses.append(transport.post(flaky_server).status_code)
+    assert statuses == [503, 200, 503, 200]
+
+    stats = transport.stats()
+    assert stats["requests"] == 4
+    assert stats["connections_opened"] == 1
+    assert stats["connections_reused"] == 3
+    transport.close()
+
+
+def test_only_connection_errors_of_gets_are_retried():
+    """Test that a refused GET is retried, but a refused search POST is not."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        url = f"http://127.0.0.1:{sock.getsockname()[1]}"
+    transport = Transport(retries=2, backoff_factor=0, backoff_jitter=0)
+
+    with pytest.raises(requests.ConnectionError):
+        transport.get(url)
+    assert transport.stats()["requests"] == 3
+    with pytest.raises(requests.ConnectionError):
+        transport.post(url)
+    assert transport.stats()["requests"] == 4
+    transport.close()